@@ -1,16 +1,48 @@
+import time
+
+START_TIME = time.perf_counter()  # --startup-profile measures from here
+
 import sys
+
+if __name__ == "__main__":
+    # a second launch hands its command to the running instance before Qt is even loaded
+    from annotator.instance import forward_to_instance
+    status = forward_to_instance('advanced_version', sys.argv)
+    if status is not None:
+        sys.exit(status)
+
 import os
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
-    QSlider, QToolButton, QColorDialog, QInputDialog, QGraphicsView,
-    QGraphicsScene, QGroupBox, QMessageBox, QFrame, QFileDialog
+    QSlider, QToolButton, QColorDialog, QInputDialog, QGroupBox,
+    QMessageBox, QFrame, QFileDialog
 )
-from PyQt6.QtCore import Qt, QPointF, QRectF, QSizeF
+from PyQt6.QtCore import Qt, QPointF, QRectF, QSizeF, QThreadPool, QTimer, QT_VERSION_STR
 from PyQt6.QtGui import (
     QPen, QPainterPath, QColor, QFont, QPalette, QGuiApplication, QIcon,
-    QBrush, QPainter, QPixmap, QBrush
+    QBrush, QPainter
 )
-from PyQt6.QtWidgets import QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsItem, QStyleOptionGraphicsItem
+from PyQt6.QtWidgets import QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsItem, QGraphicsTextItem, QStyleOptionGraphicsItem
+
+from annotator.startup import DeferredStartup, StartupProfile, lazy_import, load
+
+# numpy is first needed by the first annotation, not by the first frame
+lazy_import('numpy')
+
+from annotator.baking import BakedLayer
+from annotator.codec import ItemFactory
+from annotator.eraser import EraseGesture
+from annotator.instance import CommandError, ControlServer, server_name
+from annotator.history import (
+    AddCommand, ClearCommand, MoveCommand, RemoveCommand, ReplaceCommand, ResizeCommand, RestyleCommand, UndoHistory,
+    capture_geometry, capture_style, apply_style
+)
+from annotator.metrics import METRICS_FILTER, metrics
+from annotator.pointer import InputCoalescer
+from annotator.screens import ScreenDocument, ScreenOverlay
+from annotator.settings import OverlaySettings, parse_settings
+from annotator.strokes import StrokeItem
+from annotator.view import OverlayGraphicsView
 
 # ---------- Custom Graphics Items with Handles ----------
 HANDLE_SIZE = 8.0
@@ -23,7 +55,6 @@ class ResizeHandle(QGraphicsRectItem):
         self.setBrush(QBrush(QColor(255, 255, 255)))
         self.setPen(QPen(QColor(0,0,0)))
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable, True)
-        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges, True)
         self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIgnoresTransformations, True)
         self.role = role
         self.parentShape = parentShape
@@ -31,12 +62,10 @@ class ResizeHandle(QGraphicsRectItem):
         # easier to pick with larger area
         self.setZValue(1000)
 
-    def itemChange(self, change, value):
-        if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange:
-            new_scene_pos = self.mapToScene(value)
-            self.parentShape.handle_moved(self.role, new_scene_pos)
-            return self.pos()
-        return super().itemChange(change, value)
+    def mouseMoveEvent(self, event):
+        # resize the parent instead of letting QGraphicsItem drag the whole selection
+        self.parentShape.handle_moved(self.role, event.scenePos())
+        event.accept()
 
 
 class AnnotShape:
@@ -48,7 +77,7 @@ class RectShape(QGraphicsRectItem):
     def __init__(self, rect: QRectF, pen: QPen):
         super().__init__(rect)
         self.setPen(pen)
-        self.setBrush(Qt.BrushStyle.NoBrush)
+        self.setBrush(QBrush(Qt.BrushStyle.NoBrush))
         self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable | QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
         self.handles = {}
         self.create_handles()
@@ -73,7 +102,6 @@ class RectShape(QGraphicsRectItem):
     def handle_moved(self, role, scene_pos):
         # calculate new rect in scene coordinates and update shape
         parent = self
-        s = parent.scene()
         # map scene_pos to parent's local coordinates
         local = parent.mapFromScene(scene_pos)
         r = QRectF(parent.rect())
@@ -89,12 +117,14 @@ class RectShape(QGraphicsRectItem):
         r = r.normalized()
         parent.prepareGeometryChange()
         parent.setRect(r)
-        # reposition handles
-        rect = parent.rect()
-        parent.handles['tl'].setPos(rect.topLeft())
-        parent.handles['tr'].setPos(rect.topRight())
-        parent.handles['bl'].setPos(rect.bottomLeft())
-        parent.handles['br'].setPos(rect.bottomRight())
+        parent.update_handles()
+
+    def update_handles(self):
+        rect = self.rect()
+        self.handles['tl'].setPos(rect.topLeft())
+        self.handles['tr'].setPos(rect.topRight())
+        self.handles['bl'].setPos(rect.bottomLeft())
+        self.handles['br'].setPos(rect.bottomRight())
 
     def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget):
         super().paint(painter, option, widget)
@@ -106,7 +136,7 @@ class EllipseShape(QGraphicsEllipseItem):
     def __init__(self, rect: QRectF, pen: QPen):
         super().__init__(rect)
         self.setPen(pen)
-        self.setBrush(Qt.BrushStyle.NoBrush)
+        self.setBrush(QBrush(Qt.BrushStyle.NoBrush))
         self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable | QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
         self.handles = {}
         self.create_handles()
@@ -139,6 +169,9 @@ class EllipseShape(QGraphicsEllipseItem):
         r = r.normalized()
         self.prepareGeometryChange()
         self.setRect(r)
+        self.update_handles()
+
+    def update_handles(self):
         rect = self.rect()
         self.handles['tl'].setPos(rect.topLeft())
         self.handles['tr'].setPos(rect.topRight())
@@ -180,7 +213,9 @@ class LineShape(QGraphicsLineItem):
             ln.setP2(local)
         self.prepareGeometryChange()
         self.setLine(ln)
-        # reposition handles
+        self.update_handles()
+
+    def update_handles(self):
         self.handles['start'].setPos(self.line().p1())
         self.handles['end'].setPos(self.line().p2())
 
@@ -212,8 +247,25 @@ class LineShape(QGraphicsLineItem):
         self.set_handles_visible(self.isSelected())
 
 
+class ShapeFactory(ItemFactory):
+    """Rebuilds annotations spilled out of the undo history as editable shapes."""
+    def rect(self, rect, pen):
+        return RectShape(rect, pen)
+
+    def ellipse(self, rect, pen):
+        return EllipseShape(rect, pen)
+
+    def line(self, line, pen, arrow):
+        return LineShape(line, pen, arrow=arrow)
+
+    def text(self, text, font, color):
+        item = super().text(text, font, color)
+        item.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable | QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
+        return item
+
+
 # ---------- Main Application ----------
-class CustomGraphicsView(QGraphicsView):
+class CustomGraphicsView(OverlayGraphicsView):
     def __init__(self, parent, overlay_instance):
         super().__init__(parent)
         self.overlay_instance = overlay_instance
@@ -221,21 +273,42 @@ class CustomGraphicsView(QGraphicsView):
         self.setFrameStyle(QFrame.Shape.NoFrame)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.FullViewportUpdate)
 
+    # the select tool uses QGraphicsView's own selection, move and handle dragging
     def mousePressEvent(self, event):
-        self.overlay_instance.mousePressEvent(event)
+        metrics.input_received()
+        with metrics.timing('input.press'):
+            self.overlay_instance.activate_view(self)
+            if self.overlay_instance.current_tool == 'select':
+                # baked shapes are hidden from QGraphicsView; bring the one under the cursor back first
+                pos = self.mapToScene(event.position().toPoint())
+                self.overlay_instance.drawings.wake(self.overlay_instance.drawings.items_in(QRectF(pos, QSizeF(1, 1))))
+                super().mousePressEvent(event)
+            self.overlay_instance.mousePressEvent(event)
 
     def mouseMoveEvent(self, event):
-        self.overlay_instance.mouseMoveEvent(event)
+        # hover moves draw nothing, so they start no input-to-paint measurement
+        if event.buttons() != Qt.MouseButton.NoButton:
+            metrics.input_received()
+        with metrics.timing('input.move'):
+            if self.overlay_instance.current_tool == 'select':
+                super().mouseMoveEvent(event)
+            self.overlay_instance.mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        self.overlay_instance.mouseReleaseEvent(event)
+        metrics.input_received()
+        with metrics.timing('input.release'):
+            if self.overlay_instance.current_tool == 'select':
+                super().mouseReleaseEvent(event)
+            self.overlay_instance.mouseReleaseEvent(event)
 
 
 class ProfessionalScreenOverlay:
-    def __init__(self):
-        self.app = QApplication(sys.argv)
+    def __init__(self, settings=None, qt_args=None):
+        self.settings = settings or OverlaySettings()
+        imported = time.perf_counter()
+        # Qt only sees the arguments parse_settings() left over, never the overlay's own options
+        self.app = QApplication(qt_args if qt_args is not None else sys.argv[:1])
         self.app.setStyle('Fusion')
 
         # Dark theme palette
@@ -273,37 +346,147 @@ class ProfessionalScreenOverlay:
 
         self.setup_professional_ui()
 
-        # Create overlay (fullscreen transparent widget)
-        self.overlay = QWidget()
-        self.overlay.setWindowFlags(Qt.WindowType.WindowStaysOnTopHint | Qt.WindowType.FramelessWindowHint)
-        self.overlay.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
-        self.overlay.setGeometry(QGuiApplication.primaryScreen().geometry())
-        overlay_layout = QVBoxLayout(self.overlay)
-        overlay_layout.setContentsMargins(0, 0, 0, 0)
-        self.view = CustomGraphicsView(None, self)
-        self.view.setScene(QGraphicsScene())
-        self.scene = self.view.scene()
-        screen_rect = self.overlay.geometry()
-        self.scene.setSceneRect(0, 0, screen_rect.width(), screen_rect.height())
-        overlay_layout.addWidget(self.view)
-        self.overlay.hide()
+        # Bind keyboard shortcuts
+        self.control_window.keyPressEvent = self.key_press_event
+
+        # later launches send their commands here instead of starting another overlay
+        self.control_server = None
+        if self.settings.single_instance and not self.settings.replay_input:
+            self.control_server = ControlServer(server_name('advanced_version'), self.run_command)
+            if not self.control_server.listen():
+                print("Another instance is already running; this one takes no commands", file=sys.stderr)
+                self.control_server = None
+
+        self.startup_profile = None
+        if self.settings.startup_profile:
+            self.startup_profile = StartupProfile(START_TIME, self.control_window)
+            self.startup_profile.mark('imports', imported)
+            self.startup_profile.mark('control window')
+
+        # the overlays and everything behind them are built once the control window is on screen
+        self.started = False
+        self.recorder = None
+        self.replayer = None
+        if self.settings.fast_start:
+            self.deferred_startup = DeferredStartup(self.app, self.control_window, self.finish_startup)
+        else:
+            self.finish_startup()
+
+    def finish_startup(self):
+        if self.startup_profile is not None and self.settings.fast_start:
+            # this runs right after the control window's first frame
+            self.startup_profile.first_frame()
+        # load numpy now rather than in the middle of the first stroke
+        load('numpy')
+
+        # input is recorded to, or replayed from, a trace file
+        try:
+            if self.settings.replay_input or self.settings.record_input:
+                from annotator.recording import InputRecorder, InputReplayer
+            if self.settings.replay_input:
+                self.replayer = InputReplayer(self.settings.replay_input, self.settings.replay_speed)
+            if self.settings.record_input:
+                self.recorder = InputRecorder(self.settings.record_input)
+                self.recorder.watch_buttons(self.control_window,
+                                            [*self.tool_buttons.values(), self.overlay_btn, self.color_button])
+        except (OSError, ValueError) as e:  # TraceError is a ValueError
+            sys.exit(f"Input trace: {e}")
+
+        # One fullscreen transparent overlay per screen, all showing one document of committed shapes
+        self.tool_cursor = None
+        self.overlay_opacity = 1.0
+        self.drawings = ScreenDocument(self.create_screen_overlay)
+        for screen in QGuiApplication.screens():
+            self.drawings.add_screen(screen)
+        self.drawings.watch(self.app)
+        self.app.screenRemoved.connect(self.screen_removed)
+        self.activate_view(self.drawings.add_screen(QGuiApplication.primaryScreen()).view)
 
         # drawing variables
         self.drawing = False
         self.start_pos = None
-        self.current_path = None
         self.current_item = None
-        self.drawings = []  # list of QGraphicsItem (shapes)
-        self.undo_stack = []
-        self.redo_stack = []
+        self.history = UndoHistory(self.drawings, self.settings.history_budget_bytes, ShapeFactory())
+        self.journal = None
+        # a shared session's document is rebuilt from the relay, not from a journal
+        if self.settings.journal and self.replayer is None and not self.settings.sync:
+            self.start_journal()
+        self.sync = None
+        if self.settings.sync:
+            self.start_sync()
+        self.erase_gesture = None  # the eraser drag in progress
+        self.export_job = None  # the export running on the thread pool
+        self.export_started = 0.0  # perf_counter() when export_job was started
+        self.transform_kind = None  # MoveCommand/ResizeCommand while the select tool drags
+        self.transform_before = {}
+        # drag samples are applied to the scene once per frame
+        self.input_coalescer = InputCoalescer(self.apply_move_samples, self.settings.max_fps)
+
+        # live timings in a corner of the overlay
+        self.hud_timer = QTimer()
+        self.hud_timer.setInterval(500)
+        self.hud_timer.timeout.connect(self.update_hud)
+        if self.settings.hud:
+            self.hud_timer.start()
+        self.profile_capture = None  # created by the first Ctrl+Shift+P
+        self.window_title = self.control_window.windowTitle()
+
+        if self.recorder is not None:
+            # a replay starts from the state the recording started in
+            self.recorder.tool(self.current_tool)
+            self.recorder.color(self.current_color)
+            self.recorder.size(self.brush_size)
+            self.recorder.overlay(self.overlay_active)
+
+        if self.replayer is not None:
+            self.replayer.finished.connect(self.replay_finished)
+            self.replayer.start(self)
+
+        # initial message, without holding up the app
+        if self.settings.welcome and self.replayer is None:
+            self.welcome = QMessageBox(QMessageBox.Icon.Information, "Professional Screen Annotator",
+                                       "Welcome!\n\nHotkeys: P=Pen, R=Rect, O=Ellipse, C=Circle, L=Line, A=Arrow, S=Select, E=Eraser, T=Text\nF1 Toggle overlay, F2 Clear, Del Delete selection, Ctrl+Z Undo, Ctrl+Y Redo, Ctrl+S Save, Ctrl+O Open\nF3 Timings HUD, F4 Save metrics, Ctrl+Shift+P Start/stop profiling",
+                                       QMessageBox.StandardButton.Ok, self.control_window)
+            self.welcome.setWindowModality(Qt.WindowModality.NonModal)
+            self.welcome.show()
+
+        self.started = True
+        if self.startup_profile is not None:
+            self.startup_profile.mark('ready')
+
+        if self.settings.command:
+            try:
+                self.run_command(list(self.settings.command))
+            except CommandError as e:
+                print(e, file=sys.stderr)
+
+    def create_screen_overlay(self, screen):
+        view = CustomGraphicsView(None, self)
+        view.set_repaint_mode(self.settings.repaint_mode)
+        if self.tool_cursor is not None:
+            view.setCursor(self.tool_cursor)
+        layer = None
+        if self.settings.baked_layer:
+            layer = BakedLayer(QRectF(screen.geometry()), self.settings.tile_size, self.settings.max_tiles)
+        overlay = ScreenOverlay(screen, view, layer)
+        overlay.widget.keyPressEvent = self.key_press_event
+        if self.recorder is not None:
+            self.recorder.watch(view)
+        overlay.widget.setWindowOpacity(self.overlay_opacity)
+        if self.overlay_active:
+            overlay.show()
+        return overlay
 
-        # Bind keyboard shortcuts
-        self.control_window.keyPressEvent = self.key_press_event
-        self.overlay.keyPressEvent = self.key_press_event
+    def activate_view(self, view):
+        # a press picks the screen whose scene the gesture is drawn in
+        self.view = view
+        self.scene = view.scene()
 
-        # initial message
-        QMessageBox.information(self.control_window, "Professional Screen Annotator",
-                                "Welcome!\n\nHotkeys: P=Pen, R=Rect, O=Ellipse, C=Circle, L=Line, A=Arrow, S=Select, E=Eraser, T=Text\nF1 Toggle overlay, F2 Clear, Del Delete selection, Ctrl+Z Undo, Ctrl+Y Redo")
+    def screen_removed(self, screen):
+        if all(overlay.scene is not self.scene for overlay in self.drawings.overlays.values()):
+            self.drawing = False
+            self.current_item = None
+            self.activate_view(next(iter(self.drawings.overlays.values())).view)
 
     def load_icons(self):
         icon_files = {
@@ -312,10 +495,11 @@ class ProfessionalScreenOverlay:
             'line': 'line.png', 'arrow': 'arrow.png', 'select': 'move.png', 'export': 'export.png'
         }
         icons_dir = os.path.join(os.path.dirname(__file__), 'icons')
+        # one directory listing instead of a stat per icon; QIcon decodes the file when first painted
+        available = set(os.listdir(icons_dir)) if os.path.isdir(icons_dir) else set()
         for tool, filename in icon_files.items():
-            icon_path = os.path.join(icons_dir, filename)
-            if os.path.exists(icon_path):
-                self.icons[tool] = QIcon(icon_path)
+            if filename in available:
+                self.icons[tool] = QIcon(os.path.join(icons_dir, filename))
             else:
                 self.icons[tool] = QIcon()
 
@@ -404,7 +588,10 @@ class ProfessionalScreenOverlay:
         self.redo_btn = QPushButton("Redo"); self.redo_btn.setIcon(self.icons.get('redo')); self.redo_btn.clicked.connect(self.redo); self.redo_btn.setEnabled(False)
         self.delete_btn = QPushButton("Delete"); self.delete_btn.setIcon(self.icons.get('delete')); self.delete_btn.clicked.connect(self.delete_selected)
         self.export_btn = QPushButton("Export"); self.export_btn.setIcon(self.icons.get('export')); self.export_btn.clicked.connect(self.export_image)
+        self.save_btn = QPushButton("Save"); self.save_btn.clicked.connect(self.save_session)
+        self.open_btn = QPushButton("Open"); self.open_btn.clicked.connect(self.open_session)
         action_row.addWidget(self.undo_btn); action_row.addWidget(self.redo_btn); action_row.addWidget(self.delete_btn); action_row.addWidget(self.export_btn)
+        action_row.addWidget(self.save_btn); action_row.addWidget(self.open_btn)
 
         right_section.addLayout(action_row)
 
@@ -420,6 +607,8 @@ class ProfessionalScreenOverlay:
                 btn.setStyleSheet("")
                 btn.setChecked(False)
         self.current_tool = tool
+        if self.recorder is not None:
+            self.recorder.tool(tool)
         cursors = {
             'pen': Qt.CursorShape.CrossCursor,
             'rectangle': Qt.CursorShape.CrossCursor,
@@ -431,20 +620,64 @@ class ProfessionalScreenOverlay:
             'arrow': Qt.CursorShape.CrossCursor,
             'select': Qt.CursorShape.ArrowCursor
         }
-        self.view.setCursor(cursors.get(tool, Qt.CursorShape.CrossCursor))
+        self.tool_cursor = cursors.get(tool, Qt.CursorShape.CrossCursor)
+        for overlay in self.drawings.overlays.values():
+            overlay.view.setCursor(self.tool_cursor)
 
     def choose_color(self):
         color = QColorDialog.getColor(self.current_color, self.control_window, "Choose Color")
         if color.isValid():
-            self.current_color = color
-            self.color_button.setStyleSheet(f"background-color: {color.name()};")
+            self.set_color(color)
+
+    def set_color(self, color):
+        self.current_color = color
+        self.color_button.setStyleSheet(f"background-color: {color.name()};")
+        if self.recorder is not None:
+            self.recorder.color(color)
+        self.restyle_selected(color=color)
 
     def update_size(self, v):
         self.brush_size = v
         self.size_label.setText(str(v))
+        if self.recorder is not None:
+            self.recorder.size(v)
+        self.restyle_selected(size=v)
+
+    def ask(self, dialog, default):
+        """Run a dialog and return its answer; a replay answers with the recorded one instead."""
+        answer = self.replayer.answer(default) if self.replayer is not None else dialog()
+        if self.recorder is not None:
+            self.recorder.answer(answer)
+        return answer
+
+    def restyle_selected(self, color=None, size=None):
+        # with the select tool, colour and size changes apply to the selection
+        if self.current_tool != 'select':
+            return
+        changes = []
+        for it in self.drawings.selected_items():
+            before = capture_style(it)
+            if isinstance(it, QGraphicsTextItem):
+                font = QFont(before[1])
+                if size is not None:
+                    font.setPointSize(max(8, size * 2))
+                after = (QColor(color) if color is not None else before[0], font)
+            else:
+                after = QPen(before)
+                if color is not None:
+                    after.setColor(color)
+                if size is not None:
+                    after.setWidthF(max(1, size))
+            apply_style(it, after)
+            self.drawings.changed(it)
+            changes.append((it, before, after))
+        if changes:
+            self.save_state(RestyleCommand(changes, merge_key='size' if size is not None else None))
 
     def update_opacity(self, v):
-        self.overlay.setWindowOpacity(v / 100.0)
+        self.overlay_opacity = v / 100.0
+        for overlay in self.drawings.overlays.values():
+            overlay.widget.setWindowOpacity(self.overlay_opacity)
 
     def toggle_overlay(self):
         if self.overlay_active:
@@ -453,15 +686,20 @@ class ProfessionalScreenOverlay:
             self.show_overlay()
 
     def show_overlay(self):
-        self.overlay.showFullScreen()
-        self.overlay.raise_()
+        for overlay in self.drawings.overlays.values():
+            overlay.show()
         self.overlay_active = True
+        if self.recorder is not None:
+            self.recorder.overlay(True)
         self.overlay_btn.setText("Hide Drawing")
         self.overlay_btn.setStyleSheet("background-color:#e67e22;color:white")
 
     def hide_overlay(self):
-        self.overlay.hide()
+        for overlay in self.drawings.overlays.values():
+            overlay.hide()
         self.overlay_active = False
+        if self.recorder is not None:
+            self.recorder.overlay(False)
         self.overlay_btn.setText("Start Drawing")
         self.overlay_btn.setStyleSheet("background-color:#27ae60;color:white")
 
@@ -475,13 +713,11 @@ class ProfessionalScreenOverlay:
         pen = QPen(self.current_color, max(1, self.brush_size), Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
 
         if self.current_tool == 'pen':
-            self.current_path = QPainterPath()
-            self.current_path.moveTo(pos)
-            self.current_item = QGraphicsPathItem(self.current_path)
-            self.current_item.setPen(pen)
+            self.current_item = StrokeItem(pen, pos)
+            self.drawings.assign_id(self.current_item)
             self.scene.addItem(self.current_item)
-            self.drawings.append(self.current_item)
-            self.save_state()
+            if self.sync is not None:
+                self.sync.begin_stroke(self.current_item)
             self.drawing = True
 
         elif self.current_tool in ('rectangle', 'circle', 'ellipse'):
@@ -494,6 +730,7 @@ class ProfessionalScreenOverlay:
             else:
                 item = EllipseShape(rect, pen)
             self.current_item = item
+            self.drawings.assign_id(item)
             self.scene.addItem(item)
 
         elif self.current_tool in ('line', 'arrow'):
@@ -506,78 +743,65 @@ class ProfessionalScreenOverlay:
             else:
                 item = LineShape(line.line(), pen, arrow=False)
             self.current_item = item
+            self.drawings.assign_id(item)
             self.scene.addItem(item)
 
         elif self.current_tool == 'text':
-            text, ok = QInputDialog.getText(self.control_window, "Add Text", "Enter text:")
+            text, ok = self.ask(lambda: QInputDialog.getText(self.control_window, "Add Text", "Enter text:"),
+                                ('', False))
             if ok and text:
                 text_item = self.scene.addText(text, QFont('Arial', max(8, self.brush_size * 2)))
                 text_item.setDefaultTextColor(self.current_color)
                 text_item.setPos(pos)
                 text_item.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable | QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
-                self.drawings.append(text_item)
-                self.save_state()
+                self.drawings.attach(text_item)
+                self.save_state(AddCommand([text_item]))
 
         elif self.current_tool == 'select':
-            # default QGraphics handles selection; nothing special here
-            pass
+            # QGraphicsView has already handled selection; remember where the
+            # dragged shapes started so the move/resize can be undone
+            grabber = self.scene.mouseGrabberItem()
+            if isinstance(grabber, ResizeHandle):
+                self.transform_kind = ResizeCommand
+                targets = [grabber.parentShape]
+            else:
+                self.transform_kind = MoveCommand
+                targets = [it for it in self.scene.selectedItems() if it in self.drawings]
+            self.transform_before = {it: capture_geometry(it) for it in targets}
+            self.drawing = True
 
         elif self.current_tool == 'eraser':
-            # remove items at point (skip handles)
-            self.save_state()
-            items = self.scene.items(QRectF(pos.x()-self.brush_size, pos.y()-self.brush_size, self.brush_size*2, self.brush_size*2))
-            for it in items:
-                # skip handles
-                if isinstance(it, ResizeHandle):
-                    continue
-                # avoid removing control window etc.
-                try:
-                    self.scene.removeItem(it)
-                    if it in self.drawings:
-                        self.drawings.remove(it)
-                except Exception:
-                    pass
+            self.erase_gesture = EraseGesture(self.drawings)
+            self.erase_at(pos)
+            self.drawing = True
 
     def mouseMoveEvent(self, event):
+        if not self.overlay_active or not self.drawing or self.current_tool == 'select':
+            return
+        self.input_coalescer.push(self.view.mapToScene(event.position().toPoint()))
+
+    def apply_move_samples(self, positions):
         if not self.overlay_active or not self.drawing:
             return
-        pos = self.view.mapToScene(event.position().toPoint())
-        pen = QPen(self.current_color, max(1, self.brush_size), Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+        pos = positions[-1]
 
         if self.current_tool == 'pen' and self.current_item:
-            path: QPainterPath = self.current_item.path()
-            path.lineTo(pos)
-            self.current_item.setPath(path)
+            self.current_item.add_points(positions)
 
         elif self.current_tool in ('rectangle', 'circle', 'ellipse'):
             if not self.current_item:
                 return
             rect = QRectF(self.start_pos, pos).normalized()
-            if self.current_tool == 'rectangle':
-                self.current_item.setRect(rect)
-                # reposition handles (they are managed in class)
-                r = self.current_item.rect()
-                for role, h in self.current_item.handles.items():
-                    if role == 'tl': h.setPos(r.topLeft())
-                    if role == 'tr': h.setPos(r.topRight())
-                    if role == 'bl': h.setPos(r.bottomLeft())
-                    if role == 'br': h.setPos(r.bottomRight())
-            else:
-                # circle or ellipse
-                if self.current_tool == 'circle':
-                    dx = pos.x() - self.start_pos.x()
-                    dy = pos.y() - self.start_pos.y()
-                    size = max(abs(dx), abs(dy))
-                    end_x = self.start_pos.x() + size * (1 if dx >= 0 else -1)
-                    end_y = self.start_pos.y() + size * (1 if dy >= 0 else -1)
-                    rect = QRectF(self.start_pos, QPointF(end_x, end_y)).normalized()
-                self.current_item.setRect(rect)
-                r = self.current_item.rect()
-                for role, h in self.current_item.handles.items():
-                    if role == 'tl': h.setPos(r.topLeft())
-                    if role == 'tr': h.setPos(r.topRight())
-                    if role == 'bl': h.setPos(r.bottomLeft())
-                    if role == 'br': h.setPos(r.bottomRight())
+            if self.current_tool == 'circle':
+                dx = pos.x() - self.start_pos.x()
+                dy = pos.y() - self.start_pos.y()
+                size = max(abs(dx), abs(dy))
+                end_x = self.start_pos.x() + size * (1 if dx >= 0 else -1)
+                end_y = self.start_pos.y() + size * (1 if dy >= 0 else -1)
+                rect = QRectF(self.start_pos, QPointF(end_x, end_y)).normalized()
+            self.current_item.setRect(rect)
+            # reposition handles (they are managed in class)
+            self.current_item.update_handles()
 
         elif self.current_tool in ('line', 'arrow'):
             if not self.current_item:
@@ -585,22 +809,11 @@ class ProfessionalScreenOverlay:
             ln = self.current_item.line()
             ln.setP2(pos)
             self.current_item.setLine(ln)
-            # reposition handles
-            self.current_item.handles['start'].setPos(ln.p1())
-            self.current_item.handles['end'].setPos(ln.p2())
+            self.current_item.update_handles()
 
         elif self.current_tool == 'eraser':
-            pos = self.view.mapToScene(event.position().toPoint())
-            items = self.scene.items(QRectF(pos.x()-self.brush_size, pos.y()-self.brush_size, self.brush_size*2, self.brush_size*2))
-            for it in items:
-                if isinstance(it, ResizeHandle):
-                    continue
-                try:
-                    self.scene.removeItem(it)
-                    if it in self.drawings:
-                        self.drawings.remove(it)
-                except Exception:
-                    pass
+            for pos in positions:
+                self.erase_at(pos)
 
     def mouseReleaseEvent(self, event):
         if not self.overlay_active:
@@ -609,149 +822,257 @@ class ProfessionalScreenOverlay:
             return
         if not self.drawing:
             return
+        self.input_coalescer.flush()
 
         if self.current_tool == 'pen':
             if self.current_item:
-                self.drawings.append(self.current_item)
+                self.current_item.commit()
+                self.drawings.attach(self.current_item)
+                self.save_state(AddCommand([self.current_item]))
                 self.current_item = None
-                self.save_state()
 
-        elif self.current_tool in ('rectangle', 'circle', 'ellipse'):
+        elif self.current_tool in ('rectangle', 'circle', 'ellipse', 'line', 'arrow'):
             if self.current_item:
-                # replace placeholder with shape class if it's not yet that class
-                if isinstance(self.current_item, (RectShape, EllipseShape)):
-                    self.drawings.append(self.current_item)
-                else:
-                    self.scene.removeItem(self.current_item)
+                self.drawings.attach(self.current_item)
+                self.save_state(AddCommand([self.current_item]))
                 self.current_item = None
-                self.save_state()
 
-        elif self.current_tool in ('line', 'arrow'):
-            if self.current_item:
-                # ensure we use LineShape which has handles
-                if isinstance(self.current_item, LineShape):
-                    self.drawings.append(self.current_item)
-                else:
-                    self.scene.removeItem(self.current_item)
-                self.current_item = None
-                self.save_state()
+        elif self.current_tool == 'select':
+            changes = []
+            for it, before in self.transform_before.items():
+                after = capture_geometry(it)
+                if after != before:
+                    self.drawings.changed(it)
+                    changes.append((it, before, after))
+            if changes:
+                self.save_state(self.transform_kind(changes))
+            self.transform_before = {}
+            self.transform_kind = None
+
+        elif self.current_tool == 'eraser':
+            command = self.erase_gesture.finish()
+            if command:
+                self.save_state(command)
+            self.erase_gesture = None
 
         self.drawing = False
         self.start_pos = None
-        self.current_path = None
 
     # ---------- Erase / Delete / Clear ----------
     def erase_at(self, pos):
-        # not used; we integrated eraser in mouse handlers
-        pass
+        # cut strokes and remove other annotations under the eraser (handles and in-progress items are not annotations)
+        self.erase_gesture.erase_at(pos, self.brush_size)
 
     def delete_selected(self):
-        # remove selected items (skip handles)
-        self.save_state()
-        for it in list(self.scene.selectedItems()):
-            # skip handles
-            if isinstance(it, ResizeHandle):
-                parent = it.parentItem()
-                # if handle selected maybe delete parent instead
-                continue
-            try:
-                self.scene.removeItem(it)
-                if it in self.drawings:
-                    self.drawings.remove(it)
-            except Exception:
-                pass
+        # remove selected items (handles are never selectable annotations)
+        items = self.drawings.selected_items()
+        for it in items:
+            self.drawings.detach(it)
+        if items:
+            self.save_state(RemoveCommand(items))
 
     def clear_screen(self):
-        reply = QMessageBox.question(self.control_window, "Clear All", "Are you sure you want to clear all drawings?",
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes:
-            self.save_state()
-            for item in list(self.drawings):
-                try:
-                    self.scene.removeItem(item)
-                except Exception:
-                    pass
-            self.drawings.clear()
-
-    # ---------- Undo/Redo (basic snapshot by item list) ----------
-    def save_state(self):
-        # Save shallow copies of existing items (we store references; for robust deep snapshots you'd serialize)
-        snapshot = list(self.drawings)
-        self.undo_stack.append(snapshot)
-        if len(self.undo_stack) > 50:
-            self.undo_stack.pop(0)
-        self.redo_stack.clear()
+        confirmed = self.ask(lambda: QMessageBox.question(
+            self.control_window, "Clear All", "Are you sure you want to clear all drawings?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes, False)
+        if confirmed:
+            self.clear_all()
+
+    def clear_all(self):
+        items = list(self.drawings)
+        for item in items:
+            self.drawings.detach(item)
+        if items:
+            self.save_state(ClearCommand(items))
+
+    # ---------- Undo/Redo (command history) ----------
+    def save_state(self, command):
+        # commands are recorded after they have been applied to the scene
+        with metrics.timing('history.push'):
+            self.history.push(command)
         self.update_undo_redo_buttons()
+        self.record_document_metrics()
 
     def undo(self):
-        if not self.undo_stack:
+        if self.drawing:
             return
-        current = list(self.drawings)
-        self.redo_stack.append(current)
-        prev = self.undo_stack.pop()
-        # clear scene of current drawables and re-add prev
-        for it in list(self.drawings):
-            try:
-                self.scene.removeItem(it)
-            except Exception:
-                pass
-        self.drawings = []
-        for it in prev:
-            # if the item still belongs to scene we re-add; if not, we add a copy? For simplicity try to re-add
-            self.scene.addItem(it)
-            self.drawings.append(it)
+        with metrics.timing('history.undo'):
+            self.history.undo()
         self.update_undo_redo_buttons()
+        self.record_document_metrics()
 
     def redo(self):
-        if not self.redo_stack:
+        if self.drawing:
             return
-        current = list(self.drawings)
-        self.undo_stack.append(current)
-        prev = self.redo_stack.pop()
-        for it in list(self.drawings):
-            try:
-                self.scene.removeItem(it)
-            except Exception:
-                pass
-        self.drawings = []
-        for it in prev:
-            self.scene.addItem(it)
-            self.drawings.append(it)
+        with metrics.timing('history.redo'):
+            self.history.redo()
         self.update_undo_redo_buttons()
+        self.record_document_metrics()
 
     def update_undo_redo_buttons(self):
-        self.undo_btn.setEnabled(bool(self.undo_stack))
-        self.redo_btn.setEnabled(bool(self.redo_stack))
+        self.undo_btn.setEnabled(self.history.can_undo())
+        self.redo_btn.setEnabled(self.history.can_redo())
+
+    # ---------- Metrics ----------
+    def record_document_metrics(self):
+        metrics.record('scene.items', len(self.drawings))
+        metrics.record('history.steps', self.history.depth()[0])
+        metrics.record('history.bytes', self.history.memory_bytes + self.history.spilled_bytes())
+
+    def toggle_hud(self):
+        if self.hud_timer.isActive():
+            self.hud_timer.stop()
+            for overlay in self.drawings.overlays.values():
+                overlay.view.set_hud([])
+        else:
+            self.hud_timer.start()
+            self.update_hud()
+
+    def update_hud(self):
+        lines = metrics.hud_lines()
+        for overlay in self.drawings.overlays.values():
+            overlay.view.set_hud(lines)
+
+    def toggle_profiling(self):
+        # Captures the live hot path of the GUI thread, no restart under a profiler needed
+        if self.profile_capture is None:
+            from annotator.profiling import DEFAULT_PROFILE_DIR, ProfileCapture
+            self.profile_capture = ProfileCapture(self.settings.profile_dir or DEFAULT_PROFILE_DIR,
+                                                  self.settings.profiler)
+        if not self.profile_capture.active:
+            self.profile_capture.start()
+            self.control_window.setWindowTitle(f"{self.window_title} (profiling)")
+            return
+        self.control_window.setWindowTitle(self.window_title)
+        try:
+            path = self.profile_capture.stop()
+        except OSError as e:
+            QMessageBox.warning(self.control_window, "Profile", f"Could not write the profile:\n{e}")
+            return
+        print(f"Profile written to {path}", file=sys.stderr)
+
+    def save_metrics(self):
+        path, _ = self.ask(lambda: QFileDialog.getSaveFileName(self.control_window, "Save Metrics",
+                                                               os.path.expanduser("~"), METRICS_FILTER), ('', ''))
+        if not path:
+            return
+        if not path.lower().endswith(('.json', '.csv')):
+            path += '.json'
+        context = {
+            'app': 'advanced_version',
+            'qt': QT_VERSION_STR,
+            'screens': [{'name': overlay.screen.name(), 'geometry': list(overlay.rect.getRect()),
+                         'device_pixel_ratio': overlay.screen.devicePixelRatio(),
+                         'refresh_rate': overlay.screen.refreshRate()} for overlay in self.drawings.overlays.values()],
+            'settings': vars(self.settings),
+            'sync': self.sync.peer_stats() if self.sync is not None else None,
+        }
+        try:
+            metrics.write(path, context)
+        except OSError as e:
+            QMessageBox.warning(self.control_window, "Save Metrics", f"Could not save {path}:\n{e}")
 
     # ---------- Export ----------
     def export_image(self):
-        # Render scene to QPixmap
-        rect = self.scene.sceneRect()
-        img = QPixmap(int(rect.width()), int(rect.height()))
-        img.fill(Qt.GlobalColor.transparent)
-        painter = QPainter(img)
-        self.scene.render(painter)
-        painter.end()
-
-        path, _ = QFileDialog.getSaveFileName(self.control_window, "Export Image", os.path.expanduser("~"), "PNG Files (*.png);;JPEG Files (*.jpg *.jpeg)")
+        if self.export_job is not None:
+            return
+        from annotator.export import EXPORT_FILTER
+        # ask first, so a cancelled export costs nothing
+        path, _ = self.ask(lambda: QFileDialog.getSaveFileName(self.control_window, "Export Image",
+                                                               os.path.expanduser("~"), EXPORT_FILTER), ('', ''))
         if path:
-            # choose format by extension
-            if path.lower().endswith(('.jpg', '.jpeg')):
-                img.save(path, 'JPEG', quality=92)
-            else:
-                img.save(path, 'PNG')
+            self.start_export(path)
+
+    def start_export(self, path):
+        from annotator.export import ExportJob, snapshot_records
+        # snapshot on the GUI thread; render and encode on a worker
+        # native resolution unless an output scale was given
+        scale = self.settings.export_scale or self.drawings.device_pixel_ratio()
+        self.export_started = time.perf_counter()
+        with metrics.timing('export.snapshot'):
+            records = snapshot_records(self.drawings)
+        self.export_job = ExportJob(records, self.drawings.scene_rect(), path, self.history.factory, scale)
+        self.export_job.signals.progress.connect(self.export_progress)
+        self.export_job.signals.finished.connect(self.export_finished)
+        self.export_job.signals.failed.connect(self.export_failed)
+        self.export_btn.setEnabled(False)
+        self.export_btn.setText("Export 0%")
+        QThreadPool.globalInstance().start(self.export_job)
+
+    def export_progress(self, done, total):
+        self.export_btn.setText(f"Export {100 * done // max(1, total)}%")
+
+    def export_finished(self, path):
+        if path is not None:
+            metrics.record('export.total', (time.perf_counter() - self.export_started) * 1000)
+        self.export_job = None
+        self.export_btn.setEnabled(True)
+        self.export_btn.setText("Export")
+
+    def export_failed(self, message):
+        self.export_finished(None)
+        QMessageBox.warning(self.control_window, "Export Image", message)
+
+    # ---------- Save / Open ----------
+    def save_session(self):
+        from annotator.document import DOCUMENT_FILTER, DOCUMENT_SUFFIX, save_document
+        path, _ = self.ask(lambda: QFileDialog.getSaveFileName(self.control_window, "Save Annotations",
+                                                               os.path.expanduser("~"), DOCUMENT_FILTER), ('', ''))
+        if not path:
+            return
+        if not path.lower().endswith(DOCUMENT_SUFFIX):
+            path += DOCUMENT_SUFFIX
+        try:
+            save_document(path, self.drawings)
+        except OSError as e:
+            QMessageBox.warning(self.control_window, "Save Annotations", f"Could not save {path}:\n{e}")
+
+    def open_session(self):
+        if self.drawing:
+            return
+        from annotator.document import DOCUMENT_FILTER, DocumentError, load_document
+        path, _ = self.ask(lambda: QFileDialog.getOpenFileName(self.control_window, "Open Annotations",
+                                                               os.path.expanduser("~"), DOCUMENT_FILTER), ('', ''))
+        if not path:
+            return
+        try:
+            items = load_document(path, self.history.factory)
+        except (OSError, DocumentError) as e:
+            QMessageBox.warning(self.control_window, "Open Annotations", f"Could not open {path}:\n{e}")
+            return
+        # opening replaces the current annotations as one undoable step
+        current = list(self.drawings)
+        for item in current:
+            self.drawings.detach(item)
+        for item in items:
+            self.drawings.attach(item)
+        if current or items:
+            self.save_state(ReplaceCommand(current, items))
 
     # ---------- Key handling ----------
     def key_press_event(self, event):
         # global hotkeys mapping
+        if self.recorder is not None:
+            self.recorder.key(event)
         key = event.key()
         mods = event.modifiers()
         if key == Qt.Key.Key_F1:
             self.toggle_overlay()
         elif key == Qt.Key.Key_F2:
             self.clear_screen()
+        elif key == Qt.Key.Key_F3:
+            self.toggle_hud()
+        elif key == Qt.Key.Key_F4:
+            self.save_metrics()
         elif key == Qt.Key.Key_Escape:
             self.hide_overlay()
+        # Ctrl shortcuts before the plain tool letters they share keys with
+        elif key == Qt.Key.Key_S and mods & Qt.KeyboardModifier.ControlModifier:
+            self.save_session()
+        elif key == Qt.Key.Key_O and mods & Qt.KeyboardModifier.ControlModifier:
+            self.open_session()
+        elif key == Qt.Key.Key_P and mods & Qt.KeyboardModifier.ControlModifier and mods & Qt.KeyboardModifier.ShiftModifier:
+            self.toggle_profiling()
         elif key == Qt.Key.Key_P:
             self.select_tool('pen')
         elif key == Qt.Key.Key_R:
@@ -777,16 +1098,122 @@ class ProfessionalScreenOverlay:
         elif key == Qt.Key.Key_Y and mods & Qt.KeyboardModifier.ControlModifier:
             self.redo()
 
+    def start_journal(self):
+        # autosave every history step; after a crash, offer to bring the annotations back
+        from annotator.journal import DEFAULT_JOURNAL_DIR, Journal, JournalError, discard_session, has_session, recover
+        directory = self.settings.journal_dir or DEFAULT_JOURNAL_DIR
+        try:
+            if has_session(directory):
+                reply = QMessageBox.question(self.control_window, "Recover Annotations",
+                                             "The last session did not exit cleanly.\nRecover its annotations?",
+                                             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                if reply == QMessageBox.StandardButton.Yes:
+                    recover(self.drawings, self.history.factory, directory)
+                else:
+                    discard_session(directory)
+            self.journal = Journal(self.drawings, directory)
+            self.journal.start()
+        except (OSError, JournalError) as e:
+            QMessageBox.warning(self.control_window, "Recover Annotations", f"Autosave is off for this session:\n{e}")
+            self.journal = None
+            return
+        self.journal.failed.connect(self.journal_failed)
+        self.history.listeners.append(self.journal)
+
+    def journal_failed(self, message):
+        # autosave stops at its first write error; say so once
+        QMessageBox.warning(self.control_window, "Autosave", f"Autosave stopped for this session:\n{message}")
+
+    def start_sync(self):
+        # annotations are shared with the other overlays connected to the relay
+        from annotator.sync import SyncClient, SyncError, parse_address
+        try:
+            address = parse_address(self.settings.sync)
+        except SyncError as e:
+            self.sync_failed(str(e))
+            return
+        rate = self.settings.max_fps or QGuiApplication.primaryScreen().refreshRate() or 60
+        self.sync = SyncClient(self.drawings, self.history.factory, self.settings.sync_name, 1000 / rate,
+                               self.control_window)
+        self.sync.failed.connect(self.sync_failed)
+        self.sync.changed.connect(self.record_document_metrics)
+        self.history.listeners.append(self.sync)
+        # joins in the background; what is drawn meanwhile is sent once the shared annotations are in
+        self.sync.connect_to(*address)
+
+    def sync_failed(self, message):
+        QMessageBox.warning(self.control_window, "Shared Session", f"Not sharing this session:\n{message}")
+        if self.sync is not None:
+            self.history.listeners.remove(self.sync)
+            self.sync.deleteLater()
+            self.sync = None
+
     def closeEvent(self, event):
-        if self.overlay.isVisible():
-            self.overlay.close()
+        if self.control_server is not None:
+            self.control_server.close()
+        if not self.started:
+            # closed before the overlays were built
+            self.app.quit()
+            return
+        if self.journal is not None:
+            self.journal.close()
+        if self.sync is not None:
+            self.sync.report()
+            self.sync.close()
+        if self.profile_capture is not None and self.profile_capture.active:
+            self.toggle_profiling()
+        if self.recorder is not None:
+            self.recorder.close()
+        for overlay in self.drawings.overlays.values():
+            overlay.close()
         self.app.quit()
 
+    def run_command(self, command):
+        # sent by a later launch, see annotator.instance; the command is already checked
+        if not self.started:
+            self.deferred_startup.run()
+        name, args = command[0], command[1:]
+        if name == 'activate':
+            self.control_window.showNormal()
+            self.control_window.raise_()
+            self.control_window.activateWindow()
+        elif name == 'toggle':
+            self.toggle_overlay()
+        elif name == 'show':
+            self.show_overlay()
+        elif name == 'hide':
+            self.hide_overlay()
+        elif name == 'tool':
+            if args[0] not in self.tool_buttons:
+                raise CommandError(f"unknown tool {args[0]!r}, expected one of {', '.join(self.tool_buttons)}")
+            self.select_tool(args[0])
+        elif name == 'clear':
+            # no confirmation: whoever sent it already decided
+            self.clear_all()
+        elif name == 'undo':
+            self.undo()
+        elif name == 'redo':
+            self.redo()
+        elif name == 'export':
+            if self.export_job is not None:
+                raise CommandError("an export is already running")
+            self.start_export(args[0])
+        elif name == 'quit':
+            self.closeEvent(None)
+
+    def replay_finished(self):
+        print(f"Replayed {len(self.replayer.events)} input events from {self.replayer.path}", file=sys.stderr)
+        # from here on the overlay takes live input and asks its own questions again
+        self.replayer = None
+        if self.settings.replay_exit:
+            self.closeEvent(None)
+
     def run(self):
         self.control_window.show()
         sys.exit(self.app.exec())
 
 
 if __name__ == "__main__":
-    app = ProfessionalScreenOverlay()
+    settings, qt_args = parse_settings(sys.argv)
+    app = ProfessionalScreenOverlay(settings, qt_args)
     app.run()
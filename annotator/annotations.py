@@ -0,0 +1,132 @@
+from PyQt6.QtCore import Qt, QPointF, QRectF
+from PyQt6.QtGui import QPainterPath
+from PyQt6.QtWidgets import QGraphicsItem, QGraphicsScene
+
+from annotator.spatial import SpatialIndex
+
+# QGraphicsItem.data() key holding an item's annotation id
+ANNOTATION_ID = 0
+
+
+class AnnotationRegistry:
+    """The committed annotation items of a document, keyed by a stable id.
+
+    Membership tests, insertion and removal are O(1). The registry also owns
+    putting items into and taking them out of the scene, so undo/redo only has
+    to talk to it. Ids double as z-values, which keeps the stacking order of an
+    item when it is removed and later restored. Every committed item is kept in
+    a SpatialIndex, which answers the eraser's and the select tool's hit tests
+    without asking the scene.
+
+    With a BakedLayer set, committed items that are not selected are drawn by
+    the layer instead of being painted one by one.
+    """
+    def __init__(self, scene: QGraphicsScene, layer=None, index=None):
+        self.scene = scene
+        self.layer = None
+        self.index = index if index is not None else SpatialIndex()
+        self._items = {}
+        self._next_id = 1
+        self._selected = set()  # ids of selected annotations, kept live
+        if layer is not None:
+            self.set_layer(layer)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __contains__(self, item):
+        annotation_id = item.data(ANNOTATION_ID)
+        return annotation_id is not None and self._items.get(annotation_id) is item
+
+    def get(self, annotation_id):
+        return self._items.get(annotation_id)
+
+    def assign_id(self, item: QGraphicsItem):
+        """Give a new item its id (and stacking position) before it is committed."""
+        annotation_id = item.data(ANNOTATION_ID)
+        if annotation_id is None:
+            annotation_id = self._next_id
+            item.setData(ANNOTATION_ID, annotation_id)
+            item.setZValue(annotation_id)
+        self._next_id = max(self._next_id, annotation_id + 1)
+        return annotation_id
+
+    def attach(self, item: QGraphicsItem):
+        annotation_id = self.assign_id(item)
+        if item.scene() is not self.scene:
+            self.scene.addItem(item)
+        self._items[annotation_id] = item
+        self.index.insert(annotation_id, item)
+        if self.layer is not None and not item.isSelected():
+            self.layer.bake(item)
+
+    def detach(self, item: QGraphicsItem):
+        annotation_id = item.data(ANNOTATION_ID)
+        if self._items.get(annotation_id) is item:
+            del self._items[annotation_id]
+            self.index.remove(annotation_id)
+        if self.layer is not None:
+            self.layer.unbake(item)
+        if item.scene() is self.scene:
+            self.scene.removeItem(item)
+
+    def changed(self, item: QGraphicsItem):
+        """Tell the registry an item's geometry or style was changed in place."""
+        annotation_id = item.data(ANNOTATION_ID)
+        if self._items.get(annotation_id) is item:
+            self.index.update(annotation_id, item)
+        if self.layer is not None:
+            self.layer.refresh(item)
+
+    def items_in(self, rect: QRectF):
+        """Committed annotations whose shape intersects a scene rect, live or baked."""
+        path = QPainterPath()
+        path.addRect(rect)
+        return [item for item in self.index.query(rect)
+                if item.collidesWithPath(item.mapFromScene(path), Qt.ItemSelectionMode.IntersectsItemShape)]
+
+    def items_at(self, pos: QPointF, radius: float):
+        """Committed annotations touched by a disc, e.g. one eraser sample."""
+        rect = QRectF(pos.x() - radius, pos.y() - radius, 2 * radius, 2 * radius)
+        hits = []
+        for item in self.index.query(rect):
+            touches = getattr(item, 'touches', None)
+            if touches is not None:
+                # strokes test their segments directly instead of building a stroked outline
+                if touches(item.mapFromScene(pos), radius):
+                    hits.append(item)
+            else:
+                path = QPainterPath()
+                path.addEllipse(pos, radius, radius)
+                if item.collidesWithPath(item.mapFromScene(path), Qt.ItemSelectionMode.IntersectsItemShape):
+                    hits.append(item)
+        return hits
+
+    def set_layer(self, layer):
+        self.layer = layer
+        layer.index = self.index
+        self.scene.addItem(layer)
+        self.scene.selectionChanged.connect(self._selection_changed)
+        for item in self._items.values():
+            if not item.isSelected():
+                layer.bake(item)
+
+    def wake(self, items):
+        """Make baked items live again, e.g. before the select tool picks them."""
+        if self.layer is not None:
+            for item in items:
+                self.layer.unbake(item)
+
+    def _selection_changed(self):
+        # selected items stay live so they can be dragged and show their handles
+        selected = {item.data(ANNOTATION_ID) for item in self.scene.selectedItems() if item in self}
+        for annotation_id in selected - self._selected:
+            self.layer.unbake(self._items[annotation_id])
+        for annotation_id in self._selected - selected:
+            item = self._items.get(annotation_id)
+            if item is not None:
+                self.layer.bake(item)
+        self._selected = selected
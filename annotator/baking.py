@@ -0,0 +1,101 @@
+from PyQt6.QtCore import Qt, QRectF
+from PyQt6.QtGui import QPainter
+from PyQt6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+from annotator.annotations import ANNOTATION_ID
+from annotator.tiles import DEFAULT_MAX_TILES, DEFAULT_TILE_SIZE, TileCache
+
+# below every annotation, whose z-values are their ids (starting at 1)
+LAYER_Z = -1
+# antialiased edges can reach a pixel past an item's bounding rect
+BLEED = 1.0
+
+
+def render_item(painter: QPainter, item: QGraphicsItem):
+    """Paint one item (without its children) with its scene transform."""
+    option = QStyleOptionGraphicsItem()
+    option.exposedRect = item.boundingRect()
+    painter.save()
+    painter.setTransform(item.sceneTransform(), True)
+    painter.setOpacity(item.opacity())
+    item.paint(painter, option, None)
+    painter.restore()
+
+
+class BakedLayer(QGraphicsItem):
+    """Committed annotations rasterised into cached image tiles.
+
+    A baked item is hidden and its pixels are drawn by this layer, one blit per
+    exposed tile. Baking, unbaking and refreshing an item only drop the tiles
+    its bounds touch; those are re-rendered from the baked items overlapping
+    them, in z order, the next time they are painted. Editing one corner of the
+    screen therefore never re-renders the rest of it.
+    """
+    def __init__(self, scene_rect: QRectF, tile_size=DEFAULT_TILE_SIZE, max_tiles=DEFAULT_MAX_TILES):
+        super().__init__()
+        self._rect = QRectF(scene_rect)
+        self._tiles = TileCache(scene_rect, self._render_tile, tile_size, max_tiles)
+        self._baked = {}  # annotation id -> item
+        self._rects = {}  # annotation id -> scene rect the item was baked with
+        self.index = None  # SpatialIndex of the registry, set by AnnotationRegistry.set_layer
+        self.setZValue(LAYER_Z)
+        self.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption, True)
+
+    def __len__(self):
+        return len(self._baked)
+
+    def is_baked(self, item: QGraphicsItem):
+        return self._baked.get(item.data(ANNOTATION_ID)) is item
+
+    def bake(self, item: QGraphicsItem):
+        annotation_id = item.data(ANNOTATION_ID)
+        if annotation_id is None or self._baked.get(annotation_id) is item:
+            return
+        rect = item.sceneBoundingRect()
+        self._baked[annotation_id] = item
+        self._rects[annotation_id] = rect
+        item.setVisible(False)
+        self._invalidate(rect)
+
+    def unbake(self, item: QGraphicsItem):
+        annotation_id = item.data(ANNOTATION_ID)
+        if self._baked.get(annotation_id) is not item:
+            return
+        del self._baked[annotation_id]
+        self._invalidate(self._rects.pop(annotation_id))
+        item.setVisible(True)
+
+    def refresh(self, item: QGraphicsItem):
+        """Re-render a baked item after its geometry or style changed."""
+        annotation_id = item.data(ANNOTATION_ID)
+        if self._baked.get(annotation_id) is not item:
+            return
+        rect = item.sceneBoundingRect()
+        self._invalidate(self._rects[annotation_id])
+        self._rects[annotation_id] = rect
+        self._invalidate(rect)
+
+    def _invalidate(self, rect: QRectF):
+        rect = rect.adjusted(-BLEED, -BLEED, BLEED, BLEED).intersected(self._rect)
+        if rect.isEmpty():
+            return
+        self._tiles.invalidate(rect)
+        # re-rendered tiles only differ from the old ones inside rect
+        self.update(rect)
+
+    def _render_tile(self, painter: QPainter, tile_rect: QRectF):
+        if self.index is not None:
+            candidates = [item for item in self.index.query(tile_rect) if self.is_baked(item)]
+        else:
+            candidates = list(self._baked.values())
+        overlapping = [item for item in candidates
+                       if self._rects[item.data(ANNOTATION_ID)].adjusted(-BLEED, -BLEED, BLEED, BLEED).intersects(tile_rect)]
+        for item in sorted(overlapping, key=lambda it: it.zValue()):
+            render_item(painter, item)
+
+    def boundingRect(self) -> QRectF:
+        return self._rect
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget=None):
+        self._tiles.paint(painter, option.exposedRect)
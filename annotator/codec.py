@@ -0,0 +1,153 @@
+"""Plain-data records for annotation items.
+
+Records are tuples of numbers, strings and bytes: cheap to pickle, safe to hand
+to another thread, and independent of the QGraphicsItem classes of a given
+overlay. decode_item() rebuilds items through an ItemFactory, so each overlay
+gets its own shape classes back.
+"""
+import numpy as np
+from PyQt6.QtCore import Qt, QLineF, QPointF, QRectF
+from PyQt6.QtGui import QColor, QFont, QPen
+from PyQt6.QtWidgets import (
+    QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsRectItem, QGraphicsTextItem
+)
+
+from annotator.annotations import ANNOTATION_ID
+from annotator.strokes import StrokeItem
+
+KIND_STROKE = 'stroke'
+KIND_RECT = 'rect'
+KIND_ELLIPSE = 'ellipse'
+KIND_LINE = 'line'
+KIND_TEXT = 'text'
+
+# rough per-item overhead of a live QGraphicsItem and its Python wrapper
+ITEM_OVERHEAD_BYTES = 512
+
+
+def pen_to_record(pen: QPen):
+    return (pen.color().rgba(), pen.widthF(), pen.style().value, pen.capStyle().value, pen.joinStyle().value)
+
+
+def pen_from_record(record) -> QPen:
+    rgba, width, style, cap, join = record
+    return QPen(QColor.fromRgba(rgba), width, Qt.PenStyle(style), Qt.PenCapStyle(cap), Qt.PenJoinStyle(join))
+
+
+def font_to_record(font: QFont):
+    weight = font.weight()
+    return (font.family(), font.pointSizeF(), getattr(weight, 'value', weight), font.italic())
+
+
+def font_from_record(record) -> QFont:
+    family, size, weight, italic = record
+    font = QFont(family, -1, weight, italic)
+    font.setPointSizeF(size)
+    return font
+
+
+def item_kind(item):
+    if isinstance(item, StrokeItem):
+        return KIND_STROKE
+    if isinstance(item, QGraphicsRectItem):
+        return KIND_RECT
+    if isinstance(item, QGraphicsEllipseItem):
+        return KIND_ELLIPSE
+    if isinstance(item, QGraphicsLineItem):
+        return KIND_LINE
+    if isinstance(item, QGraphicsTextItem):
+        return KIND_TEXT
+    return None
+
+
+def encode_item(item):
+    """(kind, id, z, x, y, style, geometry) record of an annotation item."""
+    kind = item_kind(item)
+    if kind is None:
+        raise TypeError(f"cannot encode {type(item).__name__}")
+    if kind == KIND_STROKE:
+        curves = item.curves()
+        style = pen_to_record(item.pen())
+        geometry = (item.points().astype(np.float32).tobytes(),
+                    None if curves is None else curves.astype(np.float32).tobytes())
+    elif kind in (KIND_RECT, KIND_ELLIPSE):
+        r = item.rect()
+        style = pen_to_record(item.pen())
+        geometry = (r.x(), r.y(), r.width(), r.height())
+    elif kind == KIND_LINE:
+        ln = item.line()
+        style = pen_to_record(item.pen())
+        geometry = (ln.x1(), ln.y1(), ln.x2(), ln.y2(), bool(getattr(item, 'arrow', False)))
+    else:
+        style = (item.defaultTextColor().rgba(), font_to_record(item.font()))
+        geometry = item.toPlainText()
+    pos = item.pos()
+    return (kind, item.data(ANNOTATION_ID), item.zValue(), pos.x(), pos.y(), style, geometry)
+
+
+def record_size(record):
+    """Estimated memory held by the item a record describes."""
+    kind, geometry = record[0], record[6]
+    if kind == KIND_STROKE:
+        points, curves = geometry
+        # float64 buffer + QPolygonF mirror, plus the Bezier path once committed
+        return ITEM_OVERHEAD_BYTES + len(points) * 4 + len(curves or b'') * 6
+    if kind == KIND_TEXT:
+        return ITEM_OVERHEAD_BYTES + 2 * len(geometry)
+    return ITEM_OVERHEAD_BYTES
+
+
+class ItemFactory:
+    """Creates items for decoded records; plain Qt items unless overridden."""
+    def stroke(self, pen, points, curves):
+        item = StrokeItem(pen)
+        item.set_points(points)
+        if curves is not None:
+            item.set_curves(curves)
+        return item
+
+    def rect(self, rect, pen):
+        item = QGraphicsRectItem(rect)
+        item.setPen(pen)
+        return item
+
+    def ellipse(self, rect, pen):
+        item = QGraphicsEllipseItem(rect)
+        item.setPen(pen)
+        return item
+
+    def line(self, line, pen, arrow):
+        item = QGraphicsLineItem(line)
+        item.setPen(pen)
+        return item
+
+    def text(self, text, font, color):
+        item = QGraphicsTextItem(text)
+        item.setFont(font)
+        item.setDefaultTextColor(color)
+        return item
+
+
+def decode_item(record, factory: ItemFactory):
+    kind, annotation_id, z, x, y, style, geometry = record
+    if kind == KIND_STROKE:
+        points, curves = geometry
+        item = factory.stroke(pen_from_record(style),
+                              np.frombuffer(points, dtype=np.float32).reshape(-1, 2),
+                              None if curves is None else np.frombuffer(curves, dtype=np.float32).reshape(-1, 4, 2))
+    elif kind in (KIND_RECT, KIND_ELLIPSE):
+        make = factory.rect if kind == KIND_RECT else factory.ellipse
+        item = make(QRectF(*geometry), pen_from_record(style))
+    elif kind == KIND_LINE:
+        x1, y1, x2, y2, arrow = geometry
+        item = factory.line(QLineF(x1, y1, x2, y2), pen_from_record(style), arrow)
+    elif kind == KIND_TEXT:
+        rgba, font = style
+        item = factory.text(geometry, font_from_record(font), QColor.fromRgba(rgba))
+    else:
+        raise ValueError(f"unknown item kind {kind!r}")
+    if annotation_id is not None:
+        item.setData(ANNOTATION_ID, annotation_id)
+    item.setZValue(z)
+    item.setPos(QPointF(x, y))
+    return item
@@ -0,0 +1,169 @@
+"""Compact binary encoding of the deltas a shared session sends.
+
+A delta batch is a list of plain-data entries: the same tuples, lists,
+numbers, strings and bytes that Command.to_record() and encode_item() produce.
+Every value is written as a one-byte tag followed by its data:
+
+    NONE, FALSE, TRUE    no data
+    INT                  zigzag varint
+    FLOAT32, FLOAT64     little-endian; FLOAT32 only when it holds the value exactly
+    STR, BYTES           varint length, then UTF-8 or raw bytes
+    TUPLE, LIST          varint count, then the values
+
+Batches above COMPRESS_MIN_BYTES are deflated. Unlike pickle, decoding only
+ever builds these types, so a batch from another machine cannot run code.
+"""
+import struct
+import zlib
+
+NONE, FALSE, TRUE, INT, FLOAT32, FLOAT64, STR, BYTES, TUPLE, LIST = range(10)
+F32 = struct.Struct('<f')
+F64 = struct.Struct('<d')
+
+# first byte of an encoded batch
+RAW, DEFLATED = 0, 1
+# smaller batches are sent as they are; deflate would barely shrink them
+COMPRESS_MIN_BYTES = 256
+# limits on what a batch may decode to
+MAX_BATCH_BYTES = 64 * 1024 * 1024
+MAX_DEPTH = 32
+
+
+class DeltaError(ValueError):
+    """The data is not a delta batch this version can read."""
+
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data, offset):
+    n = shift = 0
+    while True:
+        if offset >= len(data):
+            raise DeltaError("truncated varint")
+        byte = data[offset]
+        offset += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, offset
+        shift += 7
+
+
+def pack_value(value, out):
+    """Append the encoding of a plain-data value to the bytearray out."""
+    if value is None:
+        out.append(NONE)
+    elif value is True or value is False:
+        out.append(TRUE if value else FALSE)
+    elif isinstance(value, int):
+        out.append(INT)
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        try:
+            exact = F32.unpack(F32.pack(value))[0] == value
+        except OverflowError:
+            exact = False
+        if exact:
+            out.append(FLOAT32)
+            out += F32.pack(value)
+        else:
+            out.append(FLOAT64)
+            out += F64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out.append(STR)
+        _write_varint(out, len(data))
+        out += data
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        data = bytes(value)
+        out.append(BYTES)
+        _write_varint(out, len(data))
+        out += data
+    elif isinstance(value, (tuple, list)):
+        out.append(TUPLE if isinstance(value, tuple) else LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            pack_value(item, out)
+    else:
+        raise TypeError(f"cannot encode {type(value).__name__}")
+
+
+def unpack_value(data, offset=0, depth=0):
+    """(value, offset after it) of the value encoded at offset."""
+    if offset >= len(data):
+        raise DeltaError("truncated value")
+    tag = data[offset]
+    offset += 1
+    if tag == NONE:
+        return None, offset
+    if tag in (FALSE, TRUE):
+        return tag == TRUE, offset
+    if tag == INT:
+        n, offset = _read_varint(data, offset)
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1), offset
+    if tag in (FLOAT32, FLOAT64):
+        fmt = F32 if tag == FLOAT32 else F64
+        if offset + fmt.size > len(data):
+            raise DeltaError("truncated float")
+        return fmt.unpack_from(data, offset)[0], offset + fmt.size
+    if tag in (STR, BYTES):
+        length, offset = _read_varint(data, offset)
+        if offset + length > len(data):
+            raise DeltaError("truncated string")
+        raw = bytes(data[offset:offset + length])
+        try:
+            return (raw.decode('utf-8') if tag == STR else raw), offset + length
+        except UnicodeDecodeError as e:
+            raise DeltaError(f"bad string: {e}") from e
+    if tag in (TUPLE, LIST):
+        if depth >= MAX_DEPTH:
+            raise DeltaError("values nested too deeply")
+        count, offset = _read_varint(data, offset)
+        if count > len(data) - offset:
+            raise DeltaError("truncated sequence")
+        items = []
+        for _ in range(count):
+            item, offset = unpack_value(data, offset, depth + 1)
+            items.append(item)
+        return (tuple(items) if tag == TUPLE else items), offset
+    raise DeltaError(f"unknown value tag {tag}")
+
+
+def encode_batch(entries):
+    """One message's worth of entries as bytes, deflated when that pays off."""
+    body = bytearray()
+    _write_varint(body, len(entries))
+    for entry in entries:
+        pack_value(entry, body)
+    if len(body) >= COMPRESS_MIN_BYTES:
+        return bytes((DEFLATED,)) + zlib.compress(bytes(body), 1)
+    return bytes((RAW,)) + bytes(body)
+
+
+def decode_batch(payload):
+    """The entries of an encode_batch() payload."""
+    if not payload:
+        raise DeltaError("empty batch")
+    body = memoryview(payload)[1:]
+    if payload[0] == DEFLATED:
+        inflater = zlib.decompressobj()
+        try:
+            body = inflater.decompress(body, MAX_BATCH_BYTES)
+        except zlib.error as e:
+            raise DeltaError(f"bad deflate stream: {e}") from e
+        if inflater.unconsumed_tail:
+            raise DeltaError("batch too large")
+        if not inflater.eof:
+            raise DeltaError("truncated deflate stream")
+    elif payload[0] != RAW:
+        raise DeltaError(f"unknown batch encoding {payload[0]}")
+    count, offset = _read_varint(body, 0)
+    entries = []
+    for _ in range(count):
+        entry, offset = unpack_value(body, offset)
+        entries.append(entry)
+    return entries
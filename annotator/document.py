@@ -0,0 +1,274 @@
+"""Native annotation documents.
+
+A document is a small header, a table of sections and the sections themselves,
+each a flat little-endian array that is read back with np.frombuffer over a
+memory map:
+
+    PENS  pen style table, shared by strokes and shapes
+    FONT  text style table (JSON)
+    ITEM  one fixed-size record per item, in stacking order
+    PNTS  stroke points as int32 deltas in 1/16 px, one running sequence
+          across all strokes, so a single cumsum restores every point
+    CRVS  fitted Bezier control points of committed strokes (float32)
+    SHPS  rect/ellipse/line geometry (float32 x4)
+    TEXT  UTF-8 text of text items
+
+Annotation ids are not stored; the loading registry hands out fresh ones in
+stacking order.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+from PyQt6.QtCore import Qt, QLineF, QRectF
+from PyQt6.QtGui import QColor
+
+from annotator.codec import (
+    KIND_ELLIPSE, KIND_LINE, KIND_RECT, KIND_STROKE, KIND_TEXT, font_from_record, font_to_record, item_kind,
+    pen_from_record, pen_to_record
+)
+
+MAGIC = b'SANN'
+VERSION = 1
+DOCUMENT_SUFFIX = '.sann'
+DOCUMENT_FILTER = "Annotation Documents (*.sann)"
+
+HEADER = struct.Struct('<4sHH')  # magic, version, section count
+SECTION = struct.Struct('<4sQQ')  # tag, offset, length
+ALIGNMENT = 8
+
+# stroke points are stored in units of 1/POINT_SCALE px
+POINT_SCALE = 16
+
+KIND_CODES = {KIND_STROKE: 1, KIND_RECT: 2, KIND_ELLIPSE: 3, KIND_LINE: 4, KIND_TEXT: 5}
+KINDS = {code: kind for kind, code in KIND_CODES.items()}
+FLAG_ARROW = 1
+
+PEN_DTYPE = np.dtype([('rgba', '<u4'), ('width', '<f4'), ('style', 'u1'), ('cap', 'u1'), ('join', 'u1'),
+                      ('pad', 'u1')])
+ITEM_DTYPE = np.dtype([('kind', 'u1'), ('flags', 'u1'), ('pad', '<u2'), ('style', '<u4'),
+                       ('x', '<f4'), ('y', '<f4'), ('offset', '<u4'), ('count', '<u4'),
+                       ('curve_offset', '<u4'), ('curve_count', '<u4')])
+
+
+class DocumentError(ValueError):
+    """The file is not a document this version can read."""
+
+
+def save_document(path, items):
+    """Write annotation items to path, replacing it atomically."""
+    items = sorted(items, key=lambda it: it.zValue())
+    pens = {}
+    known_pens = {}
+    fonts = {}
+    rows = []
+    point_chunks = []
+    curve_chunks = []
+    shapes = []
+    texts = bytearray()
+    n_points = n_curves = 0
+    for item in items:
+        kind = item_kind(item)
+        if kind is None:
+            raise TypeError(f"cannot save {type(item).__name__}")
+        flags = 0
+        curve_offset = curve_count = 0
+        if kind == KIND_STROKE:
+            style = _pen_style(pens, known_pens, item.pen())
+            points = item.points()
+            offset, count = n_points, len(points)
+            point_chunks.append(points)
+            n_points += count
+            curves = item.curves()
+            if curves is not None:
+                curve_offset, curve_count = n_curves, len(curves)
+                curve_chunks.append(curves.reshape(-1, 8))
+                n_curves += curve_count
+        elif kind == KIND_TEXT:
+            style = fonts.setdefault((item.defaultTextColor().rgba(), font_to_record(item.font())), len(fonts))
+            encoded = item.toPlainText().encode('utf-8')
+            offset, count = len(texts), len(encoded)
+            texts += encoded
+        else:
+            style = _pen_style(pens, known_pens, item.pen())
+            if kind == KIND_LINE:
+                ln = item.line()
+                shapes.append((ln.x1(), ln.y1(), ln.x2(), ln.y2()))
+                if getattr(item, 'arrow', False):
+                    flags |= FLAG_ARROW
+            else:
+                r = item.rect()
+                shapes.append((r.x(), r.y(), r.width(), r.height()))
+            offset, count = len(shapes) - 1, 1
+        pos = item.pos()
+        rows.append((KIND_CODES[kind], flags, 0, style, pos.x(), pos.y(), offset, count, curve_offset, curve_count))
+
+    table = np.array(rows, dtype=ITEM_DTYPE)
+    pen_table = np.zeros(len(pens), dtype=PEN_DTYPE)
+    for (rgba, width, style, cap, join), index in pens.items():
+        pen_table[index] = (rgba, width, style, cap, join, 0)
+    font_table = [None] * len(fonts)
+    for (rgba, font), index in fonts.items():
+        font_table[index] = [rgba, *font]
+
+    if point_chunks:
+        quantized = np.round(np.concatenate(point_chunks) * POINT_SCALE).astype(np.int64)
+        deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).astype('<i4')
+    else:
+        deltas = np.empty((0, 2), dtype='<i4')
+    curves = np.concatenate(curve_chunks).astype('<f4') if curve_chunks else np.empty((0, 8), dtype='<f4')
+
+    sections = [
+        (b'PENS', pen_table.tobytes()),
+        (b'FONT', json.dumps(font_table).encode('utf-8')),
+        (b'ITEM', table.tobytes()),
+        (b'PNTS', deltas.tobytes()),
+        (b'CRVS', curves.tobytes()),
+        (b'SHPS', np.asarray(shapes, dtype='<f4').reshape(-1, 4).tobytes()),
+        (b'TEXT', bytes(texts)),
+    ]
+    _write_sections(path, sections)
+
+
+def _pen_style(pens, known, pen):
+    """Index of pen in the style table; each distinct pen is converted to a record once."""
+    key = (pen.color().rgba(), pen.widthF())
+    for other, index in known.get(key, ()):
+        if other == pen:
+            return index
+    index = pens.setdefault(pen_to_record(pen), len(pens))
+    known.setdefault(key, []).append((pen, index))
+    return index
+
+
+def _write_sections(path, sections):
+    offset = _aligned(HEADER.size + SECTION.size * len(sections))
+    directory = []
+    for tag, data in sections:
+        directory.append((tag, offset, len(data)))
+        offset = _aligned(offset + len(data))
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.annotations-', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+            for entry in directory:
+                f.write(SECTION.pack(*entry))
+            for (tag, data), (_, section_offset, _) in zip(sections, directory):
+                f.write(b'\0' * (section_offset - f.tell()))
+                f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _read_sections(path):
+    """Copies of the document's arrays, read through a memory map."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise DocumentError(f"{path} is not an annotation document")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, count = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                raise DocumentError(f"{path} is not an annotation document")
+            if version > VERSION:
+                raise DocumentError(f"{path} was written by a newer version (format {version})")
+            if HEADER.size + count * SECTION.size > len(mm):
+                raise DocumentError(f"{path} is truncated")
+            directory = {}
+            for i in range(count):
+                tag, offset, length = SECTION.unpack_from(mm, HEADER.size + i * SECTION.size)
+                if offset + length > len(mm):
+                    raise DocumentError(f"{path} is truncated")
+                directory[tag] = (offset, length)
+
+            def array(tag, dtype, width=None):
+                offset, length = directory.get(tag, (0, 0))
+                dtype = np.dtype(dtype)
+                values = np.frombuffer(mm, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+                return values.reshape(-1, width) if width else values
+
+            def blob(tag):
+                offset, length = directory.get(tag, (0, 0))
+                return mm[offset:offset + length]
+
+            # every array is copied (or derived) so the map can be closed
+            pens = array(b'PENS', PEN_DTYPE).copy()
+            table = array(b'ITEM', ITEM_DTYPE).copy()
+            deltas = array(b'PNTS', '<i4', 2)
+            points = np.cumsum(deltas, axis=0, dtype=np.int64) / POINT_SCALE
+            del deltas
+            curves = array(b'CRVS', '<f4', 8).astype(np.float64).reshape(-1, 4, 2)
+            shapes = array(b'SHPS', '<f4', 4).astype(np.float64)
+            try:
+                fonts = json.loads(blob(b'FONT') or b'[]')
+            except ValueError as e:
+                raise DocumentError(f"{path} has a damaged font table: {e}") from e
+            texts = blob(b'TEXT')
+    return pens, fonts, table, points, curves, shapes, texts
+
+
+def _check_table(path, table, n_pens, n_fonts, n_points, n_curves, n_shapes, n_texts):
+    """Raise DocumentError unless every item's kind, style and ranges fit the sections."""
+    kind = table['kind']
+    style = table['style']
+    offset = table['offset'].astype(np.int64)
+    end = offset + table['count']
+    stroke = kind == KIND_CODES[KIND_STROKE]
+    text = kind == KIND_CODES[KIND_TEXT]
+    shape = np.isin(kind, [KIND_CODES[KIND_RECT], KIND_CODES[KIND_ELLIPSE], KIND_CODES[KIND_LINE]])
+    unknown = ~(stroke | text | shape)
+    if unknown.any():
+        i = int(np.argmax(unknown))
+        raise DocumentError(f"unknown item kind {kind[i]} in {path}")
+    bad = ((stroke | shape) & (style >= n_pens)) | (text & (style >= n_fonts))
+    bad |= stroke & ((end > n_points) | (table['curve_offset'].astype(np.int64) + table['curve_count'] > n_curves))
+    bad |= shape & (offset >= n_shapes)
+    bad |= text & (end > n_texts)
+    if bad.any():
+        raise DocumentError(f"item {int(np.argmax(bad))} of {path} refers past the end of its section")
+
+
+def load_document(path, factory):
+    """Items of a document, in stacking order, built by an ItemFactory; not yet in any scene."""
+    pens, fonts, table, points, curves, shapes, texts = _read_sections(path)
+    for field, enum in (('style', Qt.PenStyle), ('cap', Qt.PenCapStyle), ('join', Qt.PenJoinStyle)):
+        if not np.isin(pens[field], [member.value for member in enum]).all():
+            raise DocumentError(f"{path} has a damaged style table: unknown pen {field}")
+    try:
+        pen_styles = [pen_from_record((int(p['rgba']), float(p['width']), int(p['style']), int(p['cap']),
+                                       int(p['join']))) for p in pens]
+        text_styles = [(QColor.fromRgba(rgba), font_from_record(font)) for rgba, *font in fonts]
+    except (ValueError, TypeError) as e:
+        raise DocumentError(f"{path} has a damaged style table: {e}") from e
+    _check_table(path, table, len(pen_styles), len(text_styles), len(points), len(curves), len(shapes), len(texts))
+    items = []
+    for kind_code, flags, style, x, y, offset, count, curve_offset, curve_count in table[
+            ['kind', 'flags', 'style', 'x', 'y', 'offset', 'count', 'curve_offset', 'curve_count']].tolist():
+        kind = KINDS[kind_code]
+        if kind == KIND_STROKE:
+            item = factory.stroke(pen_styles[style], points[offset:offset + count],
+                                  curves[curve_offset:curve_offset + curve_count] if curve_count else None)
+        elif kind in (KIND_RECT, KIND_ELLIPSE):
+            make = factory.rect if kind == KIND_RECT else factory.ellipse
+            item = make(QRectF(*shapes[offset].tolist()), pen_styles[style])
+        elif kind == KIND_LINE:
+            item = factory.line(QLineF(*shapes[offset].tolist()), pen_styles[style], bool(flags & FLAG_ARROW))
+        else:
+            color, font = text_styles[style]
+            try:
+                text = texts[offset:offset + count].decode('utf-8')
+            except UnicodeDecodeError as e:
+                raise DocumentError(f"item {len(items)} of {path} has damaged text: {e}") from e
+            item = factory.text(text, font, color)
+        item.setPos(x, y)
+        items.append(item)
+    return items
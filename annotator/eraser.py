@@ -0,0 +1,51 @@
+from PyQt6.QtCore import QPointF
+
+from annotator.annotations import ANNOTATION_ID
+from annotator.history import RemoveCommand, ReplaceCommand
+from annotator.strokes import StrokeItem
+
+
+class EraseGesture:
+    """One eraser drag, from press to release, recorded as a single undo step.
+
+    Strokes lose only the ink under the eraser and are replaced by the pieces
+    that survive; other annotations are removed whole. Pieces cut during the
+    drag stay plain polylines until finish() commits them, so a sample only
+    costs the vectorised split of the strokes it touches.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.removed = []  # annotations that existed before the gesture
+        self.added = {}  # annotation id -> piece created by this gesture
+
+    def erase_at(self, pos: QPointF, radius: float):
+        for item in self.registry.items_at(pos, radius):
+            pieces = []
+            if isinstance(item, StrokeItem):
+                pieces = item.erase(item.mapFromScene(pos), radius)
+                if pieces is None:
+                    continue
+            self.registry.detach(item)
+            if self.added.pop(item.data(ANNOTATION_ID), None) is None:
+                self.removed.append(item)
+            for points in pieces:
+                piece = StrokeItem(item.pen())
+                piece.set_points(points)
+                piece.setPos(item.pos())
+                piece_id = self.registry.assign_id(piece)
+                # keep the stacking position of the stroke it was cut from
+                piece.setZValue(item.zValue())
+                self.registry.attach(piece)
+                self.added[piece_id] = piece
+
+    def finish(self):
+        """Fit the surviving pieces and return the command for the gesture, or None."""
+        added = list(self.added.values())
+        for piece in added:
+            piece.commit()
+            self.registry.changed(piece)
+        if not self.removed:
+            return None
+        if not added:
+            return RemoveCommand(self.removed)
+        return ReplaceCommand(self.removed, added)
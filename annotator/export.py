@@ -0,0 +1,101 @@
+"""Image export off the GUI thread.
+
+The GUI thread only snapshots the annotations as plain records (see
+annotator.codec); an ExportJob running on a QThreadPool worker either rebuilds
+them as detached items, paints them into a QImage and encodes the file, or
+streams them to an SVG/PDF file (see annotator.vector), reporting progress and
+the outcome through signals.
+"""
+from PyQt6.QtCore import Qt, QObject, QRectF, QRunnable, pyqtSignal
+from PyQt6.QtGui import QImage, QPainter
+
+from annotator.annotations import ANNOTATION_ID
+from annotator.baking import render_item
+from annotator.codec import ItemFactory, decode_item, encode_item
+from annotator.vector import is_vector_path, write_vector
+
+# scene units are logical pixels, 96 per inch
+LOGICAL_DPI = 96
+# items painted between two progress signals
+PROGRESS_STEP = 256
+JPEG_QUALITY = 92
+EXPORT_FILTER = ("PNG Files (*.png);;JPEG Files (*.jpg *.jpeg);;SVG Files (*.svg *.svgz);;"
+                 "PDF Files (*.pdf)")
+
+
+def snapshot_records(items):
+    """Plain records of items in stacking order, safe to hand to a worker thread."""
+    return [encode_item(item) for item in sorted(items, key=lambda it: (it.zValue(), it.data(ANNOTATION_ID)))]
+
+
+def render_records(records, scene_rect: QRectF, factory=None, scale=1.0, progress=None) -> QImage:
+    """Paint records into a transparent QImage covering scene_rect at the given scale."""
+    factory = factory or ItemFactory()
+    return render_items((decode_item(record, factory) for record in records), scene_rect, scale, progress,
+                        len(records))
+
+
+def render_items(items, scene_rect: QRectF, scale=1.0, progress=None, total=0) -> QImage:
+    """Paint detached items, in the order given, into a transparent QImage covering scene_rect.
+
+    The image has scale pixels per scene unit and no more; its resolution is
+    recorded so viewers show it at the overlay's logical size.
+    """
+    image = QImage(max(1, round(scene_rect.width() * scale)), max(1, round(scene_rect.height() * scale)),
+                   QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    dots_per_meter = round(LOGICAL_DPI * scale / 0.0254)
+    image.setDotsPerMeterX(dots_per_meter)
+    image.setDotsPerMeterY(dots_per_meter)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+    painter.scale(scale, scale)
+    painter.translate(-scene_rect.topLeft())
+    for done, item in enumerate(items, 1):
+        render_item(painter, item)
+        if progress is not None and (done % PROGRESS_STEP == 0 or done == total):
+            progress(done, total)
+    painter.end()
+    return image
+
+
+def save_image(image: QImage, path):
+    """Encode by file extension: JPEG for .jpg/.jpeg, PNG otherwise. Returns True on success."""
+    if path.lower().endswith(('.jpg', '.jpeg')):
+        return image.save(path, 'JPEG', JPEG_QUALITY)
+    return image.save(path, 'PNG')
+
+
+class ExportSignals(QObject):
+    progress = pyqtSignal(int, int)  # items painted, total items
+    finished = pyqtSignal(str)  # path written
+    failed = pyqtSignal(str)  # error message
+
+
+class ExportJob(QRunnable):
+    """Rasterise and encode, or stream as vectors, a snapshot of the annotations on a worker thread."""
+    def __init__(self, records, scene_rect: QRectF, path, factory=None, scale=1.0):
+        super().__init__()
+        self.records = records
+        self.scene_rect = QRectF(scene_rect)
+        self.path = path
+        self.factory = factory
+        self.scale = scale
+        self.signals = ExportSignals()
+
+    def run(self):
+        try:
+            if is_vector_path(self.path):
+                write_vector(self.path, self.records, self.scene_rect, self.signals.progress.emit)
+                self.signals.finished.emit(self.path)
+                return
+            image = render_records(self.records, self.scene_rect, self.factory, self.scale,
+                                   self.signals.progress.emit)
+            if not save_image(image, self.path):
+                self.signals.failed.emit(f"Could not write {self.path}")
+                return
+        except Exception as e:  # a worker must always report back
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(self.path)
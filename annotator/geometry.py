@@ -0,0 +1,325 @@
+"""Vectorised polyline helpers used on committed strokes."""
+import numpy as np
+
+
+def segment_distances_sq(points, a, b):
+    """Squared distance from each point to the segment a-b (all (n, 2) arrays, or a/b broadcastable)."""
+    ab = b - a
+    ap = points - a
+    length_sq = np.einsum('ij,ij->i', ab, ab) if ab.ndim == 2 else float(ab @ ab)
+    t = np.einsum('ij,ij->i', ap, ab) if ab.ndim == 2 else ap @ ab
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length_sq > 0, t / length_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    closest = a + ab * t[:, None]
+    diff = points - closest
+    return np.einsum('ij,ij->i', diff, diff)
+
+
+def simplify_polyline(points, tolerance):
+    """Ramer-Douglas-Peucker simplification of an (n, 2) polyline.
+
+    All segments of one recursion level are split in a single NumPy pass, so the
+    number of Python iterations is the depth of the recursion, not the number of
+    vertices kept.
+    """
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return np.array(points, dtype=np.float64, copy=True)
+    points = np.asarray(points, dtype=np.float64)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    order = np.arange(n)
+    while True:
+        kept = np.flatnonzero(keep)
+        # index (into kept) of the segment each point belongs to
+        seg = np.minimum(np.searchsorted(kept, order, side='right') - 1, len(kept) - 2)
+        dist = segment_distances_sq(points, points[kept[seg]], points[kept[seg + 1]])
+        dist[keep] = 0.0
+        seg_max = np.maximum.reduceat(dist, kept[:-1])
+        if not (seg_max > tolerance_sq).any():
+            break
+        # the farthest point of every segment that is still out of tolerance
+        candidates = np.flatnonzero((dist > tolerance_sq) & (dist == seg_max[seg]))
+        cand_seg = seg[candidates]
+        first = np.ones(len(candidates), dtype=bool)
+        first[1:] = cand_seg[1:] != cand_seg[:-1]
+        keep[candidates[first]] = True
+    return points[keep]
+
+
+def _bezier_points(ctrl, t):
+    """Evaluate cubic Beziers at parameters t (m,); ctrl is one (4, 2) curve or one (m, 4, 2) curve per parameter."""
+    mt = 1.0 - t
+    b0, b1, b2, b3 = (mt * mt * mt)[:, None], (3 * mt * mt * t)[:, None], (3 * mt * t * t)[:, None], (t * t * t)[:, None]
+    if ctrl.ndim == 2:
+        return b0 * ctrl[0] + b1 * ctrl[1] + b2 * ctrl[2] + b3 * ctrl[3]
+    return b0 * ctrl[:, 0] + b1 * ctrl[:, 1] + b2 * ctrl[:, 2] + b3 * ctrl[:, 3]
+
+
+def _normalized_rows(v):
+    length = np.hypot(v[:, 0], v[:, 1])
+    out = np.zeros_like(v)
+    nonzero = length > 1e-12
+    out[nonzero] = v[nonzero] / length[nonzero, None]
+    return out
+
+
+def _row_dot(a, b):
+    return a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1]
+
+
+class _Segments:
+    """The open segments of one fitting level, with their points laid out back to back."""
+    def __init__(self, points, first, last):
+        self.counts = last - first + 1
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+        self.ends = self.starts + self.counts - 1
+        self.seg = np.repeat(np.arange(len(first)), self.counts)
+        self.index = first[self.seg] + np.arange(len(self.seg)) - self.starts[self.seg]
+        self.points = points[self.index]
+
+    def chord_parameters(self):
+        steps = np.zeros(len(self.points))
+        steps[1:] = np.hypot(*np.diff(self.points, axis=0).T)
+        steps[self.starts] = 0.0
+        u = np.cumsum(steps)
+        u -= u[self.starts][self.seg]
+        total = u[self.ends][self.seg]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total > 0, u / total, 0.0)
+
+    def fit(self, u, tan1, tan2):
+        """Least-squares cubic per segment with fixed end tangents (Schneider 1990)."""
+        seg, starts = self.seg, self.starts
+        p0, p3 = self.points[starts], self.points[self.ends]
+        mt = 1.0 - u
+        b0, b1, b2, b3 = mt ** 3, 3 * mt * mt * u, 3 * mt * u * u, u ** 3
+        a1 = tan1[seg] * b1[:, None]
+        a2 = tan2[seg] * b2[:, None]
+        rest = self.points - (p0[seg] * (b0 + b1)[:, None] + p3[seg] * (b2 + b3)[:, None])
+        c00 = np.add.reduceat(_row_dot(a1, a1), starts)
+        c01 = np.add.reduceat(_row_dot(a1, a2), starts)
+        c11 = np.add.reduceat(_row_dot(a2, a2), starts)
+        x0 = np.add.reduceat(_row_dot(a1, rest), starts)
+        x1 = np.add.reduceat(_row_dot(a2, rest), starts)
+        det = c00 * c11 - c01 * c01
+        solvable = np.abs(det) > 1e-12
+        safe_det = np.where(solvable, det, 1.0)
+        alpha1 = np.where(solvable, (x0 * c11 - c01 * x1) / safe_det, 0.0)
+        alpha2 = np.where(solvable, (c00 * x1 - x0 * c01) / safe_det, 0.0)
+        chord = p3 - p0
+        seg_len = np.hypot(chord[:, 0], chord[:, 1])
+        # degenerate system or handles crossing over: fall back to the Wu/Barsky heuristic
+        fallback = ((alpha1 < 1e-6 * seg_len) | (alpha2 < 1e-6 * seg_len)
+                    | (_row_dot(tan1 * alpha1[:, None] - tan2 * alpha2[:, None], chord) > seg_len * seg_len))
+        alpha1 = np.where(fallback, seg_len / 3.0, alpha1)
+        alpha2 = np.where(fallback, seg_len / 3.0, alpha2)
+        return np.stack((p0, p0 + tan1 * alpha1[:, None], p3 + tan2 * alpha2[:, None], p3), axis=1)
+
+    def errors(self, ctrl, u, samples, tolerance_sq):
+        """Squared error of each point, and of the curve between it and the next point.
+
+        The curve must pass near every sample and, between two samples, stay
+        near the straight line joining them, which is what was drawn. The
+        second check is skipped on segments whose points are already out of
+        tolerance, since those are split anyway.
+        """
+        curve = ctrl[self.seg]
+        diff = _bezier_points(curve, u) - self.points
+        point_err = _row_dot(diff, diff)
+        pair_err = np.zeros(len(u))
+        close = (np.maximum.reduceat(point_err, self.starts) <= tolerance_sq)[self.seg]
+        pairs = np.flatnonzero((self.seg[:-1] == self.seg[1:]) & close[:-1])
+        if samples and len(pairs):
+            # (pairs, samples) parameters between each pair's two points
+            ua, ub = u[pairs, None], u[pairs + 1, None]
+            t = ua + (ub - ua) * (np.arange(1, samples + 1) / (samples + 1))
+            mt = 1.0 - t
+            basis = (mt * mt * mt, 3 * mt * mt * t, 3 * mt * t * t, t * t * t)
+            c = curve[pairs]
+            qx = sum(w * c[:, k, 0, None] for k, w in enumerate(basis))
+            qy = sum(w * c[:, k, 1, None] for k, w in enumerate(basis))
+            a, b = self.points[pairs], self.points[pairs + 1]
+            ab = b - a
+            length_sq = _row_dot(ab, ab)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                s = ((qx - a[:, 0, None]) * ab[:, 0, None] + (qy - a[:, 1, None]) * ab[:, 1, None]) / length_sq[:, None]
+            s = np.clip(np.nan_to_num(s), 0.0, 1.0)
+            dx = qx - (a[:, 0, None] + ab[:, 0, None] * s)
+            dy = qy - (a[:, 1, None] + ab[:, 1, None] * s)
+            pair_err[pairs] = (dx * dx + dy * dy).max(axis=1)
+        return point_err, pair_err
+
+    def reparameterize(self, ctrl, u):
+        """One Newton-Raphson step of every point towards its closest curve parameter."""
+        curve = ctrl[self.seg]
+        d1 = 3 * (curve[:, 1:] - curve[:, :-1])
+        d2 = 2 * (d1[:, 1:] - d1[:, :-1])
+        mt = 1.0 - u
+        q1 = (mt * mt)[:, None] * d1[:, 0] + (2 * mt * u)[:, None] * d1[:, 1] + (u * u)[:, None] * d1[:, 2]
+        q2 = mt[:, None] * d2[:, 0] + u[:, None] * d2[:, 1]
+        diff = _bezier_points(curve, u) - self.points
+        num = _row_dot(diff, q1)
+        den = _row_dot(q1, q1) + _row_dot(diff, q2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = np.where(np.abs(den) > 1e-12, num / den, 0.0)
+        return np.clip(u - step, 0.0, 1.0)
+
+
+def fit_cubic_beziers(points, tolerance, max_iterations=4, samples=3, max_segments=None):
+    """Fit an (n, 2) polyline with cubic Bezier segments within tolerance.
+
+    The error is measured at every point and at samples places on the curve
+    between each pair of consecutive points. All segments of one splitting
+    level are fitted together in a few NumPy passes, so the number of Python
+    iterations is the depth of the splitting, not the number of segments.
+
+    Returns an (m, 4, 2) array of control points; consecutive segments share
+    end points, and tangent directions except where a segment spans only two
+    points and is drawn straight. Returns None as soon as the fit is known to
+    need more than max_segments segments.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points):
+        moved = np.ones(len(points), dtype=bool)
+        moved[1:] = np.any(np.diff(points, axis=0) != 0, axis=1)
+        points = points[moved]
+    n = len(points)
+    if n < 2:
+        return np.empty((0, 4, 2))
+
+    tolerance_sq = tolerance * tolerance
+    first, last = np.array([0]), np.array([n - 1])
+    tan1 = _normalized_rows((points[1] - points[0])[None])
+    tan2 = _normalized_rows((points[-2] - points[-1])[None])
+    fitted_first, fitted = [], []
+    done = 0
+    while len(first):
+        if max_segments is not None and done + len(first) > max_segments:
+            return None
+        pair = last - first == 1
+        if pair.any():
+            # a segment between two samples is the line that was drawn between them
+            p0, p3 = points[first[pair]], points[last[pair]]
+            third = (p3 - p0) / 3.0
+            fitted_first.append(first[pair])
+            fitted.append(np.stack((p0, p0 + third, p3 - third, p3), axis=1))
+            done += len(p0)
+            first, last, tan1, tan2 = first[~pair], last[~pair], tan1[~pair], tan2[~pair]
+            if not len(first):
+                break
+        level = _Segments(points, first, last)
+        u = level.chord_parameters()
+        ctrl = level.fit(u, tan1, tan2)
+        point_err, pair_err = level.errors(ctrl, u, samples, tolerance_sq)
+        seg_err = np.maximum.reduceat(np.maximum(point_err, pair_err), level.starts)
+        # segments that nearly fit get a few reparameterisation steps before they are split
+        retry = (seg_err > tolerance_sq) & (seg_err < tolerance_sq * 16)
+        for _ in range(max_iterations):
+            if not retry.any():
+                break
+            retrying = np.flatnonzero(retry)
+            moving = retry[level.seg]
+            sub = _Segments(points, first[retrying], last[retrying])
+            sub_ctrl = ctrl[retrying]
+            sub_u = sub.reparameterize(sub_ctrl, u[moving])
+            sub_ctrl = sub.fit(sub_u, tan1[retrying], tan2[retrying])
+            u[moving] = sub_u
+            ctrl[retrying] = sub_ctrl
+            point_err[moving], pair_err[moving] = sub.errors(sub_ctrl, sub_u, samples, tolerance_sq)
+            seg_err[retrying] = np.maximum.reduceat(np.maximum(point_err[moving], pair_err[moving]), sub.starts)
+            retry &= seg_err > tolerance_sq
+        fits = seg_err <= tolerance_sq
+        fitted_first.append(first[fits])
+        fitted.append(ctrl[fits])
+        done += int(fits.sum())
+        if fits.all():
+            break
+
+        # split every other segment at the interior point where the curve is farthest off
+        score = np.maximum(point_err, pair_err)
+        score[1:] = np.maximum(score[1:], pair_err[:-1])
+        score[level.starts] = -1.0
+        score[level.ends] = -1.0
+        score[fits[level.seg]] = -1.0
+        at_max = (score >= 0) & (score == np.maximum.reduceat(score, level.starts)[level.seg])
+        candidates = np.flatnonzero(at_max)
+        first_of_segment = np.ones(len(candidates), dtype=bool)
+        first_of_segment[1:] = level.seg[candidates[1:]] != level.seg[candidates[:-1]]
+        candidates = candidates[first_of_segment]
+        owner = level.seg[candidates]
+        split = level.index[candidates]
+        center = _normalized_rows(points[split - 1] - points[split + 1])
+        first = np.concatenate((first[owner], split))
+        last = np.concatenate((split, last[owner]))
+        tan1, tan2 = np.concatenate((tan1[owner], -center)), np.concatenate((center, tan2[owner]))
+
+    order = np.argsort(np.concatenate(fitted_first), kind='stable')
+    return np.concatenate(fitted)[order]
+
+
+def sample_cubic_beziers(curves, spacing):
+    """(n, 2) polyline through (m, 4, 2) Bezier curves, with its points on average at most spacing apart."""
+    curves = np.asarray(curves, dtype=np.float64)
+    if not len(curves):
+        return np.empty((0, 2))
+    # a curve is never longer than its control polygon
+    polygon = np.hypot(*np.diff(curves, axis=1).transpose(2, 0, 1)).sum(axis=1)
+    counts = np.maximum(1, np.ceil(polygon / spacing)).astype(np.int64)
+    seg = np.repeat(np.arange(len(curves)), counts)
+    starts = np.cumsum(counts) - counts
+    t = (np.arange(len(seg)) - starts[seg]) / counts[seg]
+    return np.concatenate((_bezier_points(curves[seg], t), curves[-1, 3][None]))
+
+
+def erase_polyline(points, center, radius):
+    """Pieces of an (n, 2) polyline left after erasing a disc.
+
+    Returns None if the disc misses the polyline, otherwise a list of (k, 2)
+    arrays (empty if nothing is left). Every segment is intersected with the
+    circle in one NumPy pass, and cut where it enters and leaves the disc, so
+    long segments lose only the part under the eraser.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    c = np.asarray(center, dtype=np.float64)
+    r2 = radius * radius
+    if len(points) == 1:
+        d = points[0] - c
+        return [] if float(d @ d) <= r2 else None
+    a = points[:-1]
+    ab = points[1:] - a
+    ac = a - c
+    qa = np.einsum('ij,ij->i', ab, ab)
+    qb = 2 * np.einsum('ij,ij->i', ac, ab)
+    qc = np.einsum('ij,ij->i', ac, ac) - r2
+    disc = qb * qb - 4 * qa * qc
+    root = np.sqrt(np.maximum(disc, 0.0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_in = np.where(qa > 0, (-qb - root) / (2 * qa), 0.0)
+        t_out = np.where(qa > 0, (-qb + root) / (2 * qa), 1.0)
+    # zero-length segments are hit when their point is inside the disc
+    hit = np.where(qa > 0, (disc > 0) & (t_in < 1) & (t_out > 0), qc <= 0)
+    if not hit.any():
+        return None
+    t_in = np.clip(t_in, 0.0, 1.0)
+    t_out = np.clip(t_out, 0.0, 1.0)
+
+    pieces = []
+    lead = points[:0]
+    start = 0
+    for i in np.flatnonzero(hit).tolist():
+        # points[i] only survives if the segment enters the disc after it
+        if t_in[i] > 0:
+            piece = np.concatenate((lead, points[start:i + 1], (a[i] + ab[i] * t_in[i])[None]))
+        else:
+            piece = np.concatenate((lead, points[start:i]))
+        if len(piece) > 1:
+            pieces.append(piece)
+        lead = (a[i] + ab[i] * t_out[i])[None] if t_out[i] < 1 else points[:0]
+        start = i + 1
+    piece = np.concatenate((lead, points[start:]))
+    if len(piece) > 1:
+        pieces.append(piece)
+    return pieces
@@ -0,0 +1,501 @@
+"""Command-based undo/redo.
+
+Every user action is recorded as a small command holding only what changed, so
+undoing or redoing it costs time proportional to the change, not the document.
+Commands are pushed after they have been applied.
+
+The history keeps an estimate of the memory its commands hold. Past a byte
+budget the oldest undo steps are encoded to plain records and moved to a
+compressed temp file, and read back through a memory map when undone.
+"""
+import mmap
+import pickle
+import tempfile
+import zlib
+from collections import deque
+
+from PyQt6.QtCore import QLineF, QPointF, QRectF
+from PyQt6.QtGui import QColor, QFont, QPen
+from PyQt6.QtWidgets import QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsRectItem, QGraphicsTextItem
+
+from annotator.annotations import ANNOTATION_ID
+from annotator.codec import (
+    ItemFactory, decode_item, encode_item, font_from_record, font_to_record, pen_from_record,
+    pen_to_record, record_size
+)
+
+# estimated bytes held by a command besides the items it references
+COMMAND_OVERHEAD_BYTES = 256
+
+
+def capture_geometry(item):
+    if isinstance(item, (QGraphicsRectItem, QGraphicsEllipseItem)):
+        shape = QRectF(item.rect())
+    elif isinstance(item, QGraphicsLineItem):
+        shape = QLineF(item.line())
+    else:
+        shape = None
+    return QPointF(item.pos()), shape
+
+
+def apply_geometry(item, geometry):
+    pos, shape = geometry
+    item.setPos(pos)
+    if isinstance(shape, QRectF):
+        item.setRect(shape)
+    elif isinstance(shape, QLineF):
+        item.setLine(shape)
+    if hasattr(item, 'update_handles'):
+        item.update_handles()
+
+
+def geometry_to_record(geometry):
+    pos, shape = geometry
+    if isinstance(shape, QRectF):
+        shape = ('rect', shape.x(), shape.y(), shape.width(), shape.height())
+    elif isinstance(shape, QLineF):
+        shape = ('line', shape.x1(), shape.y1(), shape.x2(), shape.y2())
+    return pos.x(), pos.y(), shape
+
+
+def geometry_from_record(record):
+    x, y, shape = record
+    if shape is not None:
+        kind, *values = shape
+        shape = QRectF(*values) if kind == 'rect' else QLineF(*values)
+    return QPointF(x, y), shape
+
+
+def capture_style(item):
+    if isinstance(item, QGraphicsTextItem):
+        return QColor(item.defaultTextColor()), QFont(item.font())
+    return QPen(item.pen())
+
+
+def apply_style(item, style):
+    if isinstance(item, QGraphicsTextItem):
+        color, font = style
+        item.setDefaultTextColor(color)
+        item.setFont(font)
+    else:
+        item.setPen(style)
+
+
+def style_to_record(style):
+    if isinstance(style, QPen):
+        return 'pen', pen_to_record(style)
+    color, font = style
+    return 'text', (color.rgba(), font_to_record(font))
+
+
+def style_from_record(record):
+    kind, values = record
+    if kind == 'pen':
+        return pen_from_record(values)
+    rgba, font = values
+    return QColor.fromRgba(rgba), font_from_record(font)
+
+
+def replace_records(records, removed, added):
+    """Drop the removed item records from an id -> record dict and put the added ones in."""
+    for record in removed:
+        records.pop(record[1], None)
+    for record in added:
+        records[record[1]] = record
+
+
+def resolve_item(registry, record, factory):
+    """The live item a record refers to, or a rebuilt one if it is not in the scene."""
+    item = registry.get(record[1])
+    return item if item is not None else decode_item(record, factory)
+
+
+class Command:
+    """One undoable change to the annotations of an AnnotationRegistry."""
+    label = ''
+
+    def undo(self, registry):
+        raise NotImplementedError
+
+    def redo(self, registry):
+        raise NotImplementedError
+
+    def merge(self, other):
+        """Fold a following command into this one; return True if it was absorbed."""
+        return False
+
+    def estimate_size(self):
+        """Approximate bytes kept alive by this command."""
+        return COMMAND_OVERHEAD_BYTES
+
+    def to_record(self):
+        """Plain-data form of the command; items are referred to by annotation id."""
+        raise NotImplementedError
+
+    @classmethod
+    def from_record(cls, record, registry, factory):
+        raise NotImplementedError
+
+    @classmethod
+    def apply_record(cls, record, records, undo=False):
+        """Redo (or undo) a to_record() form on item records keyed by annotation id."""
+        raise NotImplementedError
+
+
+class ItemsCommand(Command):
+    """Base for commands that add or remove whole items."""
+    def __init__(self, items):
+        self.items = list(items)
+
+    def estimate_size(self):
+        return COMMAND_OVERHEAD_BYTES + sum(record_size(encode_item(item)) for item in self.items)
+
+    def to_record(self):
+        return [encode_item(item) for item in self.items]
+
+    @classmethod
+    def from_record(cls, record, registry, factory):
+        return cls([resolve_item(registry, item, factory) for item in record])
+
+
+class AddCommand(ItemsCommand):
+    label = 'add'
+
+    def estimate_size(self):
+        # while undoable the items are in the scene; the command only references them
+        return COMMAND_OVERHEAD_BYTES + 8 * len(self.items)
+
+    def undo(self, registry):
+        for item in reversed(self.items):
+            registry.detach(item)
+
+    def redo(self, registry):
+        for item in self.items:
+            registry.attach(item)
+
+    @classmethod
+    def apply_record(cls, record, records, undo=False):
+        if undo:
+            replace_records(records, record, [])
+        else:
+            replace_records(records, [], record)
+
+
+class RemoveCommand(ItemsCommand):
+    label = 'remove'
+
+    def undo(self, registry):
+        for item in self.items:
+            registry.attach(item)
+
+    def redo(self, registry):
+        for item in reversed(self.items):
+            registry.detach(item)
+
+    @classmethod
+    def apply_record(cls, record, records, undo=False):
+        if undo:
+            replace_records(records, [], record)
+        else:
+            replace_records(records, record, [])
+
+
+class ClearCommand(RemoveCommand):
+    label = 'clear'
+
+
+class ReplaceCommand(Command):
+    """Items swapped for others, e.g. strokes the eraser cut into pieces."""
+    label = 'replace'
+
+    def __init__(self, removed, added):
+        self.removed = list(removed)
+        self.added = list(added)
+
+    def undo(self, registry):
+        for item in reversed(self.added):
+            registry.detach(item)
+        for item in self.removed:
+            registry.attach(item)
+
+    def redo(self, registry):
+        for item in reversed(self.removed):
+            registry.detach(item)
+        for item in self.added:
+            registry.attach(item)
+
+    def estimate_size(self):
+        # the removed items are only kept alive by the command
+        return (COMMAND_OVERHEAD_BYTES + sum(record_size(encode_item(item)) for item in self.removed)
+                + 8 * len(self.added))
+
+    def to_record(self):
+        return [encode_item(item) for item in self.removed], [encode_item(item) for item in self.added]
+
+    @classmethod
+    def from_record(cls, record, registry, factory):
+        removed, added = record
+        return cls([resolve_item(registry, item, factory) for item in removed],
+                   [resolve_item(registry, item, factory) for item in added])
+
+    @classmethod
+    def apply_record(cls, record, records, undo=False):
+        removed, added = record
+        if undo:
+            replace_records(records, added, removed)
+        else:
+            replace_records(records, removed, added)
+
+
+class GeometryCommand(Command):
+    """Position/shape changes, as (item, before, after) geometry triples."""
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def undo(self, registry):
+        for item, before, _ in self.changes:
+            apply_geometry(item, before)
+            registry.changed(item)
+
+    def redo(self, registry):
+        for item, _, after in self.changes:
+            apply_geometry(item, after)
+            registry.changed(item)
+
+    def estimate_size(self):
+        return COMMAND_OVERHEAD_BYTES + 128 * len(self.changes)
+
+    def to_record(self):
+        return [(item.data(ANNOTATION_ID), geometry_to_record(before), geometry_to_record(after))
+                for item, before, after in self.changes]
+
+    @classmethod
+    def from_record(cls, record, registry, factory):
+        # items that are gone already (removed by another peer of a shared session) are skipped
+        return cls([(registry.get(annotation_id), geometry_from_record(before), geometry_from_record(after))
+                    for annotation_id, before, after in record if registry.get(annotation_id) is not None])
+
+    @classmethod
+    def apply_record(cls, record, records, undo=False):
+        for annotation_id, before, after in record:
+            item = records.get(annotation_id)
+            if item is None:
+                continue
+            x, y, shape = before if undo else after
+            geometry = item[6]
+            if shape is not None:
+                # a line's geometry also carries its arrow flag
+                geometry = (*shape[1:], *geometry[4:])
+            records[annotation_id] = (*item[:3], x, y, item[5], geometry)
+
+
+class MoveCommand(GeometryCommand):
+    label = 'move'
+
+
+class ResizeCommand(GeometryCommand):
+    label = 'resize'
+
+
+class RestyleCommand(Command):
+    """Pen/colour/font changes, as (item, before, after) style triples.
+
+    Consecutive restyles of the same items with the same merge_key (e.g. one
+    drag of the size slider) collapse into a single undo step.
+    """
+    label = 'restyle'
+
+    def __init__(self, changes, merge_key=None):
+        self.changes = list(changes)
+        self.merge_key = merge_key
+
+    def undo(self, registry):
+        for item, before, _ in self.changes:
+            apply_style(item, before)
+            registry.changed(item)
+
+    def redo(self, registry):
+        for item, _, after in self.changes:
+            apply_style(item, after)
+            registry.changed(item)
+
+    def merge(self, other):
+        if not isinstance(other, RestyleCommand) or self.merge_key is None or other.merge_key != self.merge_key:
+            return False
+        if [item for item, _, _ in self.changes] != [item for item, _, _ in other.changes]:
+            return False
+        self.changes = [(item, before, after)
+                        for (item, before, _), (_, _, after) in zip(self.changes, other.changes)]
+        return True
+
+    def estimate_size(self):
+        return COMMAND_OVERHEAD_BYTES + 160 * len(self.changes)
+
+    def to_record(self):
+        return ([(item.data(ANNOTATION_ID), style_to_record(before), style_to_record(after))
+                 for item, before, after in self.changes], self.merge_key)
+
+    @classmethod
+    def from_record(cls, record, registry, factory):
+        changes, merge_key = record
+        return cls([(registry.get(annotation_id), style_from_record(before), style_from_record(after))
+                    for annotation_id, before, after in changes if registry.get(annotation_id) is not None],
+                   merge_key)
+
+    @classmethod
+    def apply_record(cls, record, records, undo=False):
+        changes, _ = record
+        for annotation_id, before, after in changes:
+            item = records.get(annotation_id)
+            if item is not None:
+                _, style = before if undo else after
+                records[annotation_id] = (*item[:5], style, item[6])
+
+
+COMMAND_TYPES = {cls.label: cls for cls in (
+    AddCommand, RemoveCommand, ClearCommand, ReplaceCommand, MoveCommand, ResizeCommand, RestyleCommand)}
+
+
+def command_to_bytes(command):
+    return zlib.compress(pickle.dumps((command.label, command.to_record()), pickle.HIGHEST_PROTOCOL), 1)
+
+
+def command_from_bytes(data, registry, factory):
+    label, record = pickle.loads(zlib.decompress(data))
+    return COMMAND_TYPES[label].from_record(record, registry, factory)
+
+
+class SpillFile:
+    """Append-only temp file of encoded commands, read back through a memory map."""
+    def __init__(self):
+        self._file = None
+        self._map = None
+        self.size = 0
+
+    def append(self, data):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='annotator-undo-')
+        self._file.seek(self.size)
+        self._file.write(data)
+        offset = self.size
+        self.size += len(data)
+        return offset, len(data)
+
+    def read(self, offset, length):
+        if self._map is None or len(self._map) < offset + length:
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def reset(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.size = 0
+
+
+class UndoHistory:
+    """Undo/redo stacks of commands, kept within a memory budget.
+
+    The oldest undo steps beyond budget_bytes are spilled to disk rather than
+    dropped; undoing that far loads them back one at a time.
+    """
+    def __init__(self, registry, budget_bytes=None, factory=None):
+        self.registry = registry
+        self.budget_bytes = budget_bytes
+        self.factory = factory or ItemFactory()
+        self.undo_stack = deque()  # (command, estimated size), oldest first
+        self.redo_stack = []
+        self.spilled = []  # (offset, length) in the spill file, oldest first
+        self.memory_bytes = 0
+        self.listeners = []  # called as listener(action, command) after each 'do', 'undo' or 'redo'
+        self._spill_file = SpillFile()
+
+    def push(self, command):
+        self._clear_redo()
+        self._notify('do', command)
+        if self.undo_stack:
+            top, size = self.undo_stack[-1]
+            if top.merge(command):
+                return
+        self._push_undo(command)
+        self._enforce_budget()
+
+    def undo(self):
+        if not self.undo_stack and self.spilled:
+            offset, length = self.spilled.pop()
+            command = command_from_bytes(self._spill_file.read(offset, length), self.registry, self.factory)
+            if not self.spilled:
+                self._spill_file.reset()
+            self._push_undo(command)
+        if not self.undo_stack:
+            return None
+        command, size = self.undo_stack.pop()
+        self.memory_bytes -= size
+        command.undo(self.registry)
+        self._notify('undo', command)
+        self._push_redo(command)
+        return command
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        command, size = self.redo_stack.pop()
+        self.memory_bytes -= size
+        command.redo(self.registry)
+        self._notify('redo', command)
+        self._push_undo(command)
+        self._enforce_budget()
+        return command
+
+    def can_undo(self):
+        return bool(self.undo_stack or self.spilled)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def depth(self):
+        return len(self.undo_stack) + len(self.spilled), len(self.redo_stack)
+
+    def spilled_bytes(self):
+        return self._spill_file.size
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.spilled.clear()
+        self._spill_file.reset()
+        self.memory_bytes = 0
+
+    def _notify(self, action, command):
+        for listener in self.listeners:
+            listener(action, command)
+
+    def _push_undo(self, command):
+        size = command.estimate_size()
+        self.undo_stack.append((command, size))
+        self.memory_bytes += size
+
+    def _push_redo(self, command):
+        size = command.estimate_size()
+        self.redo_stack.append((command, size))
+        self.memory_bytes += size
+
+    def _clear_redo(self):
+        for _, size in self.redo_stack:
+            self.memory_bytes -= size
+        self.redo_stack.clear()
+
+    def _enforce_budget(self):
+        if self.budget_bytes is None:
+            return
+        # keep the newest step in memory so a single undo never touches the disk
+        while self.memory_bytes > self.budget_bytes and len(self.undo_stack) > 1:
+            command, size = self.undo_stack.popleft()
+            self.spilled.append(self._spill_file.append(command_to_bytes(command)))
+            self.memory_bytes -= size
@@ -0,0 +1,193 @@
+"""One overlay per user: later launches hand their command to the running one.
+
+The running overlay listens on a QLocalServer. A later launch connects
+before it loads Qt, sends its command, prints the reply and exits, so a
+hotkey daemon or script gets its answer in milliseconds. On POSIX the server
+listens on a Unix domain socket at a fixed path and the client side uses the
+standard library's socket module. Elsewhere it falls back to QLocalSocket.
+
+A command is one line of JSON, a list of words such as ["tool", "rectangle"].
+The reply is one line of JSON, either {"ok": true} or {"error": message}.
+
+This module is imported before Qt on purpose. Keep its top level to the
+standard library.
+"""
+import getpass
+import json
+import os
+import socket
+import sys
+
+# command -> number of arguments it takes
+COMMANDS = {
+    'activate': 0,  # bring the control window to the front
+    'toggle': 0,
+    'show': 0,
+    'hide': 0,
+    'tool': 1,
+    'clear': 0,
+    'undo': 0,
+    'redo': 0,
+    'export': 1,  # path of the image to write
+    'quit': 0,
+}
+# seconds a launch waits for the running instance to connect and answer
+REPLY_TIMEOUT = 2.0
+
+
+class CommandError(ValueError):
+    """A command the running instance cannot carry out."""
+
+
+def check_command(words):
+    """words as a command to send, with paths made absolute; raises CommandError if it is not one."""
+    if not words or words[0] not in COMMANDS:
+        raise CommandError(f"unknown command {words[0] if words else ''!r}, expected one of {', '.join(COMMANDS)}")
+    name, args = words[0], list(words[1:])
+    if len(args) != COMMANDS[name]:
+        raise CommandError(f"{name} takes {COMMANDS[name]} argument(s), got {len(args)}")
+    if name == 'export':
+        # the running instance has its own working directory
+        args[0] = os.path.abspath(args[0])
+    return [name, *args]
+
+
+def server_name(app):
+    """Where app's instance listens: a socket path on POSIX, a pipe name elsewhere."""
+    name = f"{app}-{getpass.getuser()}"
+    if os.name != 'posix':
+        return name
+    directory = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    return os.path.join(directory, f"{name}.sock")
+
+
+def send_command(name, words, timeout=REPLY_TIMEOUT):
+    """Send a command to the instance listening at name.
+
+    Returns the instance's reply, or None if no instance is listening.
+    """
+    request = (json.dumps(words) + '\n').encode('utf-8')
+    if os.name != 'posix':
+        return _send_qt(name, request, timeout)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(name)
+        except (FileNotFoundError, ConnectionRefusedError):
+            # no socket, or one left behind by an instance that crashed
+            return None
+        sock.sendall(request)
+        reply = b''
+        while not reply.endswith(b'\n'):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+    return _parse_reply(reply)
+
+
+def _send_qt(name, request, timeout):
+    from PyQt6.QtNetwork import QLocalSocket
+
+    sock = QLocalSocket()
+    sock.connectToServer(name)
+    if not sock.waitForConnected(int(timeout * 1000)):
+        return None
+    sock.write(request)
+    sock.waitForBytesWritten(int(timeout * 1000))
+    reply = b''
+    while not reply.endswith(b'\n') and sock.waitForReadyRead(int(timeout * 1000)):
+        reply += bytes(sock.readAll())
+    sock.disconnectFromServer()
+    return _parse_reply(reply)
+
+
+def _parse_reply(data):
+    try:
+        return json.loads(data.decode('utf-8'))
+    except ValueError:
+        return {'error': "no answer from the running instance"}
+
+
+def forward_to_instance(app, argv):
+    """Hand this launch's command to app's running instance.
+
+    Returns the exit status for this launch, or None if it should start an
+    instance of its own: there is none running, the launch asks for a new
+    instance, or it replays a trace.
+    """
+    from annotator.settings import parse_settings
+
+    settings, _ = parse_settings(argv)
+    if not settings.single_instance or settings.replay_input:
+        return None
+    try:
+        reply = send_command(server_name(app), list(settings.command) or ['activate'])
+    except OSError as e:
+        print(f"Could not reach the running instance: {e}", file=sys.stderr)
+        return 1
+    if reply is None:
+        return None
+    if 'error' in reply:
+        print(reply['error'], file=sys.stderr)
+        return 1
+    return 0
+
+
+class ControlServer:
+    """Listens for commands from later launches and passes them to handler(words).
+
+    handler raises CommandError for a command it cannot carry out; the
+    launch that sent it prints the message.
+    """
+    def __init__(self, name, handler):
+        from PyQt6.QtNetwork import QLocalServer
+
+        self.name = name
+        self.handler = handler
+        self.server = QLocalServer()
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        self.server.newConnection.connect(self._accept)
+        self._buffers = {}  # socket -> bytes received so far
+
+    def listen(self):
+        """Start listening; returns False if another live instance holds the name."""
+        from PyQt6.QtNetwork import QLocalServer
+
+        if self.server.listen(self.name):
+            return True
+        if send_command(self.name, ['activate']) is not None:
+            return False
+        # the last instance crashed and left its socket behind
+        QLocalServer.removeServer(self.name)
+        return self.server.listen(self.name)
+
+    def close(self):
+        self.server.close()
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            sock = self.server.nextPendingConnection()
+            self._buffers[sock] = b''
+            sock.readyRead.connect(lambda sock=sock: self._read(sock))
+            sock.disconnected.connect(lambda sock=sock: self._drop(sock))
+
+    def _read(self, sock):
+        data = self._buffers.get(sock, b'') + bytes(sock.readAll())
+        if not data.endswith(b'\n'):
+            self._buffers[sock] = data
+            return
+        self._buffers[sock] = b''
+        try:
+            words = check_command(json.loads(data.decode('utf-8')))
+            self.handler(words)
+            reply = {'ok': True}
+        except (ValueError, TypeError) as e:  # CommandError is a ValueError
+            reply = {'error': str(e)}
+        sock.write((json.dumps(reply) + '\n').encode('utf-8'))
+        sock.flush()
+        sock.disconnectFromServer()
+
+    def _drop(self, sock):
+        self._buffers.pop(sock, None)
+        sock.deleteLater()
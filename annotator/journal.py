@@ -0,0 +1,236 @@
+"""Crash-safe autosave journal.
+
+Every step the undo history takes (a new command, an undo, a redo) is appended
+to a log as a length- and CRC-framed record of the command, encoded on the GUI
+thread as plain data and written, batched and fsync'ed, by a background thread.
+Every COMPACT_EVERY steps the log is folded into a snapshot of the current
+annotations and a fresh log is started. The writer keeps the annotations as
+plain records, updated from the entries it writes, so a snapshot costs the GUI
+thread nothing after the first.
+
+After a crash, recover() loads the snapshot and replays the log. A torn record
+at the end of the log (the process died mid-write) ends the replay. Undo and
+redo steps are logged with the command they applied, so replay never needs the
+undo history of the crashed session; the recovered session starts a new one.
+"""
+import os
+import pickle
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from annotator.codec import decode_item, encode_item
+from annotator.history import COMMAND_TYPES
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.screen_annotation', 'journal')
+SNAPSHOT_NAME = 'snapshot'
+LOG_PREFIX = 'journal-'
+# entries since the last snapshot before the log is compacted
+COMPACT_EVERY = 1000
+# seconds the writer waits for more entries before writing a batch
+FLUSH_INTERVAL = 0.25
+
+FRAME = struct.Struct('<II')  # payload length, crc32 of payload
+SNAPSHOT_HEADER = struct.Struct('<Q')  # generation
+
+
+def _log_path(directory, generation):
+    return os.path.join(directory, f'{LOG_PREFIX}{generation}.log')
+
+
+def _frame(payload):
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(path):
+    """Payloads of a log up to the first torn or corrupt record."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    offset = 0
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        payload = data[offset + FRAME.size:offset + FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield payload
+        offset += FRAME.size + length
+
+
+class JournalError(ValueError):
+    """The snapshot of a journal cannot be read."""
+
+
+def _read_snapshot(directory):
+    try:
+        with open(os.path.join(directory, SNAPSHOT_NAME), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return 0, []
+    try:
+        (generation,) = SNAPSHOT_HEADER.unpack_from(data, 0)
+        return generation, pickle.loads(zlib.decompress(data[SNAPSHOT_HEADER.size:]))
+    except (struct.error, zlib.error, pickle.UnpicklingError, EOFError) as e:
+        raise JournalError(f"damaged journal snapshot: {e}") from e
+
+
+def has_session(directory=DEFAULT_JOURNAL_DIR):
+    """True if a journal was left behind by a session that did not exit cleanly."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return False
+    return any(name.startswith((SNAPSHOT_NAME, LOG_PREFIX)) for name in names)
+
+
+def recover(registry, factory, directory=DEFAULT_JOURNAL_DIR):
+    """Rebuild the annotations of a crashed session; returns the number of log entries replayed."""
+    generation, records = _read_snapshot(directory)
+    for record in records:
+        registry.attach(decode_item(record, factory))
+    replayed = 0
+    for payload in _read_frames(_log_path(directory, generation)):
+        action, label, record = pickle.loads(zlib.decompress(payload))
+        command = COMMAND_TYPES[label].from_record(record, registry, factory)
+        if action == 'undo':
+            command.undo(registry)
+        else:
+            command.redo(registry)
+        replayed += 1
+    return replayed
+
+
+def discard_session(directory=DEFAULT_JOURNAL_DIR):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith((SNAPSHOT_NAME, LOG_PREFIX)):
+            os.unlink(os.path.join(directory, name))
+
+
+class Journal(QObject):
+    """Append-only log of history steps, written by a background thread.
+
+    record() only encodes the command into plain records and queues them, so
+    the GUI thread never waits on the disk. Call start() once the registry
+    holds the session's initial annotations, and close() on a clean exit.
+    The first write error stops the journal and is reported through failed.
+    """
+    failed = pyqtSignal(str)
+
+    def __init__(self, registry, directory=DEFAULT_JOURNAL_DIR, compact_every=COMPACT_EVERY, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self.directory = directory
+        self.compact_every = compact_every
+        self.error = None  # first OSError hit by the writer thread; nothing is written after it
+        self._since_snapshot = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='annotation-journal', daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+        self._queue.put(('snapshot', [encode_item(item) for item in self.registry]))
+
+    def __call__(self, action, command):
+        """UndoHistory listener: log one step ('do', 'undo' or 'redo')."""
+        self.record(action, command)
+
+    def record(self, action, command):
+        if self.error is not None:
+            return
+        self._queue.put(('entry', (action, command.label, command.to_record())))
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Replace the log with a snapshot of the current annotations, taken by the writer."""
+        self._queue.put(('compact', None))
+        self._since_snapshot = 0
+
+    def close(self, discard_files=True):
+        """Write what is queued and stop; a clean exit leaves nothing to recover."""
+        if self._thread.is_alive():
+            self._queue.put(('close', discard_files))
+            self._thread.join()
+
+    def _run(self):
+        try:
+            generation, _ = _read_snapshot(self.directory)
+        except (OSError, JournalError):
+            generation = 0
+        records = {}  # annotation id -> record, as the log has left them
+        log = None
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            # gather whatever else arrives shortly, so a burst costs one write
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            try:
+                while batch[-1][0] == 'entry' and time.monotonic() < deadline:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            for kind, value in batch:
+                if kind == 'entry':
+                    action, label, record = value
+                    COMMAND_TYPES[label].apply_record(record, records, undo=action == 'undo')
+                elif kind == 'snapshot':
+                    records = {record[1]: record for record in value}
+                if self.error is not None and kind != 'close':
+                    continue
+                try:
+                    if kind == 'entry':
+                        if log is None:
+                            log = open(_log_path(self.directory, generation), 'ab')
+                        log.write(_frame(zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), 1)))
+                        continue
+                    if log is not None:
+                        log.close()
+                        log = None
+                    if kind in ('snapshot', 'compact'):
+                        generation = self._write_snapshot(generation + 1, list(records.values()))
+                    else:
+                        running = False
+                        if value:
+                            discard_session(self.directory)
+                except OSError as e:
+                    self._failed(e)
+            if log is not None:
+                try:
+                    log.flush()
+                    os.fsync(log.fileno())
+                except OSError as e:
+                    self._failed(e)
+        if log is not None:
+            log.close()
+
+    def _failed(self, error):
+        if self.error is None:
+            self.error = error
+            self.failed.emit(str(error))
+
+    def _write_snapshot(self, generation, records):
+        path = os.path.join(self.directory, SNAPSHOT_NAME)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(generation))
+            f.write(zlib.compress(pickle.dumps(records, pickle.HIGHEST_PROTOCOL), 1))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # the snapshot now covers every older log
+        for name in os.listdir(self.directory):
+            if name.startswith(LOG_PREFIX) and name != os.path.basename(_log_path(self.directory, generation)):
+                os.unlink(os.path.join(self.directory, name))
+        return generation
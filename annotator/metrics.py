@@ -0,0 +1,129 @@
+import csv
+import json
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+METRICS_FILTER = "Metrics JSON (*.json);;Metrics CSV (*.csv)"
+
+# paints further apart than this are separated by idle time, not frames
+FRAME_GAP_MS = 250.0
+
+# (series, label) of the timings the HUD shows, in milliseconds
+HUD_TIMINGS = (
+    ('input.to_paint', 'input->paint'),
+    ('frame.paint', 'paint'),
+    ('input.move', 'move'),
+    ('scene.update', 'scene update'),
+    ('history.push', 'history'),
+    ('sync.rtt', 'sync rtt'),
+)
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class Metrics:
+    """Named ring buffers of recent samples, cheap enough to feed from hot paths.
+
+    Timings are recorded in milliseconds. Input handlers call input_received()
+    and views frame_painted(), which together give the latency from the first
+    unpainted input to the frame that shows it.
+    """
+    def __init__(self, capacity=512):
+        self.capacity = capacity
+        self._series = {}
+        self._input_at = None  # perf_counter() of the oldest input no frame has shown yet
+        self._last_frame = None
+
+    def record(self, name, value):
+        series = self._series.get(name)
+        if series is None:
+            series = self._series[name] = deque(maxlen=self.capacity)
+        series.append(value)
+
+    @contextmanager
+    def timing(self, name):
+        """Record how long the block takes under name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def input_received(self):
+        if self._input_at is None:
+            self._input_at = time.perf_counter()
+
+    def frame_painted(self, paint_ms):
+        now = time.perf_counter()
+        self.record('frame.paint', paint_ms)
+        if self._last_frame is not None and (now - self._last_frame) * 1000 <= FRAME_GAP_MS:
+            self.record('frame.interval', (now - self._last_frame) * 1000)
+        self._last_frame = now
+        if self._input_at is not None:
+            self.record('input.to_paint', (now - self._input_at) * 1000)
+            self._input_at = None
+
+    def values(self, name):
+        return list(self._series.get(name, ()))
+
+    def summary(self):
+        result = {}
+        for name, series in self._series.items():
+            if not series:
+                continue
+            ordered = sorted(series)
+            result[name] = {
+                'count': len(series),
+                'last': series[-1],
+                'mean': sum(series) / len(series),
+                'min': ordered[0],
+                'p50': _percentile(ordered, 0.50),
+                'p95': _percentile(ordered, 0.95),
+                'max': ordered[-1],
+            }
+        return result
+
+    def hud_lines(self):
+        """Short text lines summarising recent timings, counts and history size."""
+        summary = self.summary()
+        lines = []
+        for name, label in HUD_TIMINGS:
+            stats = summary.get(name)
+            if stats is not None:
+                lines.append(f"{label:<13}p50 {stats['p50']:6.1f}  p95 {stats['p95']:6.1f} ms")
+        interval = summary.get('frame.interval')
+        if interval is not None and interval['p50'] > 0:
+            lines.append(f"{'frame rate':<13}{1000 / interval['p50']:6.0f} fps")
+        if 'scene.items' in summary:
+            lines.append(f"{'items':<13}{summary['scene.items']['last']:6d}")
+        if 'history.steps' in summary:
+            lines.append(f"{'undo':<13}{summary['history.steps']['last']:6d} steps, "
+                         f"{summary['history.bytes']['last'] / (1024 * 1024):.1f} MB")
+        return lines
+
+    def write(self, path, context=None):
+        """Dump every sample to path: CSV (series, sample, value) for .csv, else JSON with a summary."""
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(('series', 'sample', 'value'))
+                for name, series in sorted(self._series.items()):
+                    writer.writerows((name, i, value) for i, value in enumerate(series))
+            return
+        report = {
+            'captured_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'capacity': self.capacity,
+            'context': context or {},
+            'summary': self.summary(),
+            'samples': {name: list(series) for name, series in sorted(self._series.items())},
+        }
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+# process-wide instance used by the overlays
+metrics = Metrics()
@@ -0,0 +1,53 @@
+from PyQt6.QtCore import Qt, QObject, QTimer, QElapsedTimer
+from PyQt6.QtGui import QGuiApplication
+
+from annotator.metrics import metrics
+
+
+class InputCoalescer(QObject):
+    """Buffers pointer samples and hands them over at most once per display frame.
+
+    Every pushed sample is delivered, in order; only the number of scene updates
+    is capped. A sample arriving after an idle period is applied right away, so
+    the cap adds no latency to slow movements.
+    """
+    def __init__(self, apply_samples, max_fps=0.0, parent=None):
+        super().__init__(parent)
+        self._apply_samples = apply_samples
+        self._pending = []
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self.flush)
+        self._since_flush = QElapsedTimer()
+        self.interval_ms = 16
+        self.set_max_fps(max_fps)
+
+    def set_max_fps(self, fps):
+        if fps <= 0:
+            screen = QGuiApplication.primaryScreen()
+            fps = screen.refreshRate() if screen and screen.refreshRate() > 0 else 60.0
+        self.interval_ms = max(1, int(round(1000.0 / fps)))
+
+    def push(self, pos):
+        self._pending.append(pos)
+        if self._timer.isActive():
+            return
+        if not self._since_flush.isValid() or self._since_flush.elapsed() >= self.interval_ms:
+            self.flush()
+        else:
+            self._timer.start(self.interval_ms - self._since_flush.elapsed())
+
+    def flush(self):
+        self._timer.stop()
+        if not self._pending:
+            return
+        samples, self._pending = self._pending, []
+        self._since_flush.start()
+        metrics.record('input.batch', len(samples))
+        with metrics.timing('scene.update'):
+            self._apply_samples(samples)
+
+    def discard(self):
+        self._timer.stop()
+        self._pending = []
@@ -0,0 +1,299 @@
+"""Input traces: record what reaches an overlay and play it back.
+
+A trace is a gzip stream of a small header and one record per event, each a
+(microseconds since the previous event, kind) pair followed by a kind-specific
+payload:
+
+    PRESS/MOVE/RELEASE  scene position (float32 x2) and mouse buttons
+    KEY                 Qt key and keyboard modifiers of key_press_event
+    CLICK               index of a clicked control window button
+    TOOL/COLOR/SIZE     the drawing tool, colour or brush size being set
+    OVERLAY             the overlay being shown or hidden
+    ANSWER              what a dialog returned, as JSON
+
+Positions are stored in scene (desktop) coordinates, so a trace replays on any
+overlay whose screens cover them. Dialog answers are handed back to the same
+dialogs on replay instead of showing them, which keeps a replay free of modal
+prompts and makes it reproduce the session exactly.
+"""
+import gzip
+import json
+import struct
+from collections import deque
+
+from PyQt6.QtCore import QElapsedTimer, QEvent, QObject, QPointF, QTimer, Qt, pyqtSignal
+from PyQt6.QtGui import QColor, QKeyEvent, QMouseEvent
+from PyQt6.QtWidgets import QAbstractButton, QApplication
+
+MAGIC = b'STRC'
+VERSION = 1
+TRACE_SUFFIX = '.strace'
+
+HEADER = struct.Struct('<4sH')  # magic, version
+EVENT = struct.Struct('<IB')  # microseconds since the previous event, kind
+
+PRESS, MOVE, RELEASE, KEY, CLICK, TOOL, COLOR, SIZE, OVERLAY, ANSWER = range(1, 11)
+POINTER = struct.Struct('<ffI')  # scene x, y, buttons
+KEYS = struct.Struct('<iI')  # key, modifiers
+INDEX = struct.Struct('<H')
+RGBA = struct.Struct('<I')
+VALUE = struct.Struct('<i')
+FLAG = struct.Struct('<B')
+LENGTH = struct.Struct('<I')  # length of the UTF-8 payload that follows
+
+MOUSE_KINDS = {
+    QEvent.Type.MouseButtonPress: PRESS,
+    QEvent.Type.MouseMove: MOVE,
+    QEvent.Type.MouseButtonRelease: RELEASE,
+}
+MOUSE_TYPES = {kind: event_type for event_type, kind in MOUSE_KINDS.items()}
+
+# events handled per turn of the event loop when replaying as fast as possible
+REPLAY_BATCH = 64
+
+
+class TraceError(ValueError):
+    """The file is not a trace this version can read."""
+
+
+class InputRecorder(QObject):
+    """Writes the input reaching an overlay to a trace file as it happens.
+
+    watch() hooks a view's viewport as an event filter and watch_buttons()
+    the buttons of a control window; the overlay reports keys, tool, colour,
+    size and overlay changes and dialog answers itself.
+    """
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.events = 0
+        self._file = gzip.open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION))
+        self._clock = QElapsedTimer()
+        self._clock.start()
+        self._last_us = 0
+        self._views = {}  # viewport -> view
+
+    def watch(self, view):
+        self._views[view.viewport()] = view
+        view.viewport().installEventFilter(self)
+
+    def watch_buttons(self, window, exclude=()):
+        """Record clicks on window's buttons, except those whose effect is recorded as a tool, colour or overlay change."""
+        for index, button in enumerate(window.findChildren(QAbstractButton)):
+            if button not in exclude:
+                button.clicked.connect(lambda checked=False, index=index: self._write(CLICK, INDEX.pack(index)))
+
+    def eventFilter(self, obj, event):
+        kind = MOUSE_KINDS.get(event.type())
+        # hover moves change nothing; only drags are recorded
+        if kind is not None and (kind != MOVE or event.buttons() != Qt.MouseButton.NoButton):
+            view = self._views.get(obj)
+            if view is not None:
+                # mapToScene() would round the position to whole pixels
+                pos = view.viewportTransform().inverted()[0].map(event.position())
+                buttons = event.buttons().value if kind != RELEASE else event.button().value
+                self._write(kind, POINTER.pack(pos.x(), pos.y(), buttons))
+        return False
+
+    def key(self, event):
+        self._write(KEY, KEYS.pack(event.key(), event.modifiers().value))
+
+    def tool(self, name):
+        self._write_text(TOOL, name)
+
+    def color(self, color: QColor):
+        self._write(COLOR, RGBA.pack(color.rgba()))
+
+    def size(self, value):
+        self._write(SIZE, VALUE.pack(int(value)))
+
+    def overlay(self, shown):
+        self._write(OVERLAY, FLAG.pack(bool(shown)))
+
+    def answer(self, value):
+        self._write_text(ANSWER, json.dumps(value))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_text(self, kind, text):
+        data = text.encode('utf-8')
+        self._write(kind, LENGTH.pack(len(data)) + data)
+
+    def _write(self, kind, payload):
+        if self._file is None:
+            return
+        now_us = self._clock.nsecsElapsed() // 1000
+        delta = min(now_us - self._last_us, 0xFFFFFFFF)
+        self._last_us = now_us
+        self._file.write(EVENT.pack(delta, kind) + payload)
+        self.events += 1
+
+
+def read_trace(path):
+    """[(seconds since the start, kind, value)] of a trace; a torn last record is dropped."""
+    chunks = []
+    with gzip.open(path, 'rb') as f:
+        try:
+            while True:
+                chunk = f.read(1 << 16)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except EOFError:  # the recording process died before closing the stream
+            pass
+    data = b''.join(chunks)
+    if len(data) < HEADER.size or HEADER.unpack_from(data, 0)[0] != MAGIC:
+        raise TraceError(f"{path} is not an input trace")
+    version = HEADER.unpack_from(data, 0)[1]
+    if version > VERSION:
+        raise TraceError(f"{path} was written by a newer version (format {version})")
+    events = []
+    offset = HEADER.size
+    elapsed_us = 0
+    try:
+        while offset < len(data):
+            delta, kind = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            if kind in (PRESS, MOVE, RELEASE):
+                value = POINTER.unpack_from(data, offset)
+                offset += POINTER.size
+            elif kind == KEY:
+                value = KEYS.unpack_from(data, offset)
+                offset += KEYS.size
+            elif kind == CLICK:
+                (value,) = INDEX.unpack_from(data, offset)
+                offset += INDEX.size
+            elif kind == COLOR:
+                (value,) = RGBA.unpack_from(data, offset)
+                offset += RGBA.size
+            elif kind == SIZE:
+                (value,) = VALUE.unpack_from(data, offset)
+                offset += VALUE.size
+            elif kind == OVERLAY:
+                value = bool(FLAG.unpack_from(data, offset)[0])
+                offset += FLAG.size
+            elif kind in (TOOL, ANSWER):
+                (length,) = LENGTH.unpack_from(data, offset)
+                offset += LENGTH.size
+                if offset + length > len(data):
+                    break
+                value = data[offset:offset + length].decode('utf-8')
+                if kind == ANSWER:
+                    value = json.loads(value)
+                offset += length
+            else:
+                raise TraceError(f"unknown event kind {kind} in {path}")
+            elapsed_us += delta
+            events.append((elapsed_us / 1e6, kind, value))
+    except struct.error:
+        pass
+    return events
+
+
+class InputReplayer(QObject):
+    """Feeds a recorded trace back into an overlay.
+
+    Mouse events are sent to the view under their scene position, keys to
+    key_press_event and button clicks to the control window's buttons, exactly
+    as recorded. With speed 1 events keep their original timing; speed 0 plays
+    them as fast as the overlay takes them, still letting the event loop run
+    between batches so frames are painted.
+    """
+    finished = pyqtSignal()
+
+    def __init__(self, path, speed=1.0, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.speed = speed
+        self.events = read_trace(path)
+        # dialogs are answered in the order they were asked
+        self._answers = deque(value for _, kind, value in self.events if kind == ANSWER)
+        self._next = 0
+        self._overlay = None
+        self._buttons = []
+        self._pressed_view = None
+        self._clock = QElapsedTimer()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.timeout.connect(self._step)
+
+    @property
+    def done(self):
+        return self._next >= len(self.events)
+
+    def start(self, overlay):
+        self._overlay = overlay
+        self._buttons = overlay.control_window.findChildren(QAbstractButton)
+        self._clock.start()
+        self._timer.start(0)
+
+    def answer(self, default=None):
+        """The next recorded dialog answer, or default if the trace has no more."""
+        return self._answers.popleft() if self._answers else default
+
+    def _step(self):
+        if self.speed > 0:
+            now = self._clock.nsecsElapsed() / 1e9 * self.speed
+            while not self.done and self.events[self._next][0] <= now:
+                self._apply(*self.events[self._next][1:])
+                self._next += 1
+        else:
+            for _ in range(REPLAY_BATCH):
+                if self.done:
+                    break
+                self._apply(*self.events[self._next][1:])
+                self._next += 1
+        if self.done:
+            self.finished.emit()
+            return
+        if self.speed > 0:
+            wait = (self.events[self._next][0] - self._clock.nsecsElapsed() / 1e9 * self.speed) / self.speed
+            self._timer.start(max(0, int(wait * 1000)))
+        else:
+            self._timer.start(0)
+
+    def _apply(self, kind, value):
+        overlay = self._overlay
+        if kind in MOUSE_TYPES:
+            self._pointer(kind, *value)
+        elif kind == KEY:
+            key, modifiers = value
+            overlay.key_press_event(QKeyEvent(QEvent.Type.KeyPress, key, Qt.KeyboardModifier(modifiers)))
+        elif kind == CLICK:
+            if value < len(self._buttons):
+                self._buttons[value].click()
+        # a replayed key may already have made the change
+        elif kind == TOOL:
+            if value != overlay.current_tool:
+                overlay.select_tool(value)
+        elif kind == COLOR:
+            color = QColor.fromRgba(value)
+            if color != overlay.current_color:
+                overlay.set_color(color)
+        elif kind == SIZE:
+            overlay.size_slider.setValue(value)
+        elif kind == OVERLAY:
+            if value != overlay.overlay_active:
+                overlay.show_overlay() if value else overlay.hide_overlay()
+
+    def _pointer(self, kind, x, y, buttons):
+        pos = QPointF(x, y)
+        if kind == PRESS or self._pressed_view is None:
+            # the screen under the press receives the whole drag
+            overlays = list(self._overlay.drawings.overlays.values())
+            target = next((o for o in overlays if o.rect.contains(pos)), overlays[0])
+            self._pressed_view = target.view
+        view = self._pressed_view
+        local = view.viewportTransform().map(pos)
+        button = Qt.MouseButton.NoButton if kind == MOVE else Qt.MouseButton(buttons)
+        held = Qt.MouseButton.NoButton if kind == RELEASE else Qt.MouseButton(buttons)
+        event = QMouseEvent(MOUSE_TYPES[kind], local, view.viewport().mapToGlobal(local), button, held,
+                            Qt.KeyboardModifier.NoModifier)
+        QApplication.sendEvent(view.viewport(), event)
+        if kind == RELEASE:
+            self._pressed_view = None
@@ -0,0 +1,243 @@
+"""Relay server of shared annotation sessions.
+
+Every overlay in a session connects to one relay over TCP. The relay gives
+each a peer id and forwards what it sends to the others. It never looks inside
+the deltas, so it needs neither Qt nor numpy:
+
+    python -m annotator.relay --port 8765
+
+Relay(host, 0).start() runs one on a free port in a background thread, e.g.
+for a test. Every message is a FRAME header followed by its payload. The
+header's peer byte is the target on the way in (EVERYONE for all other
+peers) and the sender on the way out (0 for the relay itself):
+
+    HELLO    peer -> relay   protocol version, then the peer's name (UTF-8)
+    WELCOME  relay -> peer   JSON: the peer's id, the others' names, how
+                             many logged OPS messages follow and how many
+                             were dropped from the log
+    JOINED   relay -> peers  the new peer's name (UTF-8)
+    LEFT     relay -> peers  no payload
+    OPS      committed changes; logged and replayed to peers that join later
+    LIVE     strokes being drawn; forwarded only
+    PING     forwarded; the receiver answers with a PONG back to the sender
+    PONG     forwarded to its target
+
+The log keeps the OPS messages of the session, so a late joiner rebuilds the
+document from it. It lives only as long as the relay does, and beyond
+max_log_bytes its oldest messages are dropped; joiners are told how many
+(WELCOME 'dropped'), and changes to items they never saw are skipped.
+"""
+import argparse
+import collections
+import json
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 8765
+# peer ids are 1..MAX_PEERS - 1; each peer's annotation ids are its own residue modulo MAX_PEERS
+MAX_PEERS = 256
+EVERYONE = 0
+# largest payload the relay accepts in one message
+MAX_PAYLOAD = 64 * 1024 * 1024
+# OPS bytes the log keeps for peers that join later
+MAX_LOG_BYTES = 256 * 1024 * 1024
+
+FRAME = struct.Struct('<IBB')  # payload length, message type, peer
+HELLO_HEADER = struct.Struct('<H')  # protocol version
+HELLO, WELCOME, JOINED, LEFT, OPS, LIVE, PING, PONG = range(1, 9)
+
+
+def frame(kind, peer, payload=b''):
+    return FRAME.pack(len(payload), kind, peer) + payload
+
+
+def read_frame(rfile):
+    """(kind, peer, payload) of the next message, or None once the stream ends."""
+    header = rfile.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return None
+    length, kind, peer = FRAME.unpack(header)
+    if length > MAX_PAYLOAD:
+        return None
+    payload = rfile.read(length)
+    if len(payload) < length:
+        return None
+    return kind, peer, payload
+
+
+class _PeerHandler(socketserver.StreamRequestHandler):
+    """Reads one peer's messages; a writer thread sends what is queued for it.
+
+    Messages for a peer are only queued under the relay's lock, so a peer that
+    reads slowly, or a joiner being sent a long log, holds up no one else.
+    """
+    def setup(self):
+        super().setup()
+        self.peer = None
+        self.name = ''
+        self.outbox = queue.Queue()  # frames, tuples of logged (sender, payload), or None to stop
+        self._writer = threading.Thread(target=self._write, name='annotation-relay-writer', daemon=True)
+
+    def handle(self):
+        message = read_frame(self.rfile)
+        if message is None or message[0] != HELLO or len(message[2]) < HELLO_HEADER.size:
+            return
+        (version,) = HELLO_HEADER.unpack_from(message[2])
+        if version != PROTOCOL_VERSION:
+            return
+        self.name = message[2][HELLO_HEADER.size:].decode('utf-8', 'replace')
+        self._writer.start()
+        if not self.server.join(self):
+            return
+        while True:
+            message = read_frame(self.rfile)
+            if message is None:
+                break
+            kind, target, payload = message
+            if kind in (OPS, LIVE, PING, PONG):
+                self.server.forward(self.peer, kind, target, payload)
+
+    def finish(self):
+        self.server.leave(self)
+        if self._writer.is_alive():
+            self.outbox.put(None)
+            self._writer.join()
+        super().finish()
+
+    def send(self, data):
+        """Queue a frame, or a tuple of logged OPS messages, for the writer thread."""
+        self.outbox.put(data)
+
+    def _write(self):
+        failed = False
+        while True:
+            data = self.outbox.get()
+            if data is None:
+                return
+            if failed:
+                continue
+            try:
+                if isinstance(data, tuple):
+                    for sender, payload in data:
+                        self.request.sendall(frame(OPS, sender, payload))
+                else:
+                    self.request.sendall(data)
+            except OSError:
+                # the reading thread sees the connection end and leaves the session
+                failed = True
+                self.server.drop(self)
+
+
+class Relay(socketserver.ThreadingTCPServer):
+    """Forwards messages between the peers of one session and logs its committed changes.
+
+    Messages are queued for the peers under one lock, so every peer sees
+    every other peer's messages in the order they were sent, and a joiner gets
+    each OPS message exactly once: either from the log or forwarded live.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, max_log_bytes=MAX_LOG_BYTES):
+        super().__init__((host, port), _PeerHandler)
+        self.lock = threading.Lock()
+        self.peers = {}  # peer id -> _PeerHandler
+        self.log = collections.deque()  # (sender, payload) of the logged OPS messages, oldest first
+        self.log_bytes = 0
+        self.max_log_bytes = max_log_bytes
+        self.dropped = 0  # OPS messages dropped from the front of the log
+        self._thread = None
+
+    def start(self):
+        """Serve from a background thread; returns the (host, port) it listens on."""
+        self._thread = threading.Thread(target=self.serve_forever, name='annotation-relay', daemon=True)
+        self._thread.start()
+        return self.server_address[:2]
+
+    def stop(self):
+        self.shutdown()
+        with self.lock:
+            for handler in list(self.peers.values()):
+                self.drop(handler)
+        self.server_close()
+
+    def join(self, handler):
+        with self.lock:
+            peer = next((p for p in range(1, MAX_PEERS) if p not in self.peers), None)
+            if peer is None:
+                return False
+            handler.peer = peer
+            welcome = {'peer': peer, 'peers': {str(p): h.name for p, h in self.peers.items()},
+                       'log': len(self.log), 'dropped': self.dropped}
+            handler.send(frame(WELCOME, 0, json.dumps(welcome).encode('utf-8')))
+            # the writer sends a snapshot of the log, outside the lock
+            if self.log:
+                handler.send(tuple(self.log))
+            self.peers[peer] = handler
+            joined = frame(JOINED, peer, handler.name.encode('utf-8'))
+            for other in list(self.peers.values()):
+                if other is not handler:
+                    other.send(joined)
+        return True
+
+    def leave(self, handler):
+        with self.lock:
+            if handler.peer is None or self.peers.get(handler.peer) is not handler:
+                return
+            del self.peers[handler.peer]
+            left = frame(LEFT, handler.peer)
+            for other in list(self.peers.values()):
+                other.send(left)
+
+    def drop(self, handler):
+        """Close a peer's connection; its handler thread then leaves the session."""
+        try:
+            # shutdown() also wakes the handler's blocked read, close() alone does not
+            handler.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def forward(self, sender, kind, target, payload):
+        data = frame(kind, sender, payload)
+        with self.lock:
+            if kind == OPS:
+                self.log.append((sender, payload))
+                self.log_bytes += len(payload)
+                while self.log_bytes > self.max_log_bytes and len(self.log) > 1:
+                    self.log_bytes -= len(self.log.popleft()[1])
+                    self.dropped += 1
+            if target != EVERYONE:
+                handler = self.peers.get(target)
+                if handler is not None:
+                    handler.send(data)
+                return
+            for peer, handler in list(self.peers.items()):
+                if peer != sender:
+                    handler.send(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Relay server for shared annotation sessions.")
+    parser.add_argument('--host', default='0.0.0.0', help="interface to listen on (default: all)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument('--max-log-mb', type=float, default=MAX_LOG_BYTES / 2 ** 20,
+                        help="MB of changes kept for peers that join later (default: %(default)g)")
+    args = parser.parse_args(argv)
+    relay = Relay(args.host, args.port, int(args.max_log_mb * 2 ** 20))
+    host, port = relay.server_address[:2]
+    print(f"Relay listening on {host}:{port}", file=sys.stderr)
+    try:
+        relay.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        relay.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import math
+
+from PyQt6.QtCore import Qt, QPointF, QRectF
+from PyQt6.QtWidgets import QGraphicsScene, QGraphicsView, QVBoxLayout, QWidget
+
+from annotator.annotations import ANNOTATION_ID, AnnotationRegistry
+
+
+class ScreenOverlay:
+    """The translucent overlay window, view, scene and registry of one screen.
+
+    The scene rect is the screen's geometry in desktop coordinates, so an item
+    has the same coordinates whichever screen shows it, and documents, the
+    journal and exports need not know how many screens there are.
+    """
+    def __init__(self, screen, view: QGraphicsView, layer=None):
+        self.screen = screen
+        self.rect = QRectF(screen.geometry())
+        self.widget = QWidget()
+        self.widget.setWindowFlags(Qt.WindowType.WindowStaysOnTopHint | Qt.WindowType.FramelessWindowHint)
+        self.widget.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+        self.widget.setGeometry(screen.geometry())
+        layout = QVBoxLayout(self.widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.view = view
+        self.scene = QGraphicsScene(self.rect)
+        view.setScene(self.scene)
+        view.setSceneRect(self.rect)
+        layout.addWidget(view)
+        self.widget.hide()
+        self.registry = AnnotationRegistry(self.scene, layer)
+
+    def show(self):
+        self.widget.setGeometry(self.screen.geometry())
+        self.widget.showFullScreen()
+        self.widget.raise_()
+
+    def hide(self):
+        self.widget.hide()
+
+    def close(self):
+        self.widget.close()
+        self.widget.deleteLater()
+
+
+def _distance(rect: QRectF, point: QPointF):
+    dx = max(rect.left() - point.x(), 0.0, point.x() - rect.right())
+    dy = max(rect.top() - point.y(), 0.0, point.y() - rect.bottom())
+    return math.hypot(dx, dy)
+
+
+class ScreenDocument:
+    """One annotation document spread over a ScreenOverlay per screen.
+
+    Each committed item is owned by the registry of the screen its bounds are
+    centred on (or whose scene it was drawn in), so a screen's scene, spatial
+    index and baked layer only ever hold that screen's items and painting one
+    screen never walks another's. Annotation ids are handed out here, unique
+    across screens. The document offers the AnnotationRegistry interface the
+    undo history, eraser, journal and document saving use.
+
+    make_overlay(screen) builds the ScreenOverlay of a screen. Screens added or
+    removed later only create or close their own overlay; the items of a
+    removed screen move to the nearest remaining one.
+    """
+    def __init__(self, make_overlay):
+        self.make_overlay = make_overlay
+        self.overlays = {}  # QScreen -> ScreenOverlay
+        self._owners = {}  # annotation id -> ScreenOverlay
+        self._next_id = 1
+        self._id_offset, self._id_stride = 0, 1
+
+    def watch(self, app):
+        """Follow screens being plugged in and out."""
+        app.screenAdded.connect(self.add_screen)
+        app.screenRemoved.connect(self.remove_screen)
+
+    def add_screen(self, screen):
+        if screen not in self.overlays:
+            self.overlays[screen] = self.make_overlay(screen)
+        return self.overlays[screen]
+
+    def remove_screen(self, screen):
+        overlay = self.overlays.get(screen)
+        if overlay is None or len(self.overlays) == 1:
+            return
+        del self.overlays[screen]
+        items = list(overlay.registry)
+        for item in items:
+            overlay.registry.detach(item)
+            del self._owners[item.data(ANNOTATION_ID)]
+        overlay.close()
+        for item in items:
+            self.attach(item)
+
+    def device_pixel_ratio(self):
+        """The highest device pixel ratio among the screens; exports at this scale are sharp on all of them."""
+        return max((overlay.screen.devicePixelRatio() for overlay in self.overlays.values()), default=1.0)
+
+    def scene_rect(self) -> QRectF:
+        """The desktop area covered by all screens."""
+        rect = QRectF()
+        for overlay in self.overlays.values():
+            rect = rect.united(overlay.rect)
+        return rect
+
+    def overlay_for(self, item):
+        """The overlay whose scene holds item, or else the one nearest the centre of its bounds."""
+        scene = item.scene()
+        for overlay in self.overlays.values():
+            if overlay.scene is scene:
+                return overlay
+        # a parentless item outside any scene maps to scene coordinates with its own transform
+        center = item.sceneBoundingRect().center()
+        return min(self.overlays.values(), key=lambda overlay: _distance(overlay.rect, center))
+
+    def selected_items(self):
+        return [item for overlay in self.overlays.values() for item in overlay.scene.selectedItems() if item in self]
+
+    # ---------- AnnotationRegistry interface ----------
+    def __len__(self):
+        return len(self._owners)
+
+    def __iter__(self):
+        return iter([item for overlay in self.overlays.values() for item in overlay.registry])
+
+    def __contains__(self, item):
+        owner = self._owners.get(item.data(ANNOTATION_ID))
+        return owner is not None and item in owner.registry
+
+    def get(self, annotation_id):
+        owner = self._owners.get(annotation_id)
+        return None if owner is None else owner.registry.get(annotation_id)
+
+    def reserve_ids(self, offset, stride):
+        """Hand out only ids equal to offset modulo stride, so peers sharing a document never pick the same one."""
+        self._id_offset, self._id_stride = offset, stride
+
+    def assign_id(self, item):
+        annotation_id = item.data(ANNOTATION_ID)
+        if annotation_id is None:
+            # the first id of this document's residue at or above every id seen so far
+            annotation_id = self._next_id + (self._id_offset - self._next_id) % self._id_stride
+            item.setData(ANNOTATION_ID, annotation_id)
+            item.setZValue(annotation_id)
+        self._next_id = max(self._next_id, annotation_id + 1)
+        return annotation_id
+
+    def attach(self, item):
+        annotation_id = self.assign_id(item)
+        overlay = self.overlay_for(item)
+        owner = self._owners.get(annotation_id)
+        if owner is not None and owner is not overlay:
+            owner.registry.detach(item)
+        overlay.registry.attach(item)
+        self._owners[annotation_id] = overlay
+
+    def detach(self, item):
+        annotation_id = item.data(ANNOTATION_ID)
+        owner = self._owners.get(annotation_id)
+        if owner is not None and owner.registry.get(annotation_id) is item:
+            del self._owners[annotation_id]
+            owner.registry.detach(item)
+        elif item.scene() is not None:
+            # drawn but never committed
+            item.scene().removeItem(item)
+
+    def changed(self, item):
+        owner = self._owners.get(item.data(ANNOTATION_ID))
+        if owner is not None:
+            owner.registry.changed(item)
+
+    def items_in(self, rect: QRectF):
+        return [item for overlay in self.overlays.values() for item in overlay.registry.items_in(rect)]
+
+    def items_at(self, pos: QPointF, radius: float):
+        return [item for overlay in self.overlays.values() for item in overlay.registry.items_at(pos, radius)]
+
+    def wake(self, items):
+        for item in items:
+            owner = self._owners.get(item.data(ANNOTATION_ID))
+            if owner is not None:
+                owner.registry.wake([item])
@@ -0,0 +1,108 @@
+import argparse
+from dataclasses import dataclass
+
+from annotator.instance import CommandError, check_command
+
+
+@dataclass
+class OverlaySettings:
+    """Tunables shared by both overlays, filled in from the command line."""
+    max_fps: float = 0.0  # 0 follows the refresh rate of the primary screen
+    repaint_mode: str = 'full'  # 'dirty' or 'full', see annotator.view.REPAINT_MODES
+    history_budget_mb: float = 64.0  # undo steps beyond this are spilled to a temp file
+    baked_layer: bool = False  # draw committed, unselected annotations from cached image tiles
+    tile_size: int = 256  # edge of a baked-layer tile, in pixels
+    max_tiles: int = 256  # resident tiles before the least recently drawn are dropped
+    export_scale: float = 0.0  # exported images are this many times the overlay's size; 0 = native resolution
+    journal: bool = True  # autosave every step so a crashed session can be recovered
+    journal_dir: str = ''  # '' uses annotator.journal.DEFAULT_JOURNAL_DIR
+    record_input: str = ''  # write the session's input to this trace file
+    replay_input: str = ''  # feed this trace file's input to the overlay
+    replay_speed: float = 1.0  # 1 = original timing, 2 = twice as fast, 0 = as fast as possible
+    replay_exit: bool = False  # quit once the replay has finished
+    hud: bool = False  # show frame timings, item counts and history size in a corner of the overlay
+    profiler: str = 'sample'  # what Ctrl+Shift+P captures, see annotator.profiling.PROFILERS
+    profile_dir: str = ''  # '' uses annotator.profiling.DEFAULT_PROFILE_DIR
+    fast_start: bool = True  # build the overlays right after the control window's first frame
+    welcome: bool = True  # show the (non-modal) welcome message at startup
+    startup_profile: bool = False  # print how long each startup stage took
+    single_instance: bool = True  # later launches hand their command to this one, see annotator.instance
+    command: tuple = ()  # words of the command to run once started, e.g. ('tool', 'rectangle')
+    sync: str = ''  # HOST:PORT of a relay to share the annotations through, see annotator.sync
+    sync_name: str = ''  # how other peers of the shared session see us; '' uses the user name
+
+    @property
+    def history_budget_bytes(self):
+        return int(self.history_budget_mb * 1024 * 1024)
+
+
+def parse_settings(argv):
+    """Split our own options off argv; the rest is left for Qt."""
+    parser = argparse.ArgumentParser(add_help=True)
+    parser.add_argument('--max-fps', type=float, default=OverlaySettings.max_fps,
+                        help="cap on scene updates per second while dragging (0 = screen refresh rate)")
+    parser.add_argument('--repaint-mode', choices=('dirty', 'full'), default=OverlaySettings.repaint_mode,
+                        help="repaint only changed regions of the overlay, or the whole overlay")
+    parser.add_argument('--history-budget', type=float, default=OverlaySettings.history_budget_mb,
+                        metavar='MB', help="memory kept for undo history before older steps go to disk")
+    parser.add_argument('--baked-layer', action='store_true',
+                        help="rasterise committed annotations into cached tiles instead of painting each item")
+    parser.add_argument('--tile-size', type=int, default=OverlaySettings.tile_size, metavar='PX',
+                        help="edge length of the baked layer's image tiles")
+    parser.add_argument('--max-tiles', type=int, default=OverlaySettings.max_tiles,
+                        help="baked layer tiles kept in memory before the least recently drawn are dropped")
+    parser.add_argument('--export-scale', type=float, default=OverlaySettings.export_scale, metavar='N',
+                        help="size of exported images relative to the overlay, e.g. 4 for 8K from a 1080p screen "
+                             "(default: the screens' device pixel ratio, i.e. native resolution)")
+    parser.add_argument('--no-journal', dest='journal', action='store_false',
+                        help="do not autosave the session for crash recovery")
+    parser.add_argument('--journal-dir', default=OverlaySettings.journal_dir, metavar='DIR',
+                        help="where the crash-recovery journal is kept (default: ~/.screen_annotation/journal)")
+    parser.add_argument('--record-input', default=OverlaySettings.record_input, metavar='TRACE',
+                        help="record mouse, key, tool, colour and size input to a trace file (.strace)")
+    parser.add_argument('--replay-input', default=OverlaySettings.replay_input, metavar='TRACE',
+                        help="replay a recorded trace into the overlay, starting from an empty document")
+    parser.add_argument('--replay-speed', type=float, default=OverlaySettings.replay_speed, metavar='X',
+                        help="replay speed relative to the recording (0 = as fast as possible)")
+    parser.add_argument('--replay-exit', action='store_true', help="quit once the replay has finished")
+    parser.add_argument('--hud', action='store_true',
+                        help="show live frame timings, item counts and undo history size on the overlay (F3 toggles)")
+    parser.add_argument('--profiler', choices=('sample', 'cprofile'), default=OverlaySettings.profiler,
+                        help="profiler Ctrl+Shift+P starts and stops: stack sampling (low overhead, .folded) "
+                             "or cProfile (.prof)")
+    parser.add_argument('--profile-dir', default=OverlaySettings.profile_dir, metavar='DIR',
+                        help="where profiles are written (default: ~/.screen_annotation/profiles)")
+    parser.add_argument('--eager-start', dest='fast_start', action='store_false',
+                        help="build the overlays before showing the control window, instead of right after "
+                             "its first frame")
+    parser.add_argument('--no-welcome', dest='welcome', action='store_false',
+                        help="do not show the welcome message at startup")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="print the time to the first usable frame and each startup stage to stderr")
+    parser.add_argument('--command', nargs='+', default=[], metavar='WORD',
+                        help="command for the running overlay, or for this one once it has started: activate, "
+                             "toggle, show, hide, tool NAME, clear, undo, redo, export PATH or quit")
+    parser.add_argument('--new-instance', dest='single_instance', action='store_false',
+                        help="start another overlay even if one is already running")
+    parser.add_argument('--sync', default=OverlaySettings.sync, metavar='HOST:PORT',
+                        help="share annotations with the other overlays connected to this relay "
+                             "(python -m annotator.relay)")
+    parser.add_argument('--sync-name', default=OverlaySettings.sync_name, metavar='NAME',
+                        help="name shown to the other peers of a shared session (default: your user name)")
+    args, qt_args = parser.parse_known_args(argv[1:])
+    settings = OverlaySettings(max_fps=args.max_fps, repaint_mode=args.repaint_mode,
+                               history_budget_mb=args.history_budget, baked_layer=args.baked_layer,
+                               tile_size=args.tile_size, max_tiles=args.max_tiles,
+                               export_scale=args.export_scale, journal=args.journal, journal_dir=args.journal_dir,
+                               record_input=args.record_input, replay_input=args.replay_input,
+                               replay_speed=args.replay_speed, replay_exit=args.replay_exit, hud=args.hud,
+                               profiler=args.profiler, profile_dir=args.profile_dir, fast_start=args.fast_start,
+                               welcome=args.welcome, startup_profile=args.startup_profile,
+                               single_instance=args.single_instance, command=tuple(args.command),
+                               sync=args.sync, sync_name=args.sync_name)
+    if settings.command:
+        try:
+            settings.command = tuple(check_command(settings.command))
+        except CommandError as e:
+            parser.error(str(e))
+    return settings, argv[:1] + qt_args
@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+from PyQt6.QtCore import QRectF
+from PyQt6.QtWidgets import QGraphicsItem
+
+from annotator.strokes import StrokeItem
+
+DEFAULT_CELL_SIZE = 64
+# covers antialiasing around the pen
+STROKE_MARGIN = 2.0
+
+
+def map_to_scene(item: QGraphicsItem, points) -> 'np.ndarray':
+    """(n, 2) points in item coordinates mapped to scene coordinates."""
+    t = item.sceneTransform()
+    if t.isIdentity():
+        return points
+    matrix = np.array([[t.m11(), t.m12()], [t.m21(), t.m22()]])
+    return points @ matrix + (t.dx(), t.dy())
+
+
+def stroke_scene_points(item: StrokeItem) -> 'np.ndarray':
+    """A stroke's points mapped to scene coordinates."""
+    return map_to_scene(item, item.points())
+
+
+class SpatialIndex:
+    """Uniform grid over the scene, mapping cells to the annotations that cross them.
+
+    Strokes are entered in the cells their segments, or fitted curves, pass
+    through rather than every cell of their bounding rect, so a long diagonal
+    stroke does not show up in queries far from its ink. A query touches only the cells of its rect,
+    which keeps lookups independent of the number of items in the document.
+    """
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = float(cell_size)
+        self._cells = {}  # (column, row) -> {annotation id: item}
+        self._item_cells = {}  # annotation id -> cells the item was entered in
+
+    def __len__(self):
+        return len(self._item_cells)
+
+    def __contains__(self, annotation_id):
+        return annotation_id in self._item_cells
+
+    def insert(self, annotation_id, item: QGraphicsItem):
+        if annotation_id in self._item_cells:
+            self.remove(annotation_id)
+        cells = self._cells_of(item)
+        for cell in cells:
+            bucket = self._cells.get(cell)
+            if bucket is None:
+                bucket = self._cells[cell] = {}
+            bucket[annotation_id] = item
+        self._item_cells[annotation_id] = cells
+
+    def remove(self, annotation_id):
+        for cell in self._item_cells.pop(annotation_id, ()):
+            bucket = self._cells[cell]
+            bucket.pop(annotation_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def update(self, annotation_id, item: QGraphicsItem):
+        if annotation_id in self._item_cells:
+            self.insert(annotation_id, item)
+
+    def query(self, rect: QRectF):
+        """Items entered in any cell the scene rect overlaps; callers do the exact test."""
+        size = self.cell_size
+        found = {}
+        for column in range(math.floor(rect.left() / size), math.floor(rect.right() / size) + 1):
+            for row in range(math.floor(rect.top() / size), math.floor(rect.bottom() / size) + 1):
+                bucket = self._cells.get((column, row))
+                if bucket:
+                    found.update(bucket)
+        return list(found.values())
+
+    def clear(self):
+        self._cells.clear()
+        self._item_cells.clear()
+
+    def _cells_of(self, item):
+        size = self.cell_size
+        if isinstance(item, StrokeItem) and item.point_count():
+            margin = item.pen().widthF() / 2 + STROKE_MARGIN
+            curves = item.curves()
+            if curves is not None:
+                # the ink is the fitted curves, and each lies within the bounds of its control points
+                ctrl = map_to_scene(item, curves.reshape(-1, 2)).reshape(-1, 4, 2)
+                low, high = ctrl.min(axis=1), ctrl.max(axis=1)
+            else:
+                points = stroke_scene_points(item)
+                a = points[:-1] if len(points) > 1 else points
+                b = points[1:] if len(points) > 1 else points
+                low, high = np.minimum(a, b), np.maximum(a, b)
+            lo = np.floor((low - margin) / size).astype(np.int64)
+            hi = np.floor((high + margin) / size).astype(np.int64)
+            # consecutive segments mostly share their cell range
+            boxes = np.unique(np.hstack([lo, hi]), axis=0).tolist()
+        else:
+            r = item.sceneBoundingRect()
+            boxes = [(math.floor(r.left() / size), math.floor(r.top() / size),
+                      math.floor(r.right() / size), math.floor(r.bottom() / size))]
+        cells = set()
+        for x0, y0, x1, y1 in boxes:
+            for column in range(x0, x1 + 1):
+                for row in range(y0, y1 + 1):
+                    cells.add((column, row))
+        return cells
@@ -0,0 +1,125 @@
+"""Getting the control window on screen before the rest of the app is built.
+
+lazy_import() keeps a heavy module (numpy) from loading until it is first
+used. DeferredStartup runs the second half of an overlay's construction right
+after the control window's first frame, or before the first input reaches the
+app if that comes sooner, so nothing can see a half-built overlay.
+StartupProfile reports how long each stage took once the first frame is on
+screen and the overlay is ready.
+"""
+import importlib
+import sys
+import time
+import types
+
+from PyQt6.QtCore import QEvent, QObject, QTimer
+
+# time to the first usable frame we aim for
+STARTUP_TARGET_MS = 300
+# stages that must both be marked before the profile is reported
+FINAL_STAGES = ('first frame', 'ready')
+
+INPUT_EVENTS = {
+    QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonRelease, QEvent.Type.MouseButtonDblClick,
+    QEvent.Type.KeyPress, QEvent.Type.KeyRelease, QEvent.Type.Wheel,
+}
+
+
+class _LazyModule(types.ModuleType):
+    """Stands in for a module in sys.modules until one of its attributes is needed."""
+    def __getattr__(self, attr):
+        # only called for attributes the stand-in does not have, i.e. before the real module is loaded
+        module = load(self.__name__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """Make later 'import name' statements bind a stand-in that loads the module on first attribute access."""
+    if name not in sys.modules:
+        module = _LazyModule(name)
+        module.__spec__ = None
+        sys.modules[name] = module
+    return sys.modules[name]
+
+
+def load(name):
+    """The real module behind name, loading it now if it was lazily imported."""
+    stand_in = sys.modules.get(name)
+    if not isinstance(stand_in, _LazyModule):
+        return importlib.import_module(name)
+    del sys.modules[name]
+    module = importlib.import_module(name)
+    # modules that bound the stand-in find everything directly on it from now on
+    stand_in.__dict__.update(module.__dict__)
+    return module
+
+
+class DeferredStartup(QObject):
+    """Calls finish() once widget has painted its first frame, or before the app's first input."""
+    def __init__(self, app, widget, finish):
+        super().__init__()
+        self.app = app
+        self.widget = widget
+        self.finish = finish
+        self.done = False
+        self._scheduled = False
+        app.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and obj is self.widget and not self._scheduled:
+            # runs once this paint is on screen
+            self._scheduled = True
+            QTimer.singleShot(0, self.run)
+        elif event.type() in INPUT_EVENTS:
+            self.run()
+        return False
+
+    def run(self):
+        if self.done:
+            return
+        self.done = True
+        self.app.removeEventFilter(self)
+        self.finish()
+
+
+class StartupProfile(QObject):
+    """Timestamps startup stages from started (a perf_counter() value) and prints them."""
+    def __init__(self, started, widget=None):
+        super().__init__()
+        self.started = started
+        self.marks = []  # (stage, ms since started)
+        self.widget = widget
+        if widget is not None:
+            widget.installEventFilter(self)
+
+    def mark(self, stage, at=None):
+        """Note that stage ended now, or at the given perf_counter() value."""
+        at = time.perf_counter() if at is None else at
+        self.marks.append((stage, (at - self.started) * 1000))
+        if stage in FINAL_STAGES and all(self.elapsed(name) is not None for name in FINAL_STAGES):
+            self.report()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            obj.removeEventFilter(self)
+            QTimer.singleShot(0, self.first_frame)
+        return False
+
+    def first_frame(self):
+        """Mark the first frame as on screen, unless it already is."""
+        if self.elapsed('first frame') is None:
+            self.mark('first frame')
+
+    def elapsed(self, stage):
+        return next((ms for name, ms in self.marks if name == stage), None)
+
+    def report(self, file=sys.stderr):
+        previous = 0.0
+        for stage, ms in sorted(self.marks, key=lambda mark: mark[1]):
+            print(f"startup: {stage:<16}{ms:8.1f} ms  (+{ms - previous:.1f})", file=file)
+            previous = ms
+        first_frame = self.elapsed('first frame')
+        if first_frame is not None:
+            verdict = "within" if first_frame <= STARTUP_TARGET_MS else "over"
+            print(f"startup: first usable frame after {first_frame:.0f} ms, {verdict} the {STARTUP_TARGET_MS} ms target",
+                  file=file)
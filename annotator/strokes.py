@@ -0,0 +1,242 @@
+import numpy as np
+from PyQt6.QtCore import Qt, QPointF, QRectF
+from PyQt6.QtGui import QPen, QPainter, QPainterPath, QPainterPathStroker, QPolygonF
+from PyQt6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+from annotator.geometry import (
+    erase_polyline, fit_cubic_beziers, sample_cubic_beziers, segment_distances_sq, simplify_polyline
+)
+from annotator.metrics import metrics
+
+# simplification tolerance as a fraction of the pen width, in scene pixels
+SIMPLIFY_TOLERANCE = 0.1
+MIN_SIMPLIFY_TOLERANCE = 0.5
+# maximum distance of the fitted Bezier curves from the drawn samples, in scene pixels
+FIT_TOLERANCE = 0.5
+# spacing of the points sampled along the curves for hit tests and erasing, in scene pixels
+INK_SPACING = 1.0
+
+
+def polygon_from_points(points) -> QPolygonF:
+    """QPolygonF of an (n, 2) array, copied in one block rather than point by point."""
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 2)
+    polygon = QPolygonF()
+    if len(points):
+        polygon.fill(QPointF(), len(points))
+        buffer = polygon.data()
+        buffer.setsize(points.nbytes)
+        np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)[:] = points
+    return polygon
+
+
+def path_from_curves(curves) -> QPainterPath:
+    """Build a QPainterPath from an (m, 4, 2) array of cubic Bezier control points."""
+    path = QPainterPath()
+    if len(curves):
+        path.moveTo(*curves[0, 0])
+        for _, c1, c2, end in curves.tolist():
+            path.cubicTo(c1[0], c1[1], c2[0], c2[1], end[0], end[1])
+    return path
+
+
+class StrokeItem(QGraphicsItem):
+    """Freehand pen stroke backed by an append-only point buffer.
+
+    Points are stored in a NumPy array that doubles when full, and mirrored in a
+    QPolygonF used for painting, so adding a sample costs amortised O(1) and only
+    invalidates the area of the new segments. The mirror is built on first use,
+    so strokes loaded in bulk do not pay for it until they are painted. Once committed, the stroke keeps
+    only its simplified points and is drawn from cubic Bezier segments fitted to
+    the samples as drawn.
+    """
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, pen: QPen, start: QPointF = None):
+        super().__init__()
+        self._pen = QPen(pen)
+        self._points = np.empty((self.INITIAL_CAPACITY, 2), dtype=np.float64)
+        self._count = 0
+        self._polygon = None  # QPolygonF mirror of the points, see polygon()
+        self._extent = QRectF()  # bounds of the raw points, without the pen
+        self._shape = None
+        self._curves = None
+        self._curve_path = None
+        self._ink = None  # points sampled along the curves, see ink_points()
+        if start is not None:
+            self.add_point(start)
+
+    def pen(self) -> QPen:
+        return QPen(self._pen)
+
+    def setPen(self, pen: QPen):
+        self.prepareGeometryChange()
+        self._pen = QPen(pen)
+        self._shape = None
+        self.update()
+
+    def points(self) -> 'np.ndarray':
+        """Read-only (n, 2) view of the stroke's points."""
+        view = self._points[:self._count]
+        view.flags.writeable = False
+        return view
+
+    def point_count(self) -> int:
+        return self._count
+
+    def curves(self):
+        """(m, 4, 2) Bezier control points of a committed stroke, or None."""
+        return self._curves
+
+    def polygon(self) -> QPolygonF:
+        """QPolygonF of the stroke's points, used for painting."""
+        if self._polygon is None:
+            self._polygon = polygon_from_points(self._points[:self._count])
+        return self._polygon
+
+    def ink_points(self) -> 'np.ndarray':
+        """(n, 2) polyline along the painted ink: the points, or samples along the curves."""
+        if self._curves is None:
+            return self.points()
+        if self._ink is None:
+            self._ink = sample_cubic_beziers(self._curves, INK_SPACING)
+            self._ink.flags.writeable = False
+        return self._ink
+
+    def add_point(self, pos: QPointF):
+        self.add_points([pos])
+
+    def add_points(self, positions):
+        """Append a batch of samples with a single geometry change and repaint."""
+        if not positions:
+            return
+        n = len(positions)
+        needed = self._count + n
+        if needed > len(self._points):
+            capacity = len(self._points)
+            while capacity < needed:
+                capacity *= 2
+            grown = np.empty((capacity, 2), dtype=np.float64)
+            grown[:self._count] = self._points[:self._count]
+            self._points = grown
+        first = self._count
+        polygon = self.polygon()
+        for i, pos in enumerate(positions):
+            self._points[first + i] = (pos.x(), pos.y())
+            polygon.append(QPointF(pos))
+        self._count = needed
+        self._shape = None
+
+        # The dirty area covers the new points plus the one they connect to.
+        batch = self._points[max(0, first - 1):needed]
+        lo = batch.min(axis=0)
+        hi = batch.max(axis=0)
+        dirty = QRectF(lo[0], lo[1], hi[0] - lo[0], hi[1] - lo[1])
+        e = self._extent
+        if first == 0:
+            self.prepareGeometryChange()
+            self._extent = dirty
+        elif lo[0] < e.left() or lo[1] < e.top() or hi[0] > e.right() or hi[1] > e.bottom():
+            self.prepareGeometryChange()
+            left, top = min(e.left(), lo[0]), min(e.top(), lo[1])
+            self._extent = QRectF(left, top, max(e.right(), hi[0]) - left, max(e.bottom(), hi[1]) - top)
+        m = self._margin()
+        self.update(dirty.adjusted(-m, -m, m, m))
+
+    def set_points(self, points):
+        """Replace the whole stroke with an (n, 2) array of points."""
+        self.prepareGeometryChange()
+        self._points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        self._count = len(self._points)
+        self._polygon = None
+        if self._count:
+            lo = self._points.min(axis=0)
+            hi = self._points.max(axis=0)
+            self._extent = QRectF(lo[0], lo[1], hi[0] - lo[0], hi[1] - lo[1])
+        else:
+            self._extent = QRectF()
+        self._shape = None
+        self._curves = None
+        self._curve_path = None
+        self._ink = None
+        self.update()
+
+    def set_curves(self, curves):
+        """Draw the stroke from (m, 4, 2) Bezier control points; None goes back to the polyline."""
+        self.prepareGeometryChange()
+        if curves is None or not len(curves):
+            self._curves = None
+            self._curve_path = None
+        else:
+            self._curves = np.asarray(curves, dtype=np.float64).reshape(-1, 4, 2)
+            self._curve_path = path_from_curves(self._curves)
+        self._ink = None
+        self._shape = None
+        self.update()
+
+    def commit(self):
+        """Finish the stroke: drop samples that do not change its visible shape."""
+        samples = self.points()
+        tolerance = max(MIN_SIMPLIFY_TOLERANCE, self._pen.widthF() * SIMPLIFY_TOLERANCE)
+        self.set_points(simplify_polyline(samples, tolerance))
+        if len(samples):
+            metrics.record('stroke.simplify_ratio', self._count / len(samples))
+        if self._count > 2:
+            # each cubic is flattened into several lines when painted, so a fit only pays
+            # off if it needs well under the simplified polyline's number of segments
+            curves = fit_cubic_beziers(samples, FIT_TOLERANCE, max_segments=(self._count - 1) // 2)
+            if curves is not None:
+                self.set_curves(curves)
+                metrics.record('stroke.curve_segments', len(curves))
+
+    def touches(self, pos: QPointF, radius: float) -> bool:
+        """True if a disc at pos (item coordinates) overlaps the stroke's ink."""
+        if not self._count:
+            return False
+        reach = radius + self._pen.widthF() / 2
+        p = np.array([pos.x(), pos.y()])
+        points = self.ink_points()
+        if len(points) == 1:
+            d = points[0] - p
+            return float(d @ d) <= reach * reach
+        a, b = points[:-1], points[1:]
+        return bool((segment_distances_sq(np.broadcast_to(p, a.shape), a, b) <= reach * reach).any())
+
+    def erase(self, pos: QPointF, radius: float):
+        """Point arrays left after erasing a disc at pos (item coordinates); None if it misses.
+
+        A curved stroke is cut along its ink, so the pieces keep the shape that was painted.
+        """
+        if not self._count:
+            return None
+        return erase_polyline(self.ink_points(), (pos.x(), pos.y()), radius + self._pen.widthF() / 2)
+
+    def _margin(self) -> float:
+        return self._pen.widthF() / 2 + 1
+
+    def boundingRect(self) -> QRectF:
+        m = self._margin()
+        extent = self._extent
+        if self._curve_path is not None:
+            extent = extent.united(self._curve_path.controlPointRect())
+        return extent.adjusted(-m, -m, m, m)
+
+    def shape(self) -> QPainterPath:
+        if self._shape is None:
+            path = self._curve_path
+            if path is None:
+                path = QPainterPath()
+                path.addPolygon(self.polygon())
+            stroker = QPainterPathStroker(self._pen)
+            stroker.setWidth(max(1.0, self._pen.widthF()))
+            self._shape = stroker.createStroke(path)
+        return self._shape
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget=None):
+        painter.setPen(self._pen)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        if self._curve_path is not None:
+            painter.drawPath(self._curve_path)
+        elif self._count == 1:
+            painter.drawPoint(self.polygon().at(0))
+        else:
+            painter.drawPolyline(self.polygon())
@@ -0,0 +1,456 @@
+"""Shared annotation sessions: several overlays drawing on one document.
+
+A SyncClient connects an overlay's document to a relay (annotator.relay) and:
+
+    - listens to the undo history and sends every step ('do', 'undo' or
+      'redo' of a command record) as an OPS delta; peers apply it the way
+      journal recovery does, without putting it on their own undo stack
+    - streams the pen stroke being drawn as LIVE chunks of its new float32
+      points, shown on the peers as a preview until the stroke is committed
+    - queues both and sends at most one LIVE and one OPS message per frame
+      (see annotator.delta for the encoding)
+    - pings the other peers once a second and keeps each one's round-trip
+      times and the bytes it sent; peer_stats() and report() show them
+
+The relay gives each peer a residue of annotation ids, so ids never collide.
+Joining does not block: steps taken before the shared ones have arrived are
+queued and sent once they are applied.
+Conflicting changes resolve as last writer wins: a change to an item another
+peer has already removed is skipped.
+"""
+import getpass
+import json
+import struct
+import sys
+from collections import deque
+
+import numpy as np
+from PyQt6.QtCore import QElapsedTimer, QObject, QPointF, QTimer, pyqtSignal
+from PyQt6.QtNetwork import QAbstractSocket, QTcpSocket
+
+from annotator.annotations import ANNOTATION_ID
+from annotator.codec import pen_from_record, pen_to_record
+from annotator.delta import DeltaError, decode_batch, encode_batch
+from annotator.history import COMMAND_TYPES
+from annotator.metrics import metrics
+from annotator.relay import (
+    DEFAULT_PORT, EVERYONE, FRAME, HELLO, HELLO_HEADER, JOINED, LEFT, LIVE, MAX_PAYLOAD, MAX_PEERS, OPS, PING,
+    PONG, PROTOCOL_VERSION, WELCOME
+)
+from annotator.strokes import StrokeItem
+
+# seconds to wait for the relay while connecting
+SYNC_TIMEOUT = 3.0
+PING_INTERVAL_MS = 1000
+# round-trip times kept per peer
+RTT_SAMPLES = 64
+PING_STAMP = struct.Struct('<d')  # sender's clock in milliseconds, echoed back in the PONG
+
+# history actions, by their index in OPS entries: (action, command label, command record)
+ACTIONS = ('do', 'undo', 'redo')
+# kinds of LIVE entries: (LIVE_START, id, pen, points), (LIVE_POINTS, id, points), (LIVE_END, id)
+LIVE_START, LIVE_POINTS, LIVE_END = range(3)
+
+
+class SyncError(ValueError):
+    """The relay cannot be reached or does not speak this protocol."""
+
+
+def parse_address(text):
+    """(host, port) of 'host:port', 'host' or ':port'."""
+    host, sep, port = text.rpartition(':')
+    if not sep:
+        host, port = text, ''
+    try:
+        port = int(port) if port else DEFAULT_PORT
+    except ValueError:
+        raise SyncError(f"bad port in {text!r}") from None
+    return host or 'localhost', port
+
+
+def _points_from_bytes(data):
+    return [QPointF(x, y) for x, y in np.frombuffer(data, dtype='<f4').reshape(-1, 2).tolist()]
+
+
+class PeerStats:
+    """What one peer has sent us and how quickly it answers pings."""
+    def __init__(self, name):
+        self.name = name
+        self.received_bytes = 0
+        self.messages = 0
+        self.rtts = deque(maxlen=RTT_SAMPLES)  # milliseconds
+        self.clock = QElapsedTimer()
+        self.clock.start()
+
+    def summary(self):
+        seconds = max(self.clock.elapsed() / 1000, 1e-3)
+        ordered = sorted(self.rtts)
+        return {
+            'name': self.name,
+            'received_bytes': self.received_bytes,
+            'received_kbit_per_s': self.received_bytes * 8 / 1000 / seconds,
+            'messages': self.messages,
+            'rtt_ms_p50': ordered[len(ordered) // 2] if ordered else None,
+            'rtt_ms_last': self.rtts[-1] if self.rtts else None,
+        }
+
+
+class SyncClient(QObject):
+    """Shares a document's history and live strokes with the other peers of a relay's session.
+
+    Add the client to UndoHistory.listeners and call begin_stroke() when a
+    pen stroke starts. connect_to() does not block: joined or failed tells how
+    it went. changed is emitted after other peers' changes were applied to the
+    document.
+    """
+    changed = pyqtSignal()
+    joined = pyqtSignal()
+    failed = pyqtSignal(str)
+    disconnected = pyqtSignal()
+
+    def __init__(self, document, factory, name, frame_ms=16.0, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.factory = factory
+        self.name = name or getpass.getuser()
+        self.peer = None  # our peer id, once connected
+        self.peers = {}  # peer id -> PeerStats of the other peers
+        self.sent_bytes = 0
+        self.sent_messages = 0
+        self.dropped = 0  # entries from peers that could not be decoded or applied
+        self._socket = QTcpSocket(self)
+        self._buffer = bytearray()
+        self._closing = False
+        self._address = ''
+        self._joining = False  # between connect_to() and the shared steps being applied
+        self._backlog = 0  # logged OPS messages still to come after the WELCOME
+        self._pending = []  # OPS entries of local steps taken while joining
+        self._ops = []  # OPS entries queued for the next frame
+        self._live = []  # LIVE entries queued for the next frame
+        self._stroke = None  # [item, points sent] of the local stroke being drawn
+        self._previews = {}  # (peer, annotation id) -> StrokeItem of a stroke another peer is drawing
+        self._clock = QElapsedTimer()
+        self._clock.start()
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(max(1, round(frame_ms)))
+        self._flush_timer.timeout.connect(self.flush)
+        self._join_timer = QTimer(self)
+        self._join_timer.setSingleShot(True)
+        self._join_timer.timeout.connect(self._join_timeout)
+        self._ping_timer = QTimer(self)
+        self._ping_timer.setInterval(PING_INTERVAL_MS)
+        self._ping_timer.timeout.connect(self.ping)
+
+    @property
+    def connected(self):
+        return self.peer is not None and self._socket.state() == QAbstractSocket.SocketState.ConnectedState
+
+    def connect_to(self, host, port, timeout=SYNC_TIMEOUT):
+        """Start joining the relay's session; returns at once.
+
+        joined is emitted once the document holds everything shared before,
+        failed if the relay cannot be reached or is not a relay. Steps taken
+        in the meantime are queued and sent after the shared ones are applied.
+        """
+        self._address = f"{host}:{port}"
+        self._joining = True
+        self._socket.connected.connect(self._hello)
+        self._socket.readyRead.connect(self._read)
+        self._socket.disconnected.connect(self._lost)
+        self._socket.errorOccurred.connect(self._socket_error)
+        # no peer is given residue 0, so what is drawn while joining cannot collide with a peer's ids
+        self.document.reserve_ids(0, MAX_PEERS)
+        self._join_timer.start(int(timeout * 1000))
+        self._socket.connectToHost(host, port)
+
+    def close(self):
+        """Send what is queued and leave the session."""
+        if self._joining:
+            self._stop_joining()
+            return
+        if not self.connected:
+            return
+        self.flush()
+        self._closing = True
+        self._ping_timer.stop()
+        self._socket.waitForBytesWritten(int(SYNC_TIMEOUT * 1000))
+        self._socket.disconnectFromHost()
+
+    def _hello(self):
+        self._socket.setSocketOption(QAbstractSocket.SocketOption.LowDelayOption, 1)
+        self._send(HELLO, EVERYONE, HELLO_HEADER.pack(PROTOCOL_VERSION) + self.name.encode('utf-8'))
+
+    def _welcome(self, kind, payload):
+        try:
+            if kind != WELCOME:
+                raise ValueError(f"message type {kind}")
+            welcome = json.loads(payload.decode('utf-8'))
+            peer = int(welcome['peer'])
+            peers = {int(peer): PeerStats(name) for peer, name in welcome['peers'].items()}
+            logged = int(welcome['log'])
+            dropped = int(welcome.get('dropped', 0))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise SyncError(f"{self._address} is not an annotation relay ({e})") from e
+        if dropped:
+            print(f"Shared session: the relay no longer has the {dropped} oldest changes", file=sys.stderr)
+        self._join_timer.stop()
+        self.peer, self.peers, self._backlog = peer, peers, logged
+        self.document.reserve_ids(self.peer, MAX_PEERS)
+        if not self._backlog:
+            self._joined()
+
+    def _joined(self):
+        """The shared steps are applied; send ours from while we were joining."""
+        self._joining = False
+        self._ping_timer.start()
+        if self._pending:
+            self._ops.extend(self._pending)
+            self._pending = []
+            self._schedule()
+        self.joined.emit()
+
+    def _socket_error(self, error):
+        if self._joining:
+            self._fail(f"cannot reach {self._address}: {self._socket.errorString()}")
+
+    def _join_timeout(self):
+        self._fail(f"no answer from {self._address}")
+
+    def _fail(self, message):
+        if self._joining:
+            self._stop_joining()
+            # not sharing after all: hand out every id again
+            self.document.reserve_ids(0, 1)
+            self.failed.emit(message)
+
+    def _stop_joining(self):
+        self._joining = False
+        self._closing = True
+        self._join_timer.stop()
+        self._pending = []
+        self.peer = None
+        self._socket.abort()
+
+    # ---------- local changes ----------
+    def __call__(self, action, command):
+        """UndoHistory listener: share one step ('do', 'undo' or 'redo')."""
+        if self._joining:
+            self._pending.append((ACTIONS.index(action), command.label, command.to_record()))
+            return
+        if not self.connected:
+            return
+        if action == 'do' and self._stroke is not None and self._stroke[0] in getattr(command, 'items', ()):
+            # the stroke is committed; peers swap the preview for it
+            self.end_stroke()
+        self._ops.append((ACTIONS.index(action), command.label, command.to_record()))
+        self._schedule()
+
+    def begin_stroke(self, item: StrokeItem):
+        """Stream item's points to the peers every frame until it is committed."""
+        if not self.connected or self._joining:
+            return
+        self._stroke = [item, 0]
+        self._schedule()
+
+    def end_stroke(self):
+        if self._stroke is not None:
+            item, sent = self._stroke
+            if sent:
+                self._live.append((LIVE_END, item.data(ANNOTATION_ID)))
+            self._stroke = None
+            self._schedule()
+
+    def flush(self):
+        """Send what this frame queued: at most one LIVE and one OPS message."""
+        if not self.connected or self._joining:
+            return
+        if self._stroke is not None:
+            item, sent = self._stroke
+            if item.scene() is None:
+                # dropped without being committed
+                self.end_stroke()
+            elif item.point_count() > sent:
+                count = item.point_count()
+                chunk = item.points()[sent:count].astype('<f4').tobytes()
+                key = item.data(ANNOTATION_ID)
+                self._live.append((LIVE_START, key, pen_to_record(item.pen()), chunk) if not sent
+                                  else (LIVE_POINTS, key, chunk))
+                self._stroke[1] = count
+        if self._live:
+            self._send_batch(LIVE, self._live)
+            self._live = []
+        if self._ops:
+            self._send_batch(OPS, self._ops)
+            self._ops = []
+        if self._stroke is not None:
+            # keep streaming the stroke while it is drawn
+            self._flush_timer.start()
+
+    def ping(self):
+        if self.peers:
+            self._send(PING, EVERYONE, PING_STAMP.pack(self._clock.nsecsElapsed() / 1e6))
+
+    def _schedule(self):
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _send_batch(self, kind, entries):
+        payload = encode_batch(entries)
+        metrics.record('sync.batch_bytes', len(payload))
+        self._send(kind, EVERYONE, payload)
+
+    def _send(self, kind, target, payload):
+        data = FRAME.pack(len(payload), kind, target) + payload
+        self._socket.write(data)
+        self.sent_bytes += len(data)
+        self.sent_messages += 1
+
+    # ---------- peers' changes ----------
+    def _next_message(self):
+        if len(self._buffer) < FRAME.size:
+            return None
+        length, kind, sender = FRAME.unpack_from(self._buffer)
+        if length > MAX_PAYLOAD:
+            raise SyncError(f"message of {length} bytes from the relay")
+        if len(self._buffer) < FRAME.size + length:
+            return None
+        payload = bytes(self._buffer[FRAME.size:FRAME.size + length])
+        del self._buffer[:FRAME.size + length]
+        return kind, sender, payload
+
+    def _read(self):
+        self._buffer += bytes(self._socket.readAll())
+        changed = False
+        try:
+            message = self._next_message()
+            while message is not None:
+                kind, sender, payload = message
+                if self.peer is None:
+                    self._welcome(kind, payload)
+                else:
+                    changed = self._dispatch(kind, sender, payload) or changed
+                    if self._backlog:
+                        # the relay sends the logged steps right after the WELCOME
+                        self._backlog -= 1
+                        if not self._backlog:
+                            self._joined()
+                message = self._next_message()
+        except SyncError as e:
+            if self._joining:
+                self._fail(str(e))
+                return
+            print(f"Shared session: {e}", file=sys.stderr)
+            self._socket.abort()
+        if changed:
+            self.changed.emit()
+
+    def _dispatch(self, kind, sender, payload):
+        """Handle one message; True if it changed the document."""
+        stats = self.peers.get(sender)
+        if stats is not None:
+            stats.received_bytes += FRAME.size + len(payload)
+            stats.messages += 1
+        if kind == OPS:
+            return self._apply_ops(sender, payload)
+        if kind == LIVE:
+            self._apply_live(sender, payload)
+        elif kind == PING:
+            self._send(PONG, sender, payload)
+        elif kind == PONG and stats is not None and len(payload) == PING_STAMP.size:
+            rtt = self._clock.nsecsElapsed() / 1e6 - PING_STAMP.unpack(payload)[0]
+            stats.rtts.append(rtt)
+            metrics.record('sync.rtt', rtt)
+        elif kind == JOINED:
+            self.peers[sender] = PeerStats(payload.decode('utf-8', 'replace'))
+        elif kind == LEFT:
+            self.peers.pop(sender, None)
+            for key in [key for key in self._previews if key[0] == sender]:
+                self._remove_preview(key)
+        return False
+
+    def _apply_ops(self, sender, payload):
+        try:
+            entries = decode_batch(payload)
+        except DeltaError:
+            self.dropped += 1
+            return False
+        with metrics.timing('sync.apply'):
+            for entry in entries:
+                try:
+                    action, label, record = entry
+                    command = COMMAND_TYPES[label].from_record(record, self.document, self.factory)
+                    if ACTIONS[action] == 'undo':
+                        command.undo(self.document)
+                    else:
+                        command.redo(self.document)
+                except (TypeError, ValueError, KeyError, IndexError):
+                    self.dropped += 1
+            # committed strokes replace their previews
+            for key in [key for key in self._previews if key[0] == sender and self.document.get(key[1]) is not None]:
+                self._remove_preview(key)
+        return True
+
+    def _apply_live(self, sender, payload):
+        try:
+            entries = decode_batch(payload)
+        except DeltaError:
+            self.dropped += 1
+            return
+        for entry in entries:
+            try:
+                if entry[0] == LIVE_START:
+                    _, annotation_id, pen, points = entry
+                    self._remove_preview((sender, annotation_id))
+                    item = StrokeItem(pen_from_record(pen))
+                    item.setZValue(annotation_id)
+                    item.add_points(_points_from_bytes(points))
+                    self.document.overlay_for(item).scene.addItem(item)
+                    self._previews[(sender, annotation_id)] = item
+                elif entry[0] == LIVE_POINTS:
+                    item = self._previews.get((sender, entry[1]))
+                    if item is not None:
+                        item.add_points(_points_from_bytes(entry[2]))
+                elif entry[0] == LIVE_END:
+                    self._remove_preview((sender, entry[1]))
+            except (TypeError, ValueError, IndexError):
+                self.dropped += 1
+
+    def _remove_preview(self, key):
+        item = self._previews.pop(key, None)
+        if item is not None and item.scene() is not None:
+            item.scene().removeItem(item)
+
+    def _lost(self):
+        if self._joining:
+            self._fail(f"{self._address} closed the connection")
+            return
+        if not self._closing:
+            print(f"Shared session ended: {self._socket.errorString()}", file=sys.stderr)
+        self.peer = None
+        self._flush_timer.stop()
+        self._ping_timer.stop()
+        for key in list(self._previews):
+            self._remove_preview(key)
+        self.disconnected.emit()
+
+    # ---------- reporting ----------
+    def peer_stats(self):
+        """Bandwidth and latency of the session, per peer, as plain data."""
+        return {
+            'peer': self.peer,
+            'name': self.name,
+            'sent_bytes': self.sent_bytes,
+            'sent_messages': self.sent_messages,
+            'dropped': self.dropped,
+            'peers': {str(peer): stats.summary() for peer, stats in sorted(self.peers.items())},
+        }
+
+    def report(self, file=sys.stderr):
+        print(f"sync: sent {self.sent_bytes / 1024:.1f} KB in {self.sent_messages} messages", file=file)
+        for peer, stats in sorted(self.peers.items()):
+            summary = stats.summary()
+            rtt = summary['rtt_ms_p50']
+            print(f"sync: peer {peer} ({summary['name']}): received {summary['received_bytes'] / 1024:.1f} KB, "
+                  f"{summary['received_kbit_per_s']:.1f} kbit/s, rtt p50 "
+                  f"{'-' if rtt is None else f'{rtt:.1f} ms'}", file=file)
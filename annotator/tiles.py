@@ -0,0 +1,101 @@
+import math
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QRectF
+from PyQt6.QtGui import QImage, QPainter
+
+from annotator.metrics import metrics
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_MAX_TILES = 256  # 64 MB of ARGB32 at 256x256 and a device pixel ratio of 1
+
+
+class TileCache:
+    """Square image tiles over a scene rect, rendered on demand.
+
+    A tile is rendered by render_tile(painter, tile_rect) the first time it is
+    painted after being invalidated, so a change only costs the tiles its bounds
+    touch. At most max_tiles are resident; the least recently painted ones are
+    dropped first and simply re-rendered when they are exposed again.
+
+    Tiles are rendered at the device pixel ratio of the device they are painted
+    on, so a 200% display gets 512x512 pixels for a 256 px tile rather than an
+    upscaled, blurry one; when the ratio changes (the window moved to another
+    screen) the cache starts over at the new one.
+    """
+    def __init__(self, scene_rect: QRectF, render_tile, tile_size=DEFAULT_TILE_SIZE, max_tiles=DEFAULT_MAX_TILES):
+        self.rect = QRectF(scene_rect)
+        self.tile_size = int(tile_size)
+        self.max_tiles = max(1, int(max_tiles))
+        self.columns = max(1, math.ceil(scene_rect.width() / self.tile_size))
+        self.rows = max(1, math.ceil(scene_rect.height() / self.tile_size))
+        self.device_pixel_ratio = 1.0
+        self._render_tile = render_tile
+        self._tiles = OrderedDict()  # (column, row) -> QImage, least recently used first
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def tile_rect(self, key) -> QRectF:
+        column, row = key
+        size = self.tile_size
+        return QRectF(self.rect.x() + column * size, self.rect.y() + row * size, size, size)
+
+    def keys_in(self, rect: QRectF):
+        """Keys of the tiles a scene rect overlaps."""
+        rect = rect.intersected(self.rect)
+        if rect.isEmpty():
+            return []
+        size = self.tile_size
+        first_column = max(0, int((rect.left() - self.rect.x()) // size))
+        first_row = max(0, int((rect.top() - self.rect.y()) // size))
+        last_column = min(self.columns - 1, int((rect.right() - self.rect.x()) // size))
+        last_row = min(self.rows - 1, int((rect.bottom() - self.rect.y()) // size))
+        return [(column, row) for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
+
+    def invalidate(self, rect: QRectF):
+        for key in self.keys_in(rect):
+            self._tiles.pop(key, None)
+
+    def clear(self):
+        self._tiles.clear()
+
+    def paint(self, painter: QPainter, rect: QRectF):
+        """Draw the tiles overlapping a scene rect, rendering the missing ones."""
+        ratio = painter.device().devicePixelRatio()
+        if ratio != self.device_pixel_ratio:
+            self.device_pixel_ratio = ratio
+            self._tiles.clear()
+        rendered = 0
+        for key in self.keys_in(rect):
+            image = self._tiles.get(key)
+            if image is None:
+                image = self._render(key)
+                rendered += 1
+            else:
+                self._tiles.move_to_end(key)
+            tile_rect = self.tile_rect(key)
+            exposed = tile_rect.intersected(rect)
+            source = exposed.translated(-tile_rect.topLeft())
+            painter.drawImage(exposed, image, QRectF(source.topLeft() * ratio, source.size() * ratio))
+        if rendered:
+            metrics.record('tiles.rendered', rendered)
+
+    def _render(self, key):
+        edge = math.ceil(self.tile_size * self.device_pixel_ratio)
+        image = QImage(edge, edge, QImage.Format.Format_ARGB32_Premultiplied)
+        # the painter keeps working in scene units
+        image.setDevicePixelRatio(self.device_pixel_ratio)
+        image.fill(Qt.GlobalColor.transparent)
+        tile_rect = self.tile_rect(key)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.translate(-tile_rect.topLeft())
+        painter.setClipRect(tile_rect)
+        self._render_tile(painter, tile_rect)
+        painter.end()
+        self._tiles[key] = image
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return image
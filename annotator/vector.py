@@ -0,0 +1,324 @@
+"""Streaming SVG and PDF export of annotation records.
+
+Both writers are generators over codec records (see annotator.codec) that yield
+the file a few hundred bytes at a time, so a session is never assembled into
+one string or QPicture, and records can come straight from a lazy iterator.
+Coordinates are rounded to 0.1 px and paths are written with relative
+commands, which keeps archived sessions small; .svgz is gzip-compressed and
+the PDF content stream is deflated as it is written.
+"""
+import gzip
+import zlib
+from html import escape
+
+import numpy as np
+from PyQt6.QtCore import Qt, QRectF
+
+from annotator.codec import KIND_ELLIPSE, KIND_LINE, KIND_RECT, KIND_STROKE, KIND_TEXT
+
+VECTOR_SUFFIXES = ('.svg', '.svgz', '.pdf')
+
+# decimals kept for coordinates
+PRECISION = 1
+# records written between two progress calls
+PROGRESS_STEP = 256
+# QGraphicsTextItem layout, approximated: document margin, ascent and line height
+TEXT_MARGIN = 4.0
+TEXT_ASCENT = 0.9
+TEXT_LINE_HEIGHT = 1.15
+# scene pixels are 1/96 in, PDF units are 1/72 in
+PDF_UNITS_PER_PX = 0.75
+# circle approximation with four cubic Beziers
+KAPPA = 0.5522847498
+
+SVG_CAPS = {Qt.PenCapStyle.FlatCap.value: 'butt', Qt.PenCapStyle.SquareCap.value: 'square',
+            Qt.PenCapStyle.RoundCap.value: 'round'}
+SVG_JOINS = {Qt.PenJoinStyle.MiterJoin.value: 'miter', Qt.PenJoinStyle.BevelJoin.value: 'bevel',
+             Qt.PenJoinStyle.RoundJoin.value: 'round'}
+PDF_CAPS = {Qt.PenCapStyle.FlatCap.value: 0, Qt.PenCapStyle.RoundCap.value: 1,
+            Qt.PenCapStyle.SquareCap.value: 2}
+PDF_JOINS = {Qt.PenJoinStyle.MiterJoin.value: 0, Qt.PenJoinStyle.RoundJoin.value: 1,
+             Qt.PenJoinStyle.BevelJoin.value: 2}
+
+
+def is_vector_path(path):
+    return path.lower().endswith(VECTOR_SUFFIXES)
+
+
+def _num(value):
+    text = f"{value:.{PRECISION}f}".rstrip('0').rstrip('.')
+    return '0' if text in ('', '-0') else text
+
+
+def _rgba(rgba):
+    return (rgba >> 16) & 0xFF, (rgba >> 8) & 0xFF, rgba & 0xFF, ((rgba >> 24) & 0xFF) / 255.0
+
+
+def _stroke_outline(geometry, x, y):
+    """('curves', (m, 4, 2)) or ('polyline', (n, 2)) of a stroke record, in scene coordinates."""
+    points, curves = geometry
+    if curves is not None:
+        return 'curves', np.frombuffer(curves, dtype=np.float32).reshape(-1, 4, 2).astype(np.float64) + (x, y)
+    return 'polyline', np.frombuffer(points, dtype=np.float32).reshape(-1, 2).astype(np.float64) + (x, y)
+
+
+def arrow_head(x1, y1, x2, y2, width):
+    """Triangle drawn at the end of an arrow, as LineShape paints it; None for a zero-length line."""
+    dx, dy = x2 - x1, y2 - y1
+    length = (dx * dx + dy * dy) ** 0.5
+    if length <= 0.001:
+        return None
+    ux, uy = dx / length, dy / length
+    size = max(8.0, width * 3)
+    return ((x2, y2),
+            (x2 - ux * size - uy * (size / 2), y2 - uy * size + ux * (size / 2)),
+            (x2 - ux * size + uy * (size / 2), y2 - uy * size - ux * (size / 2)))
+
+
+def _text_lines(record):
+    """(lines, font size in px, (family, bold, italic), rgba, x, y of the first baseline)."""
+    _, _, _, x, y, (rgba, (family, points, weight, italic)), text = record
+    size = points * 96.0 / 72.0 if points > 0 else 16.0
+    return text.split('\n'), size, (family, weight >= 600, italic), rgba, x + TEXT_MARGIN, y + TEXT_MARGIN + size * TEXT_ASCENT
+
+
+# ---------- SVG ----------
+
+def _svg_path_data(kind, outline):
+    # round absolute coordinates first so relative steps do not accumulate error
+    scale = 10 ** PRECISION
+    if kind == 'polyline':
+        q = np.round(outline * scale).astype(np.int64)
+        steps = np.diff(q, axis=0) / scale
+        parts = [f"M{_num(q[0, 0] / scale)} {_num(q[0, 1] / scale)}"]
+        if len(steps):
+            parts.append('l' + ' '.join(f"{_num(sx)} {_num(sy)}" for sx, sy in steps.tolist()))
+        else:
+            parts.append('l0 0')
+        return ''.join(parts)
+    q = np.round(outline * scale).astype(np.int64)
+    parts = [f"M{_num(q[0, 0, 0] / scale)} {_num(q[0, 0, 1] / scale)}c"]
+    rel = (q[:, 1:, :] - q[:, :1, :]) / scale
+    parts.append(' '.join(' '.join(_num(v) for v in segment) for segment in rel.reshape(-1, 6).tolist()))
+    return ''.join(parts)
+
+
+def _svg_stroke_attrs(style, fill='fill="none"'):
+    rgba, width, _, cap, join = style
+    r, g, b, a = _rgba(rgba)
+    attrs = (f'{fill} stroke="#{r:02x}{g:02x}{b:02x}" stroke-width="{_num(width)}" '
+             f'stroke-linecap="{SVG_CAPS.get(cap, "round")}" stroke-linejoin="{SVG_JOINS.get(join, "round")}"')
+    if a < 1:
+        attrs += f' stroke-opacity="{a:.3g}"'
+    return attrs
+
+
+def svg_chunks(records, scene_rect: QRectF):
+    """Yield an SVG document for the records, one element at a time."""
+    w, h = scene_rect.width(), scene_rect.height()
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           f'<svg xmlns="http://www.w3.org/2000/svg" width="{_num(w)}" height="{_num(h)}" '
+           f'viewBox="{_num(scene_rect.x())} {_num(scene_rect.y())} {_num(w)} {_num(h)}">\n')
+    for record in records:
+        kind, _, _, x, y, style, geometry = record
+        if kind == KIND_STROKE:
+            outline_kind, outline = _stroke_outline(geometry, x, y)
+            if len(outline):
+                yield f'<path d="{_svg_path_data(outline_kind, outline)}" {_svg_stroke_attrs(style)}/>\n'
+        elif kind == KIND_RECT:
+            rx, ry, rw, rh = geometry
+            yield (f'<rect x="{_num(rx + x)}" y="{_num(ry + y)}" width="{_num(rw)}" height="{_num(rh)}" '
+                   f'{_svg_stroke_attrs(style)}/>\n')
+        elif kind == KIND_ELLIPSE:
+            rx, ry, rw, rh = geometry
+            yield (f'<ellipse cx="{_num(rx + x + rw / 2)}" cy="{_num(ry + y + rh / 2)}" rx="{_num(rw / 2)}" '
+                   f'ry="{_num(rh / 2)}" {_svg_stroke_attrs(style)}/>\n')
+        elif kind == KIND_LINE:
+            x1, y1, x2, y2, arrow = geometry
+            x1, y1, x2, y2 = x1 + x, y1 + y, x2 + x, y2 + y
+            yield (f'<line x1="{_num(x1)}" y1="{_num(y1)}" x2="{_num(x2)}" y2="{_num(y2)}" '
+                   f'{_svg_stroke_attrs(style)}/>\n')
+            head = arrow_head(x1, y1, x2, y2, style[1]) if arrow else None
+            if head is not None:
+                r, g, b, a = _rgba(style[0])
+                fill = f'fill="#{r:02x}{g:02x}{b:02x}"' + (f' fill-opacity="{a:.3g}"' if a < 1 else '')
+                points = ' '.join(f"{_num(px)},{_num(py)}" for px, py in head)
+                yield f'<polygon points="{points}" {_svg_stroke_attrs(style, fill)}/>\n'
+        elif kind == KIND_TEXT:
+            lines, size, (family, bold, italic), rgba, tx, ty = _text_lines(record)
+            r, g, b, a = _rgba(rgba)
+            attrs = f'font-family="{escape(family)}" font-size="{_num(size)}" fill="#{r:02x}{g:02x}{b:02x}"'
+            if a < 1:
+                attrs += f' fill-opacity="{a:.3g}"'
+            if bold:
+                attrs += ' font-weight="bold"'
+            if italic:
+                attrs += ' font-style="italic"'
+            spans = ''.join(f'<tspan x="{_num(tx)}" y="{_num(ty + i * size * TEXT_LINE_HEIGHT)}">{escape(line, quote=False)}</tspan>'
+                            for i, line in enumerate(lines))
+            yield f'<text {attrs} xml:space="preserve">{spans}</text>\n'
+    yield '</svg>\n'
+
+
+# ---------- PDF ----------
+
+def _pdf_string(text):
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _pdf_ellipse(cx, cy, rx, ry):
+    kx, ky = rx * KAPPA, ry * KAPPA
+    n = _num
+    return (f"{n(cx + rx)} {n(cy)} m "
+            f"{n(cx + rx)} {n(cy + ky)} {n(cx + kx)} {n(cy + ry)} {n(cx)} {n(cy + ry)} c "
+            f"{n(cx - kx)} {n(cy + ry)} {n(cx - rx)} {n(cy + ky)} {n(cx - rx)} {n(cy)} c "
+            f"{n(cx - rx)} {n(cy - ky)} {n(cx - kx)} {n(cy - ry)} {n(cx)} {n(cy - ry)} c "
+            f"{n(cx + kx)} {n(cy - ry)} {n(cx + rx)} {n(cy - ky)} {n(cx + rx)} {n(cy)} c h")
+
+
+class _PdfContent:
+    """Content stream operators for records; graphics state names are collected as they are used."""
+    def __init__(self):
+        self.alphas = {}  # alpha -> ExtGState name
+
+    def _alpha(self, a):
+        if a >= 1:
+            return '/GSOpaque gs '
+        name = self.alphas.setdefault(round(a, 3), f'GS{len(self.alphas)}')
+        return f'/{name} gs '
+
+    def _pen(self, style):
+        rgba, width, _, cap, join = style
+        r, g, b, a = _rgba(rgba)
+        return (f"{self._alpha(a)}{r / 255:.3g} {g / 255:.3g} {b / 255:.3g} RG {_num(width)} w "
+                f"{PDF_CAPS.get(cap, 1)} J {PDF_JOINS.get(join, 1)} j ")
+
+    def operators(self, record):
+        kind, _, _, x, y, style, geometry = record
+        n = _num
+        if kind == KIND_STROKE:
+            outline_kind, outline = _stroke_outline(geometry, x, y)
+            if not len(outline):
+                return ''
+            if outline_kind == 'polyline':
+                first = outline[0]
+                rest = outline[1:] if len(outline) > 1 else outline[:1]
+                path = f"{n(first[0])} {n(first[1])} m " + ' '.join(f"{n(px)} {n(py)} l" for px, py in rest.tolist())
+            else:
+                path = f"{n(outline[0, 0, 0])} {n(outline[0, 0, 1])} m " + ' '.join(
+                    ' '.join(n(v) for v in segment) + ' c' for segment in outline[:, 1:, :].reshape(-1, 6).tolist())
+            return f"{self._pen(style)}{path} S\n"
+        if kind == KIND_RECT:
+            rx, ry, rw, rh = geometry
+            return f"{self._pen(style)}{n(rx + x)} {n(ry + y)} {n(rw)} {n(rh)} re S\n"
+        if kind == KIND_ELLIPSE:
+            rx, ry, rw, rh = geometry
+            return f"{self._pen(style)}{_pdf_ellipse(rx + x + rw / 2, ry + y + rh / 2, rw / 2, rh / 2)} S\n"
+        if kind == KIND_LINE:
+            x1, y1, x2, y2, arrow = geometry
+            x1, y1, x2, y2 = x1 + x, y1 + y, x2 + x, y2 + y
+            ops = f"{self._pen(style)}{n(x1)} {n(y1)} m {n(x2)} {n(y2)} l S\n"
+            head = arrow_head(x1, y1, x2, y2, style[1]) if arrow else None
+            if head is not None:
+                r, g, b, _ = _rgba(style[0])
+                (ax, ay), (bx, by), (cx, cy) = head
+                ops += (f"{r / 255:.3g} {g / 255:.3g} {b / 255:.3g} rg "
+                        f"{n(ax)} {n(ay)} m {n(bx)} {n(by)} l {n(cx)} {n(cy)} l h B\n")
+            return ops
+        if kind == KIND_TEXT:
+            lines, size, _, rgba, tx, ty = _text_lines(record)
+            r, g, b, a = _rgba(rgba)
+            ops = [f"{self._alpha(a)}{r / 255:.3g} {g / 255:.3g} {b / 255:.3g} rg BT /F1 {n(size)} Tf "]
+            for i, line in enumerate(lines):
+                # undo the page's y flip so glyphs stand upright
+                ops.append(f"1 0 0 -1 {n(tx)} {n(ty + i * size * TEXT_LINE_HEIGHT)} Tm ")
+                ops.append(_pdf_string(line).decode('latin-1') + ' Tj ')
+            ops.append('ET\n')
+            return ''.join(ops)
+        return ''
+
+
+def pdf_chunks(records, scene_rect: QRectF):
+    """Yield a one-page PDF for the records; the content stream is deflated as it is produced."""
+    offsets = {}
+    position = 0
+
+    def emit(data):
+        nonlocal position
+        position += len(data)
+        return data
+
+    def start_object(number):
+        offsets[number] = position
+        return f"{number} 0 obj\n".encode('ascii')
+
+    width = scene_rect.width() * PDF_UNITS_PER_PX
+    height = scene_rect.height() * PDF_UNITS_PER_PX
+    yield emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield emit(start_object(1) + b'<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+    yield emit(start_object(2) + b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n')
+    yield emit(start_object(3) + (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_num(width)} {_num(height)}] '
+                                  f'/Contents 4 0 R /Resources 6 0 R >>\nendobj\n').encode('ascii'))
+    yield emit(start_object(4) + b'<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n')
+
+    content = _PdfContent()
+    compressor = zlib.compressobj(6)
+    length = 0
+    # scene pixels, y down, origin at the scene rect's top left
+    header = (f"{PDF_UNITS_PER_PX} 0 0 {-PDF_UNITS_PER_PX} 0 {_num(height)} cm "
+              f"1 0 0 1 {_num(-scene_rect.x())} {_num(-scene_rect.y())} cm\n")
+    for text in _prepend(header, (content.operators(record) for record in records)):
+        data = compressor.compress(text.encode('latin-1'))
+        if data:
+            length += len(data)
+            yield emit(data)
+    data = compressor.flush()
+    length += len(data)
+    yield emit(data)
+    yield emit(b'\nendstream\nendobj\n')
+    yield emit(start_object(5) + f'{length}\nendobj\n'.encode('ascii'))
+
+    states = ' '.join(f'/{name} << /CA {alpha} /ca {alpha} >>' for alpha, name in content.alphas.items())
+    yield emit(start_object(6) + (f'<< /Font << /F1 7 0 R >> /ExtGState << /GSOpaque << /CA 1 /ca 1 >> {states} >> >>'
+                                  '\nendobj\n').encode('ascii'))
+    yield emit(start_object(7) + b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                 b'/Encoding /WinAnsiEncoding >>\nendobj\n')
+
+    xref = position
+    entries = ''.join(f'{offsets[number]:010d} 00000 n \n' for number in range(1, 8))
+    yield emit((f'xref\n0 8\n0000000000 65535 f \n{entries}'
+                f'trailer\n<< /Size 8 /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n').encode('ascii'))
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def write_vector(path, records, scene_rect: QRectF, progress=None):
+    """Stream records to an .svg, .svgz or .pdf file, chosen by extension.
+
+    progress(done, total) is called every PROGRESS_STEP records; total is 0
+    when records is an iterator of unknown length.
+    """
+    lower = path.lower()
+    total = len(records) if hasattr(records, '__len__') else 0
+
+    def counted(records):
+        done = 0
+        for record in records:
+            yield record
+            done += 1
+            if progress is not None and (done % PROGRESS_STEP == 0 or done == total):
+                progress(done, total)
+
+    if lower.endswith('.pdf'):
+        with open(path, 'wb') as f:
+            for chunk in pdf_chunks(counted(records), scene_rect):
+                f.write(chunk)
+        return
+    opener = gzip.open if lower.endswith('.svgz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        for chunk in svg_chunks(counted(records), scene_rect):
+            f.write(chunk)
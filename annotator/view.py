@@ -0,0 +1,85 @@
+import time
+
+from PyQt6.QtCore import Qt, QRect, QRectF
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QPainter
+from PyQt6.QtWidgets import QGraphicsView
+
+from annotator.metrics import metrics
+
+HUD_MARGIN = 12  # from the top-left corner of the overlay
+HUD_PADDING = 6
+
+REPAINT_MODES = {
+    # repaint only the bounding rects of items and handles that changed
+    'dirty': QGraphicsView.ViewportUpdateMode.MinimalViewportUpdate,
+    # repaint the whole overlay on every change
+    'full': QGraphicsView.ViewportUpdateMode.FullViewportUpdate,
+}
+
+
+class OverlayGraphicsView(QGraphicsView):
+    """Base view for the translucent fullscreen overlays."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.repaint_mode = 'full'
+        self.setViewportUpdateMode(REPAINT_MODES['full'])
+        self.hud_lines = []  # drawn over the top-left corner, see set_hud
+        self.hud_font = QFont('monospace', 9)
+        self.hud_font.setStyleHint(QFont.StyleHint.TypeWriter)
+        self._hud_rect = QRect()
+
+    def set_repaint_mode(self, mode):
+        if mode not in REPAINT_MODES:
+            raise ValueError(f"unknown repaint mode {mode!r}, expected one of {sorted(REPAINT_MODES)}")
+        self.repaint_mode = mode
+        self.setViewportUpdateMode(REPAINT_MODES[mode])
+        self.viewport().update()
+
+    def drawBackground(self, painter: QPainter, rect: QRectF):
+        # With partial updates the exposed area still holds the previous frame;
+        # reset it to fully transparent so erased or moved ink does not linger
+        # on the translucent window.
+        if self.repaint_mode == 'dirty':
+            mode = painter.compositionMode()
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+            painter.fillRect(rect, Qt.GlobalColor.transparent)
+            painter.setCompositionMode(mode)
+        super().drawBackground(painter, rect)
+
+    def set_hud(self, lines):
+        """Show lines of text in the corner of the overlay; no lines hide it."""
+        if lines == self.hud_lines:
+            return
+        font_metrics = QFontMetrics(self.hud_font)
+        rect = QRect()
+        if lines:
+            width = max(font_metrics.horizontalAdvance(line) for line in lines)
+            rect = QRect(HUD_MARGIN, HUD_MARGIN, width + 2 * HUD_PADDING,
+                         len(lines) * font_metrics.lineSpacing() + 2 * HUD_PADDING)
+        # only the HUD's corner is repainted
+        self.viewport().update(self._hud_rect.united(rect))
+        self.hud_lines = list(lines)
+        self._hud_rect = rect
+
+    def paintEvent(self, event):
+        start = time.perf_counter()
+        super().paintEvent(event)
+        metrics.frame_painted((time.perf_counter() - start) * 1000)
+
+    def drawForeground(self, painter: QPainter, rect: QRectF):
+        super().drawForeground(painter, rect)
+        if not self.hud_lines:
+            return
+        painter.save()
+        painter.resetTransform()  # viewport pixels, whatever the scene transform
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        painter.fillRect(self._hud_rect, QColor(0, 0, 0, 180))
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+        painter.setFont(self.hud_font)
+        painter.setPen(QColor(255, 255, 255))
+        line_spacing = QFontMetrics(self.hud_font).lineSpacing()
+        ascent = QFontMetrics(self.hud_font).ascent()
+        for i, line in enumerate(self.hud_lines):
+            painter.drawText(self._hud_rect.left() + HUD_PADDING,
+                             self._hud_rect.top() + HUD_PADDING + ascent + i * line_spacing, line)
+        painter.restore()
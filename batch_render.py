@@ -0,0 +1,142 @@
+"""Render saved annotation documents to images without a display.
+
+    python batch_render.py sessions/ -o renders/ --jobs 8
+
+Documents are spread across a pool of worker processes, each running its own
+QApplication on the 'offscreen' platform and rebuilding items with the same
+shape classes as advanced_version.py. Per-worker throughput is reported at
+the end.
+"""
+import os
+
+# must be in place before any QApplication exists, in this process and in the workers
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PyQt6.QtCore import QRectF
+from PyQt6.QtWidgets import QApplication
+
+from advanced_version import ShapeFactory
+from annotator.document import DOCUMENT_SUFFIX, load_document
+from annotator.export import render_items, save_image, snapshot_records
+from annotator.vector import write_vector
+
+FORMATS = ('png', 'jpg', 'svg', 'svgz', 'pdf')
+
+_app = None  # the worker's QApplication
+_factory = None
+
+
+def _init_worker():
+    global _app, _factory
+    _app = QApplication.instance() or QApplication([sys.argv[0]])
+    _factory = ShapeFactory()
+
+
+def document_rect(items, size=None):
+    """Canvas for a document: the given (width, height) at the origin, or everything from the origin to its items."""
+    if size is not None:
+        return QRectF(0, 0, *size)
+    rect = QRectF(0, 0, 1, 1)
+    for item in items:
+        rect = rect.united(item.sceneBoundingRect())
+    return rect.toAlignedRect().toRectF()
+
+
+def render_document(path, output, size=None, scale=1.0):
+    """Render one document; returns (path, output, item count, seconds, worker pid, error or None)."""
+    start = time.perf_counter()
+    try:
+        items = load_document(path, _factory)
+        scene_rect = document_rect(items, size)
+        if output.lower().endswith(('.svg', '.svgz', '.pdf')):
+            write_vector(output, snapshot_records(items), scene_rect)
+        elif not save_image(render_items(items, scene_rect, scale), output):
+            raise OSError(f"could not write {output}")
+    except Exception as e:  # one bad document must not stop the batch
+        return path, output, 0, time.perf_counter() - start, os.getpid(), f"{type(e).__name__}: {e}"
+    return path, output, len(items), time.perf_counter() - start, os.getpid(), None
+
+
+def find_documents(inputs):
+    paths = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, _, names in os.walk(entry):
+                paths.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(DOCUMENT_SUFFIX))
+        else:
+            paths.append(entry)
+    return paths
+
+
+def output_path(path, output_dir, fmt):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir or os.path.dirname(path), f'{stem}.{fmt}')
+
+
+def _size(text):
+    try:
+        width, height = (int(v) for v in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    return width, height
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Render annotation documents (.sann) to images, headless.")
+    parser.add_argument('inputs', nargs='+', help="documents, or directories searched for *.sann")
+    parser.add_argument('-o', '--output-dir', default='',
+                        help="where to write the images (default: next to each document)")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='png', help="output format")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--size', type=_size, default=None, metavar='WxH',
+                        help="canvas size in pixels (default: from the origin to the furthest item)")
+    parser.add_argument('--scale', type=float, default=1.0, help="raster output size relative to the canvas")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    paths = find_documents(args.inputs)
+    if not paths:
+        print("no documents found", file=sys.stderr)
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = max(1, min(args.jobs, len(paths)))
+    workers = {}  # pid -> [documents, items, busy seconds]
+    failures = 0
+    start = time.perf_counter()
+    # Qt is not fork-safe: every worker starts a fresh interpreter
+    with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker) as pool:
+        futures = [pool.submit(render_document, path, output_path(path, args.output_dir, args.format),
+                               args.size, args.scale) for path in paths]
+        for future in as_completed(futures):
+            path, output, count, seconds, pid, error = future.result()
+            if error is not None:
+                failures += 1
+                print(f"FAILED {path}: {error}", file=sys.stderr)
+                continue
+            stats = workers.setdefault(pid, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += count
+            stats[2] += seconds
+            print(f"{path} -> {output} ({count} items, {seconds * 1000:.0f} ms)")
+    wall = time.perf_counter() - start
+    done = len(paths) - failures
+    print(f"\n{done} documents in {wall:.2f} s with {jobs} workers: "
+          f"{done / wall:.1f} docs/s, {done / wall / jobs:.1f} docs/s per core")
+    for pid, (documents, count, busy) in sorted(workers.items()):
+        print(f"  worker {pid}: {documents} docs, {count} items, "
+              f"{documents / busy if busy else 0:.1f} docs/s, {count / busy if busy else 0:.0f} items/s")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
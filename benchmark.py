@@ -0,0 +1,316 @@
+"""Headless benchmarks of the overlays' hot paths.
+
+    python benchmark.py --output results.json
+
+Each overlay (screen_annotation.py, advanced_version.py) is benchmarked in its
+own subprocess on Qt's 'offscreen' platform, driven by synthetic pointer
+traces sent to its view as real mouse events. Every frame of a trace delivers
+SAMPLES_PER_FRAME pointer samples, applies them and lets Qt repaint what
+changed, as one display frame would. Latencies are reported per operation as percentiles in
+milliseconds, with the process's peak resident memory after each workload, as
+JSON.
+"""
+import os
+
+# must be in place before any QApplication exists
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import importlib
+import json
+import math
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from PyQt6.QtCore import PYQT_VERSION_STR, QT_VERSION_STR, QEvent, QPointF, Qt
+from PyQt6.QtGui import QColor, QMouseEvent, QPen
+from PyQt6.QtWidgets import QApplication, QFileDialog, QInputDialog, QMessageBox
+
+from annotator.history import AddCommand
+from annotator.settings import OverlaySettings
+from annotator.strokes import StrokeItem
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TARGETS = ('screen_annotation', 'advanced_version')
+DEFAULT_SCENES = (1000, 10000, 100000)
+# pointer samples per display frame: a 240 Hz mouse on a 60 Hz screen
+SAMPLES_PER_FRAME = 4
+STROKE_FRAMES = 1000
+SWEEP_FRAMES = 240
+STORM_STEPS = 500
+
+
+def percentiles(samples):
+    """count, mean, p50/p90/p99 and max of latencies in seconds, reported in ms."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def rank(q):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p50': rank(0.50),
+        'p90': rank(0.90),
+        'p99': rank(0.99),
+        'max': ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Driver:
+    """Drives one ProfessionalScreenOverlay with mouse events and times what it does."""
+    def __init__(self, module, seed=0):
+        # dialogs are modal and would block a headless run
+        QMessageBox.information = staticmethod(lambda *args, **kwargs: QMessageBox.StandardButton.Ok)
+        QMessageBox.question = staticmethod(lambda *args, **kwargs: QMessageBox.StandardButton.Yes)
+        QInputDialog.getText = staticmethod(lambda *args, **kwargs: ('benchmark', True))
+        self.export_dir = tempfile.mkdtemp(prefix='annotation-benchmark-')
+        export_path = os.path.join(self.export_dir, 'export.png')
+        QFileDialog.getSaveFileName = staticmethod(lambda *args, **kwargs: (export_path, ''))
+
+        self.module = module
+        self.overlay = module.ProfessionalScreenOverlay(OverlaySettings(journal=False, fast_start=False, welcome=False,
+                                                                 single_instance=False))
+        self.overlay.show_overlay()
+        self.app = self.overlay.app
+        self.random = random.Random(seed)
+        self.results = {}
+        self.app.processEvents()
+
+    @property
+    def view(self):
+        return self.overlay.view
+
+    def size(self):
+        rect = self.view.viewport().rect()
+        return rect.width(), rect.height()
+
+    def record(self, name, seconds):
+        self.results.setdefault(name, []).append(seconds)
+
+    def _send(self, kind, x, y, buttons):
+        local = QPointF(x, y)
+        button = Qt.MouseButton.LeftButton if kind != QEvent.Type.MouseMove else Qt.MouseButton.NoButton
+        event = QMouseEvent(kind, local, self.view.viewport().mapToGlobal(local), button, buttons,
+                            Qt.KeyboardModifier.NoModifier)
+        QApplication.sendEvent(self.view.viewport(), event)
+
+    def press(self, x, y):
+        self._send(QEvent.Type.MouseButtonPress, x, y, Qt.MouseButton.LeftButton)
+
+    def move(self, x, y):
+        self._send(QEvent.Type.MouseMove, x, y, Qt.MouseButton.LeftButton)
+
+    def release(self, x, y):
+        self._send(QEvent.Type.MouseButtonRelease, x, y, Qt.MouseButton.NoButton)
+
+    def frame(self, samples):
+        """Deliver one frame of samples, apply them and paint; returns the seconds it took."""
+        start = time.perf_counter()
+        for x, y in samples:
+            self.move(x, y)
+        self.overlay.input_coalescer.flush()
+        self.paint()
+        return time.perf_counter() - start
+
+    def paint(self):
+        # scene changes reach the view as queued calls, then as update requests for the dirty regions
+        self.app.processEvents()
+        self.app.processEvents()
+
+    def trace(self, name, points):
+        """Press at the first point, move through the rest a frame at a time and release."""
+        start = time.perf_counter()
+        self.press(*points[0])
+        self.record(f'{name}.press', time.perf_counter() - start)
+        for i in range(1, len(points), SAMPLES_PER_FRAME):
+            self.record(f'{name}.frame', self.frame(points[i:i + SAMPLES_PER_FRAME]))
+        start = time.perf_counter()
+        self.release(*points[-1])
+        self.paint()
+        self.record(f'{name}.release', time.perf_counter() - start)
+
+    def scribble(self, frames):
+        """A wandering pen path across the view, frames * SAMPLES_PER_FRAME samples long."""
+        width, height = self.size()
+        x, y = self.random.uniform(0, width), self.random.uniform(0, height)
+        heading = self.random.uniform(0, 2 * math.pi)
+        points = [(x, y)]
+        for _ in range(frames * SAMPLES_PER_FRAME):
+            heading += self.random.uniform(-0.3, 0.3)
+            x = min(max(x + 3 * math.cos(heading), 0), width - 1)
+            y = min(max(y + 3 * math.sin(heading), 0), height - 1)
+            points.append((x, y))
+        return points
+
+    def sweep(self, frames):
+        """A zig-zag across the whole view, as an eraser is dragged over a page."""
+        width, height = self.size()
+        rows = 8
+        points = []
+        count = frames * SAMPLES_PER_FRAME
+        for i in range(count + 1):
+            t = i / count * rows
+            row = min(int(t), rows - 1)
+            across = t - row if row % 2 == 0 else 1 - (t - row)
+            points.append((across * (width - 1), (row + 0.5) * height / rows))
+        return points
+
+    def populate(self, count):
+        """Add count short committed strokes at random places as one undo step.
+
+        The strokes share one fitted template, as if loaded from a document;
+        fitting itself is measured by the pen workloads' release times.
+        """
+        width, height = self.size()
+        pen = QPen(QColor(255, 0, 0), 3, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+        template = StrokeItem(pen)
+        template.set_points([(4 * i, 3 * math.sin(i)) for i in range(8)])
+        template.commit()
+        points, curves = template.points(), template.curves()
+        start = time.perf_counter()
+        items = []
+        for _ in range(count):
+            item = StrokeItem(pen)
+            item.set_points(points)
+            item.set_curves(curves)
+            item.setPos(self.random.uniform(0, width), self.random.uniform(0, height))
+            self.overlay.drawings.attach(item)
+            items.append(item)
+        self.overlay.save_state(AddCommand(items))
+        self.paint()
+        self.record(f'scene{count}.populate', time.perf_counter() - start)
+
+    def timed(self, name, action):
+        start = time.perf_counter()
+        action()
+        self.paint()
+        self.record(name, time.perf_counter() - start)
+
+    def export(self, name):
+        """Time export_image on the GUI thread and until the worker has written the file."""
+        if not hasattr(self.overlay, 'export_image'):
+            return
+        start = time.perf_counter()
+        self.overlay.export_image()
+        self.record(f'{name}.gui', time.perf_counter() - start)
+        while self.overlay.export_job is not None:
+            self.app.processEvents()
+            time.sleep(0.001)
+        self.record(f'{name}.total', time.perf_counter() - start)
+
+
+def run_target(name, scenes, seed):
+    driver = Driver(importlib.import_module(name), seed)
+    report = {'screen': list(driver.size()), 'workloads': {}}
+
+    def finish(workload):
+        report['workloads'][workload] = {
+            'operations': {op: percentiles(samples) for op, samples in driver.results.items()},
+            'items': len(driver.overlay.drawings),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        driver.results = {}
+
+    driver.overlay.select_tool('pen')
+    for _ in range(5):
+        driver.trace('pen', driver.scribble(STROKE_FRAMES // 5))
+    finish('long_pen_strokes')
+
+    for count in scenes:
+        driver.timed(f'scene{count}.clear', driver.overlay.clear_all)
+        driver.populate(count)
+        driver.overlay.select_tool('pen')
+        driver.trace(f'scene{count}.pen', driver.scribble(120))
+        driver.export(f'scene{count}.export')
+        driver.overlay.select_tool('eraser')
+        driver.trace(f'scene{count}.eraser', driver.sweep(SWEEP_FRAMES))
+        finish(f'scene_{count}')
+
+    driver.timed('clear.clear_all', driver.overlay.clear_all)
+    driver.overlay.select_tool('pen')
+    for _ in range(STORM_STEPS):
+        driver.trace('storm.draw', driver.scribble(2))
+    for _ in range(STORM_STEPS):
+        driver.timed('storm.undo', driver.overlay.undo)
+    for _ in range(STORM_STEPS):
+        driver.timed('storm.redo', driver.overlay.redo)
+    finish('undo_redo_storm')
+
+    driver.timed('clear.clear_all', driver.overlay.clear_all)
+    driver.timed('clear.undo', driver.overlay.undo)
+    finish('clear_all')
+    shutil.rmtree(driver.export_dir, ignore_errors=True)
+    return report
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the overlays headless and report JSON.")
+    parser.add_argument('--target', choices=TARGETS, action='append',
+                        help="overlay to benchmark (default: both); may be repeated")
+    parser.add_argument('--scenes', default=','.join(map(str, DEFAULT_SCENES)),
+                        help="comma-separated scene sizes, in items (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic traces")
+    parser.add_argument('-o', '--output', default='', help="write the JSON here instead of to stdout")
+    parser.add_argument('--run', choices=TARGETS, help=argparse.SUPPRESS)  # one target, in this process
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    scenes = [int(v) for v in args.scenes.split(',') if v.strip()]
+    if args.run:
+        json.dump(run_target(args.run, scenes, args.seed), sys.stdout)
+        return 0
+    report = {
+        'python': platform.python_version(),
+        'qt': QT_VERSION_STR,
+        'pyqt': PYQT_VERSION_STR,
+        'platform': platform.platform(),
+        'samples_per_frame': SAMPLES_PER_FRAME,
+        'scenes': scenes,
+        'targets': {},
+    }
+    failed = False
+    # every overlay creates its own QApplication, so each gets a fresh process
+    for target in args.target or TARGETS:
+        print(f"benchmarking {target}...", file=sys.stderr)
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', target, '--scenes',
+                                 ','.join(map(str, scenes)), '--seed', str(args.seed)],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            failed = True
+            report['targets'][target] = {'error': result.stderr.strip().splitlines()[-1:] or ['failed']}
+            print(result.stderr, file=sys.stderr)
+            continue
+        report['targets'][target] = json.loads(result.stdout)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,44 @@
+import time
+
+START_TIME = time.perf_counter()  # --startup-profile measures from here
+
 import sys
+
+if __name__ == "__main__":
+    # A second launch hands its command to the running instance before Qt is even loaded
+    from annotator.instance import forward_to_instance
+    status = forward_to_instance('screen_annotation', sys.argv)
+    if status is not None:
+        sys.exit(status)
+
 import os
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
-    QSlider, QToolButton, QColorDialog, QInputDialog, QGraphicsView,
-    QGraphicsScene,QGroupBox, QMessageBox, QFrame
+    QSlider, QToolButton, QColorDialog, QInputDialog, QGroupBox,
+    QMessageBox, QFrame, QFileDialog
 )
-from PyQt6.QtCore import Qt, QPointF, QRectF
+from PyQt6.QtCore import Qt, QPointF, QRectF, QThreadPool, QTimer, QT_VERSION_STR
 from PyQt6.QtGui import (
-    QPen, QPainterPath, QColor, QFont, QPalette, QGuiApplication, QIcon
+    QPen, QColor, QFont, QPalette, QGuiApplication, QIcon
 )
 
-class CustomGraphicsView(QGraphicsView):
+from annotator.startup import DeferredStartup, StartupProfile, lazy_import, load
+
+# numpy is first needed by the first annotation, not by the first frame
+lazy_import('numpy')
+
+from annotator.baking import BakedLayer
+from annotator.eraser import EraseGesture
+from annotator.instance import CommandError, ControlServer, server_name
+from annotator.history import AddCommand, ClearCommand, ReplaceCommand, UndoHistory
+from annotator.metrics import METRICS_FILTER, metrics
+from annotator.pointer import InputCoalescer
+from annotator.screens import ScreenDocument, ScreenOverlay
+from annotator.settings import OverlaySettings, parse_settings
+from annotator.strokes import StrokeItem
+from annotator.view import OverlayGraphicsView
+
+class CustomGraphicsView(OverlayGraphicsView):
     def __init__(self, parent, overlay_instance):
         super().__init__(parent)
         self.overlay_instance = overlay_instance
@@ -18,21 +46,32 @@ class CustomGraphicsView(QGraphicsView):
         self.setFrameStyle(QFrame.Shape.NoFrame)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.FullViewportUpdate)
 
     def mousePressEvent(self, event):
-        self.overlay_instance.mousePressEvent(event)
+        metrics.input_received()
+        with metrics.timing('input.press'):
+            self.overlay_instance.activate_view(self)
+            self.overlay_instance.mousePressEvent(event)
 
     def mouseMoveEvent(self, event):
-        self.overlay_instance.mouseMoveEvent(event)
+        # Hover moves draw nothing, so they start no input-to-paint measurement
+        if event.buttons() != Qt.MouseButton.NoButton:
+            metrics.input_received()
+        with metrics.timing('input.move'):
+            self.overlay_instance.mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        self.overlay_instance.mouseReleaseEvent(event)
+        metrics.input_received()
+        with metrics.timing('input.release'):
+            self.overlay_instance.mouseReleaseEvent(event)
 
 
 class ProfessionalScreenOverlay:
-    def __init__(self):
-        self.app = QApplication(sys.argv)
+    def __init__(self, settings=None, qt_args=None):
+        self.settings = settings or OverlaySettings()
+        imported = time.perf_counter()
+        # Qt only sees the arguments parse_settings() left over, never the overlay's own options
+        self.app = QApplication(qt_args if qt_args is not None else sys.argv[:1])
         self.app.setStyle('Fusion')
 
         # Set dark theme
@@ -79,50 +118,221 @@ class ProfessionalScreenOverlay:
 
         self.setup_professional_ui()
 
-        # Create overlay
-        self.overlay = QWidget()
-        self.overlay.setWindowFlags(Qt.WindowType.WindowStaysOnTopHint | Qt.WindowType.FramelessWindowHint)
-        self.overlay.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
-        self.overlay.setGeometry(QGuiApplication.primaryScreen().geometry())
-        overlay_layout = QVBoxLayout(self.overlay)
-        overlay_layout.setContentsMargins(0, 0, 0, 0)
-        self.view = CustomGraphicsView(None, self)
-        self.view.setScene(QGraphicsScene())
-        self.scene = self.view.scene()
-        screen_rect = self.overlay.geometry()
-        self.scene.setSceneRect(0, 0, screen_rect.width(), screen_rect.height())
-        overlay_layout.addWidget(self.view)
-        self.overlay.hide()
+        # Bind keyboard shortcuts
+        self.control_window.keyPressEvent = self.key_press_event
+
+        # Later launches send their commands here instead of starting another overlay
+        self.control_server = None
+        if self.settings.single_instance and not self.settings.replay_input:
+            self.control_server = ControlServer(server_name('screen_annotation'), self.run_command)
+            if not self.control_server.listen():
+                print("Another instance is already running; this one takes no commands", file=sys.stderr)
+                self.control_server = None
+
+        self.startup_profile = None
+        if self.settings.startup_profile:
+            self.startup_profile = StartupProfile(START_TIME, self.control_window)
+            self.startup_profile.mark('imports', imported)
+            self.startup_profile.mark('control window')
+
+        # The overlays and everything behind them are built once the control window is on screen
+        self.started = False
+        self.recorder = None
+        self.replayer = None
+        if self.settings.fast_start:
+            self.deferred_startup = DeferredStartup(self.app, self.control_window, self.finish_startup)
+        else:
+            self.finish_startup()
+
+    def finish_startup(self):
+        if self.startup_profile is not None and self.settings.fast_start:
+            # this runs right after the control window's first frame
+            self.startup_profile.first_frame()
+        # Load numpy now rather than in the middle of the first stroke
+        load('numpy')
+
+        # Input is recorded to, or replayed from, a trace file
+        try:
+            if self.settings.replay_input or self.settings.record_input:
+                from annotator.recording import InputRecorder, InputReplayer
+            if self.settings.replay_input:
+                self.replayer = InputReplayer(self.settings.replay_input, self.settings.replay_speed)
+            if self.settings.record_input:
+                self.recorder = InputRecorder(self.settings.record_input)
+                self.recorder.watch_buttons(self.control_window,
+                                            [*self.tool_buttons.values(), self.overlay_btn, self.color_button])
+        except (OSError, ValueError) as e:  # TraceError is a ValueError
+            sys.exit(f"Input trace: {e}")
+
+        # Create one overlay per screen, all showing one document of committed QGraphicsItems
+        self.tool_cursor = None
+        self.drawings = ScreenDocument(self.create_screen_overlay)
+        for screen in QGuiApplication.screens():
+            self.drawings.add_screen(screen)
+        self.drawings.watch(self.app)
+        self.app.screenRemoved.connect(self.screen_removed)
+        self.activate_view(self.drawings.add_screen(QGuiApplication.primaryScreen()).view)
 
         # Drawing variables
         self.drawing = False
         self.start_pos = None
-        self.current_path = None
         self.current_item = None
-        self.drawings = []  # list of QGraphicsItem
-        self.undo_stack = []
-        self.redo_stack = []
-
-        # Bind keyboard shortcuts
-        self.control_window.keyPressEvent = self.key_press_event
-        self.overlay.keyPressEvent = self.key_press_event
-
-        # Show welcome message
-        QMessageBox.information(self.control_window, "Professional Screen Annotator",
-                                "Welcome to Professional Screen Annotator!\n\n"
-                                "Features:\n"
-                                "• Multiple drawing tools with icons\n"
-                                "• Professional UI design\n"
-                                "• Undo/Redo functionality\n"
-                                "• Keyboard shortcuts\n\n"
-                                "Click 'Start Drawing' to begin!")
+        self.history = UndoHistory(self.drawings, self.settings.history_budget_bytes)
+        self.journal = None
+        # a shared session's document is rebuilt from the relay, not from a journal
+        if self.settings.journal and self.replayer is None and not self.settings.sync:
+            self.start_journal()
+        self.sync = None
+        if self.settings.sync:
+            self.start_sync()
+        self.erase_gesture = None  # the eraser drag in progress
+        self.export_job = None  # the export command running on the thread pool
+        # Drag samples are applied to the scene once per frame
+        self.input_coalescer = InputCoalescer(self.apply_move_samples, self.settings.max_fps)
+
+        # Live timings in a corner of the overlay
+        self.hud_timer = QTimer()
+        self.hud_timer.setInterval(500)
+        self.hud_timer.timeout.connect(self.update_hud)
+        if self.settings.hud:
+            self.hud_timer.start()
+        self.profile_capture = None  # created by the first Ctrl+Shift+P
+        self.window_title = self.control_window.windowTitle()
+
+        if self.recorder is not None:
+            # A replay starts from the state the recording started in
+            self.recorder.tool(self.current_tool)
+            self.recorder.color(self.current_color)
+            self.recorder.size(self.brush_size)
+            self.recorder.overlay(self.overlay_active)
+
+        if self.replayer is not None:
+            self.replayer.finished.connect(self.replay_finished)
+            self.replayer.start(self)
+
+        # Show welcome message, without holding up the app
+        if self.settings.welcome and self.replayer is None:
+            self.welcome = QMessageBox(QMessageBox.Icon.Information, "Professional Screen Annotator",
+                                       "Welcome to Professional Screen Annotator!\n\n"
+                                       "Features:\n"
+                                       "• Multiple drawing tools with icons\n"
+                                       "• Professional UI design\n"
+                                       "• Undo/Redo functionality\n"
+                                       "• Keyboard shortcuts\n\n"
+                                       "Click 'Start Drawing' to begin!",
+                                       QMessageBox.StandardButton.Ok, self.control_window)
+            self.welcome.setWindowModality(Qt.WindowModality.NonModal)
+            self.welcome.show()
+
+        self.started = True
+        if self.startup_profile is not None:
+            self.startup_profile.mark('ready')
+
+        if self.settings.command:
+            try:
+                self.run_command(list(self.settings.command))
+            except CommandError as e:
+                print(e, file=sys.stderr)
+
+    def start_journal(self):
+        # Autosave every history step; after a crash, offer to bring the annotations back
+        from annotator.journal import DEFAULT_JOURNAL_DIR, Journal, JournalError, discard_session, has_session, recover
+        directory = self.settings.journal_dir or DEFAULT_JOURNAL_DIR
+        try:
+            if has_session(directory):
+                reply = QMessageBox.question(self.control_window, "Recover Annotations",
+                                             "The last session did not exit cleanly.\nRecover its annotations?",
+                                             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                if reply == QMessageBox.StandardButton.Yes:
+                    recover(self.drawings, self.history.factory, directory)
+                else:
+                    discard_session(directory)
+            self.journal = Journal(self.drawings, directory)
+            self.journal.start()
+        except (OSError, JournalError) as e:
+            QMessageBox.warning(self.control_window, "Recover Annotations", f"Autosave is off for this session:\n{e}")
+            self.journal = None
+            return
+        self.journal.failed.connect(self.journal_failed)
+        self.history.listeners.append(self.journal)
+
+    def journal_failed(self, message):
+        # Autosave stops at its first write error; say so once
+        QMessageBox.warning(self.control_window, "Autosave", f"Autosave stopped for this session:\n{message}")
+
+    def start_sync(self):
+        # Annotations are shared with the other overlays connected to the relay
+        from annotator.sync import SyncClient, SyncError, parse_address
+        try:
+            address = parse_address(self.settings.sync)
+        except SyncError as e:
+            self.sync_failed(str(e))
+            return
+        rate = self.settings.max_fps or QGuiApplication.primaryScreen().refreshRate() or 60
+        self.sync = SyncClient(self.drawings, self.history.factory, self.settings.sync_name, 1000 / rate,
+                               self.control_window)
+        self.sync.failed.connect(self.sync_failed)
+        self.sync.changed.connect(self.record_document_metrics)
+        self.history.listeners.append(self.sync)
+        # Joins in the background; what is drawn meanwhile is sent once the shared annotations are in
+        self.sync.connect_to(*address)
+
+    def sync_failed(self, message):
+        QMessageBox.warning(self.control_window, "Shared Session", f"Not sharing this session:\n{message}")
+        if self.sync is not None:
+            self.history.listeners.remove(self.sync)
+            self.sync.deleteLater()
+            self.sync = None
 
     def closeEvent(self, event):
-        # Close overlay if open
-        if self.overlay.isVisible():
-            self.overlay.close()
+        if self.control_server is not None:
+            self.control_server.close()
+        if not self.started:
+            # Closed before the overlays were built
+            self.app.quit()
+            return
+        # A clean exit leaves no journal to recover
+        if self.journal is not None:
+            self.journal.close()
+        if self.sync is not None:
+            self.sync.report()
+            self.sync.close()
+        if self.profile_capture is not None and self.profile_capture.active:
+            self.toggle_profiling()
+        if self.recorder is not None:
+            self.recorder.close()
+        # Close the overlays
+        for overlay in self.drawings.overlays.values():
+            overlay.close()
         self.app.quit()
 
+    def create_screen_overlay(self, screen):
+        view = CustomGraphicsView(None, self)
+        view.set_repaint_mode(self.settings.repaint_mode)
+        if self.tool_cursor is not None:
+            view.setCursor(self.tool_cursor)
+        layer = None
+        if self.settings.baked_layer:
+            layer = BakedLayer(QRectF(screen.geometry()), self.settings.tile_size, self.settings.max_tiles)
+        overlay = ScreenOverlay(screen, view, layer)
+        overlay.widget.keyPressEvent = self.key_press_event
+        if self.recorder is not None:
+            self.recorder.watch(view)
+        if self.overlay_active:
+            overlay.show()
+        return overlay
+
+    def activate_view(self, view):
+        # A press picks the screen whose scene the gesture is drawn in
+        self.view = view
+        self.scene = view.scene()
+
+    def screen_removed(self, screen):
+        if all(overlay.scene is not self.scene for overlay in self.drawings.overlays.values()):
+            self.drawing = False
+            self.current_item = None
+            self.activate_view(next(iter(self.drawings.overlays.values())).view)
+
     def load_icons(self):
         icon_files = {
             'pen': 'pen.png',
@@ -136,10 +346,11 @@ class ProfessionalScreenOverlay:
             'delete': 'delete.png'
         }
         icons_dir = os.path.join(os.path.dirname(__file__), 'icons')
+        # One directory listing instead of a stat per icon; QIcon decodes the file when first painted
+        available = set(os.listdir(icons_dir)) if os.path.isdir(icons_dir) else set()
         for tool, filename in icon_files.items():
-            icon_path = os.path.join(icons_dir, filename)
-            if os.path.exists(icon_path):
-                self.icons[tool] = QIcon(icon_path)
+            if filename in available:
+                self.icons[tool] = QIcon(os.path.join(icons_dir, filename))
             else:
                 self.icons[tool] = QIcon()  # Placeholder
 
@@ -260,6 +471,8 @@ class ProfessionalScreenOverlay:
                 btn.setStyleSheet("background-color: #7f8c8d; color: white; padding: 5px; border-radius: 5px;")
                 btn.setChecked(False)
         self.current_tool = tool
+        if self.recorder is not None:
+            self.recorder.tool(tool)
         cursors = {
             'pen': Qt.CursorShape.CrossCursor,
             'rectangle': Qt.CursorShape.CrossCursor,
@@ -268,17 +481,33 @@ class ProfessionalScreenOverlay:
             'text': Qt.CursorShape.IBeamCursor,
             'eraser': Qt.CursorShape.PointingHandCursor
         }
-        self.view.setCursor(cursors.get(tool, Qt.CursorShape.CrossCursor))
+        self.tool_cursor = cursors.get(tool, Qt.CursorShape.CrossCursor)
+        for overlay in self.drawings.overlays.values():
+            overlay.view.setCursor(self.tool_cursor)
 
     def choose_color(self):
         color = QColorDialog.getColor(self.current_color, self.control_window, "Choose Color")
         if color.isValid():
-            self.current_color = color
-            self.color_button.setStyleSheet(f"background-color: {color.name()}; border-radius: 3px;")
+            self.set_color(color)
+
+    def set_color(self, color):
+        self.current_color = color
+        self.color_button.setStyleSheet(f"background-color: {color.name()}; border-radius: 3px;")
+        if self.recorder is not None:
+            self.recorder.color(color)
 
     def update_size(self, value):
         self.brush_size = value
         self.size_value.setText(str(value))
+        if self.recorder is not None:
+            self.recorder.size(value)
+
+    def ask(self, dialog, default):
+        """Run a dialog and return its answer; a replay answers with the recorded one instead."""
+        answer = self.replayer.answer(default) if self.replayer is not None else dialog()
+        if self.recorder is not None:
+            self.recorder.answer(answer)
+        return answer
 
     def toggle_overlay(self):
         if self.overlay_active:
@@ -287,16 +516,21 @@ class ProfessionalScreenOverlay:
             self.show_overlay()
 
     def show_overlay(self):
-        self.overlay.showFullScreen()
-        self.overlay.raise_()
+        for overlay in self.drawings.overlays.values():
+            overlay.show()
         self.overlay_active = True
+        if self.recorder is not None:
+            self.recorder.overlay(True)
         # Keep button size consistent here as well
         self.overlay_btn.setText("Hide Drawing")
         self.overlay_btn.setStyleSheet("background-color: #e67e22; color: white; font: bold 10pt 'Segoe UI'; padding: 8px; border-radius: 5px;")
 
     def hide_overlay(self):
-        self.overlay.hide()
+        for overlay in self.drawings.overlays.values():
+            overlay.hide()
         self.overlay_active = False
+        if self.recorder is not None:
+            self.recorder.overlay(False)
         self.overlay_btn.setText("Start Drawing")
         self.overlay_btn.setStyleSheet("background-color: #27ae60; color: white; font: bold 10pt 'Segoe UI'; padding: 8px; border-radius: 5px;")
 
@@ -308,145 +542,314 @@ class ProfessionalScreenOverlay:
             pen = QPen(self.current_color, self.brush_size, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
             
             if self.current_tool == 'pen':
-                self.current_path = QPainterPath()
-                self.current_path.moveTo(pos)
-                self.current_item = self.scene.addPath(self.current_path, pen)
+                self.current_item = StrokeItem(pen, pos)
+                self.drawings.assign_id(self.current_item)
+                self.scene.addItem(self.current_item)
+                if self.sync is not None:
+                    self.sync.begin_stroke(self.current_item)
                 self.drawing = True
             elif self.current_tool in ['rectangle', 'circle', 'ellipse']:
                 self.start_pos = pos
                 self.drawing = True 
             
             elif self.current_tool == 'text':
-                text, ok = QInputDialog.getText(self.control_window, "Add Text", "Enter text:")
+                text, ok = self.ask(lambda: QInputDialog.getText(self.control_window, "Add Text", "Enter text:"),
+                                    ('', False))
                 if ok and text:
                     text_item = self.scene.addText(text, QFont('Arial', max(8, self.brush_size * 2)))
                     text_item.setDefaultTextColor(self.current_color)
                     text_item.setPos(pos)
-                    self.drawings.append(text_item)
-                    self.save_state()
+                    self.drawings.attach(text_item)
+                    self.save_state(AddCommand([text_item]))
             elif self.current_tool == 'eraser':
-                self.save_state()
+                self.erase_gesture = EraseGesture(self.drawings)
                 self.erase_at(pos)
                 self.drawing = True
 
     def mouseMoveEvent(self, event):
         if not self.overlay_active or not self.drawing:
             return
-        pos = self.view.mapToScene(event.position().toPoint())
+        self.input_coalescer.push(self.view.mapToScene(event.position().toPoint()))
+
+    def apply_move_samples(self, positions):
+        if not self.overlay_active or not self.drawing:
+            return
+        pos = positions[-1]
         pen = QPen(self.current_color, self.brush_size, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
         if self.current_tool == 'pen':
-            self.current_path.lineTo(pos)
-            self.current_item.setPath(self.current_path)
+            self.current_item.add_points(positions)
         elif self.current_tool in ['rectangle', 'circle', 'ellipse']:
+            rect = QRectF(self.start_pos, pos).normalized()
+            if self.current_tool == 'circle':
+                dx = pos.x() - self.start_pos.x()
+                dy = pos.y() - self.start_pos.y()
+                size = max(abs(dx), abs(dy))
+                end_x = self.start_pos.x() + size * (1 if dx >= 0 else -1)
+                end_y = self.start_pos.y() + size * (1 if dy >= 0 else -1)
+                rect = QRectF(self.start_pos, QPointF(end_x, end_y)).normalized()
             if self.current_item:
-                self.scene.removeItem(self.current_item)
-            if self.current_tool == 'rectangle':
-                rect = QRectF(self.start_pos, pos).normalized()
-                self.current_item = self.scene.addRect(rect, pen)
-            else:  # circle or ellipse
-                rect = QRectF(self.start_pos, pos).normalized()
-                if self.current_tool == 'circle':
-                    dx = pos.x() - self.start_pos.x()
-                    dy = pos.y() - self.start_pos.y()
-                    size = max(abs(dx), abs(dy))
-                    end_x = self.start_pos.x() + size * (1 if dx >= 0 else -1)
-                    end_y = self.start_pos.y() + size * (1 if dy >= 0 else -1)
-                    rect = QRectF(self.start_pos, QPointF(end_x, end_y)).normalized()
-                    self.current_item = self.scene.addEllipse(rect, pen)
-                elif self.current_tool == 'ellipse':
+                self.current_item.setRect(rect)
+            else:
+                if self.current_tool == 'rectangle':
+                    self.current_item = self.scene.addRect(rect, pen)
+                else:  # circle or ellipse
                     self.current_item = self.scene.addEllipse(rect, pen)
+                self.drawings.assign_id(self.current_item)
         elif self.current_tool == 'eraser':
-            self.erase_at(pos)
+            for p in positions:
+                self.erase_at(p)
 
     def mouseReleaseEvent(self, event):
         if not self.overlay_active:
             return
         if event.button() == Qt.MouseButton.LeftButton and self.drawing:
+            self.input_coalescer.flush()
             if self.current_tool in ['pen', 'rectangle', 'circle', 'ellipse']:
                 if self.current_item:
-                    self.drawings.append(self.current_item)
+                    if self.current_tool == 'pen':
+                        self.current_item.commit()
+                    self.drawings.attach(self.current_item)
+                    self.save_state(AddCommand([self.current_item]))
                     self.current_item = None
-                    self.save_state()
-            self.current_path = None
+            elif self.current_tool == 'eraser':
+                command = self.erase_gesture.finish()
+                if command:
+                    self.save_state(command)
+                self.erase_gesture = None
             self.start_pos = None
             self.drawing = False
 
     def erase_at(self, pos):
-        erase_rect = QRectF(pos.x() - self.brush_size, pos.y() - self.brush_size, self.brush_size * 2, self.brush_size * 2)
-        colliding = self.scene.items(erase_rect)
-        for item in colliding:
-            self.scene.removeItem(item)
-            if item in self.drawings:
-                self.drawings.remove(item)
-
-    def save_state(self):
-        self.undo_stack.append(self.drawings.copy())
-        self.redo_stack.clear()
+        # strokes lose only the ink under the eraser; other annotations go whole
+        self.erase_gesture.erase_at(pos, self.brush_size)
+
+    def save_state(self, command):
+        # Commands are recorded after they have been applied to the scene
+        with metrics.timing('history.push'):
+            self.history.push(command)
         self.update_undo_redo_buttons()
+        self.record_document_metrics()
 
     def undo(self):
-        if self.undo_stack:
-            current = self.drawings.copy()
-            self.redo_stack.append(current)
-            previous = self.undo_stack.pop()
-            for item in list(self.drawings):
-                if item not in previous:
-                    self.scene.removeItem(item)
-            for item in previous:
-                if item not in self.drawings:
-                    self.scene.addItem(item)
-            self.drawings = previous
+        if not self.drawing:
+            with metrics.timing('history.undo'):
+                self.history.undo()
             self.update_undo_redo_buttons()
+            self.record_document_metrics()
 
     def redo(self):
-        if self.redo_stack:
-            current = self.drawings.copy()
-            self.undo_stack.append(current)
-            previous = self.redo_stack.pop()
-            for item in list(self.drawings):
-                if item not in previous:
-                    self.scene.removeItem(item)
-            for item in previous:
-                if item not in self.drawings:
-                    self.scene.addItem(item)
-            self.drawings = previous
+        if not self.drawing:
+            with metrics.timing('history.redo'):
+                self.history.redo()
             self.update_undo_redo_buttons()
+            self.record_document_metrics()
 
     def update_undo_redo_buttons(self):
-        self.undo_btn.setEnabled(bool(self.undo_stack))
+        can_undo = self.history.can_undo()
+        can_redo = self.history.can_redo()
+        self.undo_btn.setEnabled(can_undo)
         self.undo_btn.setStyleSheet(
-            "background-color: #3498db; color: white; font: 8pt 'Segoe UI'; padding: 5px; border-radius: 5px;" if self.undo_stack
+            "background-color: #3498db; color: white; font: 8pt 'Segoe UI'; padding: 5px; border-radius: 5px;" if can_undo
             else "background-color: #95a5a6; color: white; font: 8pt 'Segoe UI'; padding: 5px; border-radius: 5px;")
-        self.redo_btn.setEnabled(bool(self.redo_stack))
+        self.redo_btn.setEnabled(can_redo)
         self.redo_btn.setStyleSheet(
-            "background-color: #3498db; color: white; font: 8pt 'Segoe UI'; padding: 5px; border-radius: 5px;" if self.redo_stack
+            "background-color: #3498db; color: white; font: 8pt 'Segoe UI'; padding: 5px; border-radius: 5px;" if can_redo
             else "background-color: #95a5a6; color: white; font: 8pt 'Segoe UI'; padding: 5px; border-radius: 5px;")
 
+    def record_document_metrics(self):
+        metrics.record('scene.items', len(self.drawings))
+        metrics.record('history.steps', self.history.depth()[0])
+        metrics.record('history.bytes', self.history.memory_bytes + self.history.spilled_bytes())
+
+    def toggle_hud(self):
+        if self.hud_timer.isActive():
+            self.hud_timer.stop()
+            for overlay in self.drawings.overlays.values():
+                overlay.view.set_hud([])
+        else:
+            self.hud_timer.start()
+            self.update_hud()
+
+    def update_hud(self):
+        lines = metrics.hud_lines()
+        for overlay in self.drawings.overlays.values():
+            overlay.view.set_hud(lines)
+
+    def toggle_profiling(self):
+        # Captures the live hot path of the GUI thread, no restart under a profiler needed
+        if self.profile_capture is None:
+            from annotator.profiling import DEFAULT_PROFILE_DIR, ProfileCapture
+            self.profile_capture = ProfileCapture(self.settings.profile_dir or DEFAULT_PROFILE_DIR,
+                                                  self.settings.profiler)
+        if not self.profile_capture.active:
+            self.profile_capture.start()
+            self.control_window.setWindowTitle(f"{self.window_title} (profiling)")
+            return
+        self.control_window.setWindowTitle(self.window_title)
+        try:
+            path = self.profile_capture.stop()
+        except OSError as e:
+            QMessageBox.warning(self.control_window, "Profile", f"Could not write the profile:\n{e}")
+            return
+        print(f"Profile written to {path}", file=sys.stderr)
+
+    def save_metrics(self):
+        path, _ = self.ask(lambda: QFileDialog.getSaveFileName(self.control_window, "Save Metrics",
+                                                               os.path.expanduser("~"), METRICS_FILTER), ('', ''))
+        if not path:
+            return
+        if not path.lower().endswith(('.json', '.csv')):
+            path += '.json'
+        context = {
+            'app': 'screen_annotation',
+            'qt': QT_VERSION_STR,
+            'screens': [{'name': overlay.screen.name(), 'geometry': list(overlay.rect.getRect()),
+                         'device_pixel_ratio': overlay.screen.devicePixelRatio(),
+                         'refresh_rate': overlay.screen.refreshRate()} for overlay in self.drawings.overlays.values()],
+            'settings': vars(self.settings),
+            'sync': self.sync.peer_stats() if self.sync is not None else None,
+        }
+        try:
+            metrics.write(path, context)
+        except OSError as e:
+            QMessageBox.warning(self.control_window, "Save Metrics", f"Could not save {path}:\n{e}")
+
     def clear_screen(self):
-        reply = QMessageBox.question(self.control_window, "Clear All", "Are you sure you want to clear all drawings?",
-                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
-        if reply == QMessageBox.StandardButton.Yes:
-            self.save_state()
-            for item in list(self.drawings):
-                self.scene.removeItem(item)
-            self.drawings.clear()
+        confirmed = self.ask(lambda: QMessageBox.question(
+            self.control_window, "Clear All", "Are you sure you want to clear all drawings?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes, False)
+        if confirmed:
+            self.clear_all()
+
+    def clear_all(self):
+        items = list(self.drawings)
+        for item in items:
+            self.drawings.detach(item)
+        if items:
+            self.save_state(ClearCommand(items))
+
+    def save_session(self):
+        from annotator.document import DOCUMENT_FILTER, DOCUMENT_SUFFIX, save_document
+        path, _ = self.ask(lambda: QFileDialog.getSaveFileName(self.control_window, "Save Annotations",
+                                                               os.path.expanduser("~"), DOCUMENT_FILTER), ('', ''))
+        if not path:
+            return
+        if not path.lower().endswith(DOCUMENT_SUFFIX):
+            path += DOCUMENT_SUFFIX
+        try:
+            save_document(path, self.drawings)
+        except OSError as e:
+            QMessageBox.warning(self.control_window, "Save Annotations", f"Could not save {path}:\n{e}")
+
+    def open_session(self):
+        if self.drawing:
+            return
+        from annotator.document import DOCUMENT_FILTER, DocumentError, load_document
+        path, _ = self.ask(lambda: QFileDialog.getOpenFileName(self.control_window, "Open Annotations",
+                                                               os.path.expanduser("~"), DOCUMENT_FILTER), ('', ''))
+        if not path:
+            return
+        try:
+            items = load_document(path, self.history.factory)
+        except (OSError, DocumentError) as e:
+            QMessageBox.warning(self.control_window, "Open Annotations", f"Could not open {path}:\n{e}")
+            return
+        # Opening replaces the current drawings as one undoable step
+        current = list(self.drawings)
+        for item in current:
+            self.drawings.detach(item)
+        for item in items:
+            self.drawings.attach(item)
+        if current or items:
+            self.save_state(ReplaceCommand(current, items))
 
     def key_press_event(self, event):
+        if self.recorder is not None:
+            self.recorder.key(event)
         if event.key() == Qt.Key.Key_F1:
             self.toggle_overlay()
         elif event.key() == Qt.Key.Key_F2:
             self.clear_screen()
+        elif event.key() == Qt.Key.Key_F3:
+            self.toggle_hud()
+        elif event.key() == Qt.Key.Key_F4:
+            self.save_metrics()
         elif event.key() == Qt.Key.Key_Escape:
             self.hide_overlay()
         elif event.key() == Qt.Key.Key_Z and event.modifiers() == Qt.KeyboardModifier.ControlModifier:
             self.undo()
         elif event.key() == Qt.Key.Key_Y and event.modifiers() == Qt.KeyboardModifier.ControlModifier:
             self.redo()
+        elif event.key() == Qt.Key.Key_S and event.modifiers() == Qt.KeyboardModifier.ControlModifier:
+            self.save_session()
+        elif event.key() == Qt.Key.Key_O and event.modifiers() == Qt.KeyboardModifier.ControlModifier:
+            self.open_session()
+        elif event.key() == Qt.Key.Key_P and event.modifiers() == (Qt.KeyboardModifier.ControlModifier |
+                                                                      Qt.KeyboardModifier.ShiftModifier):
+            self.toggle_profiling()
+
+    def run_command(self, command):
+        # Sent by a later launch, see annotator.instance; the command is already checked
+        if not self.started:
+            self.deferred_startup.run()
+        name, args = command[0], command[1:]
+        if name == 'activate':
+            self.control_window.showNormal()
+            self.control_window.raise_()
+            self.control_window.activateWindow()
+        elif name == 'toggle':
+            self.toggle_overlay()
+        elif name == 'show':
+            self.show_overlay()
+        elif name == 'hide':
+            self.hide_overlay()
+        elif name == 'tool':
+            if args[0] not in self.tool_buttons:
+                raise CommandError(f"unknown tool {args[0]!r}, expected one of {', '.join(self.tool_buttons)}")
+            self.select_tool(args[0])
+        elif name == 'clear':
+            # No confirmation: whoever sent it already decided
+            self.clear_all()
+        elif name == 'undo':
+            self.undo()
+        elif name == 'redo':
+            self.redo()
+        elif name == 'export':
+            self.start_export(args[0])
+        elif name == 'quit':
+            self.closeEvent(None)
+
+    def start_export(self, path):
+        # Rendered and encoded on a worker at native resolution, as in the advanced overlay
+        from annotator.export import ExportJob, snapshot_records
+        if self.export_job is not None:
+            raise CommandError("an export is already running")
+        scale = self.settings.export_scale or self.drawings.device_pixel_ratio()
+        self.export_job = ExportJob(snapshot_records(self.drawings), self.drawings.scene_rect(), path,
+                                    self.history.factory, scale)
+        self.export_job.signals.finished.connect(self.export_finished)
+        self.export_job.signals.failed.connect(self.export_failed)
+        QThreadPool.globalInstance().start(self.export_job)
+
+    def export_finished(self, path):
+        self.export_job = None
+
+    def export_failed(self, message):
+        self.export_job = None
+        print(f"Export failed: {message}", file=sys.stderr)
+
+    def replay_finished(self):
+        print(f"Replayed {len(self.replayer.events)} input events from {self.replayer.path}", file=sys.stderr)
+        # From here on the overlay takes live input and asks its own questions again
+        self.replayer = None
+        if self.settings.replay_exit:
+            self.closeEvent(None)
 
     def run(self):
         self.control_window.show()
         sys.exit(self.app.exec())
 
 if __name__ == "__main__":
-    app = ProfessionalScreenOverlay()
+    settings, qt_args = parse_settings(sys.argv)
+    app = ProfessionalScreenOverlay(settings, qt_args)
     app.run()
\ No newline at end of file
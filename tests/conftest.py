@@ -0,0 +1,12 @@
+import os
+
+# the tests build widgets and items without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import pytest
+from PyQt6.QtWidgets import QApplication
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    return QApplication.instance() or QApplication([])
@@ -0,0 +1,107 @@
+import math
+import zlib
+
+import pytest
+
+from annotator import delta
+from annotator.delta import DeltaError, decode_batch, encode_batch, pack_value, unpack_value
+
+VALUES = [
+    None, True, False, 0, 1, -1, 63, -64, 2 ** 40, -(2 ** 70), 0.5, -1.25, 0.1, 1e300, math.inf,
+    '', 'héllo ✓', b'', b'\x00\xff' * 10, (), [], (1, 'a', b'b'), [[1, [2, (3.5, None)]], ()],
+]
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_value_round_trip(value):
+    out = bytearray()
+    pack_value(value, out)
+    decoded, offset = unpack_value(bytes(out))
+    assert offset == len(out)
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_float32_only_when_exact():
+    out = bytearray()
+    pack_value(0.5, out)
+    assert out[0] == delta.FLOAT32
+    out = bytearray()
+    pack_value(0.1, out)
+    assert out[0] == delta.FLOAT64
+
+
+def test_nan_round_trip():
+    out = bytearray()
+    pack_value(math.nan, out)
+    assert math.isnan(unpack_value(bytes(out))[0])
+
+
+@pytest.mark.parametrize('entries', [
+    [],
+    [(0, 'add', [('stroke', 1, 0.0, 1.5, 2.5, (4278190335, 2.0, 1, 16, 64), (b'\x00' * 16, None))])],
+    # large enough to be deflated
+    [(i, 'move', [(i, 'x' * 40, i * 0.25)]) for i in range(50)],
+])
+def test_batch_round_trip(entries):
+    payload = encode_batch(entries)
+    assert decode_batch(payload) == entries
+
+
+def test_large_batch_is_deflated():
+    entries = [b'\x00' * delta.COMPRESS_MIN_BYTES]
+    payload = encode_batch(entries)
+    assert payload[0] == delta.DEFLATED
+    assert len(payload) < delta.COMPRESS_MIN_BYTES
+    assert encode_batch([1])[0] == delta.RAW
+
+
+def test_unsupported_type_is_not_encoded():
+    with pytest.raises(TypeError):
+        encode_batch([{'a': 1}])
+
+
+@pytest.mark.parametrize('entries', [
+    [(0, 'add', ['text', b'\x01\x02', 3.25, -7, None])],
+    [('x' * 300, b'y' * 300)],
+])
+def test_truncated_batch_raises_delta_error(entries):
+    payload = encode_batch(entries)
+    for size in range(len(payload)):
+        with pytest.raises(DeltaError):
+            decode_batch(payload[:size])
+
+
+@pytest.mark.parametrize('payload', [
+    bytes((7, 0)),
+    bytes((delta.DEFLATED,)) + b'not deflate',
+    bytes((delta.RAW, 1, 99)),
+    bytes((delta.RAW, 1, delta.STR, 2, 0xff, 0xfe)),
+    bytes((delta.RAW, 1, delta.LIST, 0xff, 0xff, 0xff, 0x7f)),
+])
+def test_damaged_batch_raises_delta_error(payload):
+    with pytest.raises(DeltaError):
+        decode_batch(payload)
+
+
+def test_nesting_limit():
+    value = []
+    for _ in range(delta.MAX_DEPTH - 1):
+        value = [value]
+    assert decode_batch(encode_batch([value])) == [value]
+    # one more level than allowed
+    too_deep = bytes((delta.RAW, 1)) + bytes((delta.LIST, 1)) * delta.MAX_DEPTH + bytes((delta.LIST, 0))
+    with pytest.raises(DeltaError):
+        decode_batch(too_deep)
+
+
+def test_inflated_size_limit(monkeypatch):
+    monkeypatch.setattr(delta, 'MAX_BATCH_BYTES', 1024)
+    body = bytearray()
+    delta._write_varint(body, 1)
+    pack_value(b'\x00' * 4096, body)
+    bomb = bytes((delta.DEFLATED,)) + zlib.compress(bytes(body))
+    with pytest.raises(DeltaError):
+        decode_batch(bomb)
+    small = encode_batch([b'\x00' * 512])
+    assert decode_batch(small) == [b'\x00' * 512]
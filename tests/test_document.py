@@ -0,0 +1,185 @@
+import numpy as np
+import pytest
+from PyQt6.QtCore import QLineF, QRectF, Qt
+from PyQt6.QtGui import QColor, QFont, QPen
+from PyQt6.QtWidgets import QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsRectItem, QGraphicsTextItem
+
+from annotator import document
+from annotator.codec import ItemFactory
+from annotator.document import DocumentError, load_document, save_document
+from annotator.strokes import StrokeItem
+
+
+class ArrowFactory(ItemFactory):
+    def line(self, line, pen, arrow):
+        item = super().line(line, pen, arrow)
+        item.arrow = arrow
+        return item
+
+
+def round_trip(tmp_path, *items):
+    for z, item in enumerate(items):
+        item.setZValue(z)
+    path = tmp_path / 'doc.sann'
+    save_document(path, items)
+    loaded = load_document(path, ArrowFactory())
+    assert len(loaded) == len(items)
+    return loaded
+
+
+def pen():
+    return QPen(QColor(10, 20, 30, 200), 3, Qt.PenStyle.DashLine, Qt.PenCapStyle.SquareCap,
+                Qt.PenJoinStyle.BevelJoin)
+
+
+def stroke(commit):
+    t = np.linspace(0, np.pi, 80)
+    item = StrokeItem(pen())
+    item.set_points(np.c_[t * 40, np.sin(t) * 40])
+    if commit:
+        item.commit()
+    item.setPos(5, -7)
+    return item
+
+
+@pytest.mark.parametrize('commit', [False, True])
+def test_stroke_round_trip(qapp, tmp_path, commit):
+    item = stroke(commit)
+    loaded, = round_trip(tmp_path, item)
+    assert isinstance(loaded, StrokeItem)
+    assert loaded.pen() == item.pen()
+    assert loaded.pos() == item.pos()
+    # points are stored in 1/16 px
+    np.testing.assert_allclose(loaded.points(), item.points(), atol=1 / 32)
+    if commit:
+        np.testing.assert_allclose(loaded.curves(), item.curves(), atol=1e-4)
+    else:
+        assert loaded.curves() is None
+
+
+@pytest.mark.parametrize('cls', [QGraphicsRectItem, QGraphicsEllipseItem])
+def test_rect_and_ellipse_round_trip(qapp, tmp_path, cls):
+    item = cls(QRectF(1.5, 2, 30, 40.25))
+    item.setPen(pen())
+    loaded, = round_trip(tmp_path, item)
+    assert type(loaded) is cls
+    assert loaded.rect() == item.rect()
+    assert loaded.pen() == item.pen()
+
+
+@pytest.mark.parametrize('arrow', [False, True])
+def test_line_round_trip(qapp, tmp_path, arrow):
+    item = QGraphicsLineItem(QLineF(1, 2, 300, 40))
+    item.setPen(pen())
+    item.arrow = arrow
+    loaded, = round_trip(tmp_path, item)
+    assert loaded.line() == item.line()
+    assert loaded.arrow is arrow
+
+
+def test_text_round_trip(qapp, tmp_path):
+    item = QGraphicsTextItem('héllo\nwörld ✓')
+    item.setFont(QFont('Sans', 14))
+    item.setDefaultTextColor(QColor('#80ff0000'))
+    item.setPos(12, 34)
+    loaded, = round_trip(tmp_path, item)
+    assert loaded.toPlainText() == item.toPlainText()
+    assert loaded.font().pointSize() == 14
+    assert loaded.defaultTextColor() == item.defaultTextColor()
+    assert loaded.pos() == item.pos()
+
+
+def test_mixed_document_keeps_stacking_order(qapp, tmp_path):
+    items = [QGraphicsRectItem(QRectF(0, 0, 1, 1)), stroke(True), QGraphicsTextItem('x'), stroke(False)]
+    loaded = round_trip(tmp_path, *items)
+    assert [type(item) for item in loaded] == [type(item) for item in items]
+
+
+@pytest.fixture
+def saved(qapp, tmp_path):
+    """Bytes and section directory of a document with one item of each kind."""
+    items = [stroke(True), QGraphicsTextItem('text'), QGraphicsRectItem(QRectF(1, 2, 3, 4)),
+             QGraphicsLineItem(QLineF(1, 2, 3, 4))]
+    for z, item in enumerate(items):
+        item.setZValue(z)
+    path = tmp_path / 'good.sann'
+    save_document(path, items)
+    data = path.read_bytes()
+    count = document.HEADER.unpack_from(data, 0)[2]
+    sections = {}
+    for i in range(count):
+        tag, offset, length = document.SECTION.unpack_from(data, document.HEADER.size + i * document.SECTION.size)
+        sections[tag] = (offset, length)
+    return data, sections
+
+
+def patch_item(saved, row, field, value):
+    data, sections = saved
+    data = bytearray(data)
+    offset, length = sections[b'ITEM']
+    table = np.frombuffer(data, dtype=document.ITEM_DTYPE, count=length // document.ITEM_DTYPE.itemsize,
+                          offset=offset).copy()
+    table[row][field] = value
+    data[offset:offset + table.nbytes] = table.tobytes()
+    return bytes(data)
+
+
+def patch_section(saved, tag, blob):
+    data, sections = saved
+    data = bytearray(data)
+    offset, length = sections[tag]
+    data[offset:offset + length] = blob.ljust(length)[:length]
+    return bytes(data)
+
+
+def assert_rejected(tmp_path, data):
+    path = tmp_path / 'bad.sann'
+    path.write_bytes(data)
+    with pytest.raises(DocumentError):
+        load_document(path, ItemFactory())
+
+
+@pytest.mark.parametrize('size', [0, 3, document.HEADER.size + 5, 100, -1])
+def test_truncated_document_is_rejected(tmp_path, saved, size):
+    data = saved[0]
+    assert_rejected(tmp_path, data[:size if size >= 0 else len(data) // 2])
+
+
+def test_wrong_magic_and_newer_version_are_rejected(tmp_path, saved):
+    data = saved[0]
+    assert_rejected(tmp_path, b'NOPE' + data[4:])
+    assert_rejected(tmp_path, document.HEADER.pack(document.MAGIC, document.VERSION + 1, 0))
+
+
+def test_unknown_kind_is_rejected(tmp_path, saved):
+    assert_rejected(tmp_path, patch_item(saved, 0, 'kind', 9))
+
+
+@pytest.mark.parametrize('row, field, value', [
+    (0, 'offset', 10 ** 9),
+    (0, 'count', 10 ** 9),
+    (0, 'curve_count', 10 ** 6),
+    (0, 'style', 99),
+    (1, 'style', 5),
+    (1, 'count', 99),
+    (2, 'offset', 50),
+    (3, 'offset', 2 ** 32 - 1),
+])
+def test_out_of_range_reference_is_rejected(tmp_path, saved, row, field, value):
+    assert_rejected(tmp_path, patch_item(saved, row, field, value))
+
+
+@pytest.mark.parametrize('tag, blob', [
+    (b'FONT', b'{not json'),
+    (b'FONT', b'[[1, 2]]'),
+    (b'TEXT', b'\xff\xfe\xfd'),
+])
+def test_damaged_section_is_rejected(tmp_path, saved, tag, blob):
+    assert_rejected(tmp_path, patch_section(saved, tag, blob))
+
+
+def test_unknown_pen_style_is_rejected(tmp_path, saved):
+    data, sections = saved
+    data = bytearray(data)
+    data[sections[b'PENS'][0] + document.PEN_DTYPE.fields['style'][1]] = 200
+    assert_rejected(tmp_path, bytes(data))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QPen
+from PyQt6.QtWidgets import QGraphicsScene
+
+from annotator.annotations import AnnotationRegistry
+from annotator.eraser import EraseGesture
+from annotator.history import RemoveCommand, ReplaceCommand
+from annotator.strokes import StrokeItem
+
+
+@pytest.fixture
+def registry(qapp):
+    return AnnotationRegistry(QGraphicsScene())
+
+
+def add_stroke(registry, points):
+    item = StrokeItem(QPen())
+    item.set_points(np.asarray(points, dtype=np.float64))
+    item.commit()
+    registry.attach(item)
+    return item
+
+
+def test_erase_gesture_cutting_a_stroke_replaces_it(registry):
+    stroke = add_stroke(registry, [[0, 0], [100, 0]])
+    gesture = EraseGesture(registry)
+    gesture.erase_at(QPointF(50, 0), 10)
+    command = gesture.finish()
+    assert isinstance(command, ReplaceCommand)
+    assert command.removed == [stroke]
+    assert len(command.added) == 2
+    assert stroke not in registry
+    assert all(piece in registry for piece in command.added)
+
+    command.undo(registry)
+    assert list(registry) == [stroke]
+
+
+def test_erase_gesture_erasing_everything_removes(registry):
+    stroke = add_stroke(registry, [[0, 0], [10, 0]])
+    gesture = EraseGesture(registry)
+    gesture.erase_at(QPointF(5, 0), 20)
+    command = gesture.finish()
+    assert isinstance(command, RemoveCommand)
+    assert command.items == [stroke]
+    assert len(registry) == 0
+
+
+def test_erase_gesture_pieces_erased_later_in_the_drag_are_not_recorded(registry):
+    stroke = add_stroke(registry, [[0, 0], [100, 0]])
+    gesture = EraseGesture(registry)
+    gesture.erase_at(QPointF(50, 0), 10)
+    gesture.erase_at(QPointF(20, 0), 25)
+    gesture.erase_at(QPointF(80, 0), 25)
+    command = gesture.finish()
+    assert isinstance(command, RemoveCommand)
+    assert command.items == [stroke]
+
+
+def test_erase_gesture_miss_returns_none(registry):
+    add_stroke(registry, [[0, 0], [100, 0]])
+    gesture = EraseGesture(registry)
+    gesture.erase_at(QPointF(50, 40), 10)
+    assert gesture.finish() is None
+    assert len(registry) == 1
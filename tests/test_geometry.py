@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from annotator.geometry import erase_polyline, fit_cubic_beziers, sample_cubic_beziers, segment_distances_sq
+from annotator.strokes import FIT_TOLERANCE
+
+
+def max_deviation(points, curves):
+    """Largest distance from a point to the polyline through densely sampled curves."""
+    ink = sample_cubic_beziers(curves, 0.1)
+    a, b = ink[:-1], ink[1:]
+    worst = 0.0
+    for p in points:
+        d = segment_distances_sq(np.broadcast_to(p, a.shape), a, b).min()
+        worst = max(worst, float(d))
+    return worst ** 0.5
+
+
+def smooth_strokes():
+    t = np.linspace(0, 2 * np.pi, 400)
+    yield 'sine', np.c_[t * 60, np.sin(t) * 80]
+    yield 'circle', np.c_[np.cos(t) * 120, np.sin(t) * 120]
+    s = np.linspace(0, 6 * np.pi, 900)
+    yield 'spiral', np.c_[np.cos(s) * s * 12, np.sin(s) * s * 12]
+    yield 'zigzag', np.array([[0, 0], [50, 40], [100, 0], [150, 40], [200, 0]], dtype=float)
+
+
+@pytest.mark.parametrize('name, points', list(smooth_strokes()))
+def test_fit_stays_within_tolerance_of_samples(name, points):
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE)
+    assert curves is not None and len(curves)
+    assert max_deviation(points, curves) <= FIT_TOLERANCE + 1e-3
+
+
+def test_fit_of_noisy_stroke_stays_within_tolerance():
+    rng = np.random.default_rng(1)
+    points = np.cumsum(rng.normal(0, 2, (500, 2)), axis=0)
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE)
+    assert max_deviation(points, curves) <= FIT_TOLERANCE + 1e-3
+
+
+def test_fit_curves_are_joined_end_to_end():
+    points = next(smooth_strokes())[1]
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE)
+    np.testing.assert_allclose(curves[0, 0], points[0])
+    np.testing.assert_allclose(curves[-1, 3], points[-1])
+    np.testing.assert_allclose(curves[1:, 0], curves[:-1, 3])
+
+
+@pytest.mark.parametrize('cap', [1, 3, 10])
+def test_fit_respects_max_segments(cap):
+    rng = np.random.default_rng(2)
+    points = np.cumsum(rng.normal(0, 3, (300, 2)), axis=0)
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE, max_segments=cap)
+    assert curves is None or len(curves) <= cap
+    assert fit_cubic_beziers(points, FIT_TOLERANCE, max_segments=1) is None
+
+
+def test_fit_within_max_segments_is_returned():
+    points = np.c_[np.linspace(0, 100, 50), np.zeros(50)]
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE, max_segments=1)
+    assert curves is not None and len(curves) == 1
+
+
+@pytest.mark.parametrize('points, expected', [
+    (np.empty((0, 2)), 0),
+    (np.array([[3.0, 4.0]]), 0),
+    (np.array([[3.0, 4.0]] * 5), 0),
+    (np.array([[0.0, 0.0], [10.0, 5.0]]), 1),
+    (np.array([[0.0, 0.0], [0.0, 0.0], [10.0, 5.0], [10.0, 5.0]]), 1),
+])
+def test_fit_degenerate_input(points, expected):
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE)
+    assert curves.shape == (expected, 4, 2)
+    assert np.isfinite(curves).all()
+
+
+def test_fit_with_repeated_points_inside_stroke():
+    t = np.linspace(0, np.pi, 60)
+    points = np.repeat(np.c_[t * 40, np.sin(t) * 40], 3, axis=0)
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE)
+    assert np.isfinite(curves).all()
+    assert max_deviation(points, curves) <= FIT_TOLERANCE + 1e-3
+
+
+def test_sample_cubic_beziers_spacing_and_ends():
+    points = next(smooth_strokes())[1]
+    curves = fit_cubic_beziers(points, FIT_TOLERANCE)
+    ink = sample_cubic_beziers(curves, 1.0)
+    np.testing.assert_allclose(ink[0], curves[0, 0])
+    np.testing.assert_allclose(ink[-1], curves[-1, 3])
+    gaps = np.hypot(*np.diff(ink, axis=0).T)
+    # samples are even in t, not in arc length
+    assert gaps.mean() <= 1.0 and gaps.max() <= 1.5
+
+
+def test_sample_cubic_beziers_empty_and_point_curves():
+    assert sample_cubic_beziers(np.empty((0, 4, 2)), 1.0).shape == (0, 2)
+    point = np.zeros((1, 4, 2))
+    ink = sample_cubic_beziers(point, 1.0)
+    assert ink.shape == (2, 2) and not ink.any()
+
+
+LINE = np.array([[0.0, 0.0], [50.0, 0.0], [100.0, 0.0]])
+
+
+def test_erase_polyline_middle_cut_leaves_two_pieces():
+    pieces = erase_polyline(LINE, (50.0, 0.0), 10.0)
+    assert len(pieces) == 2
+    np.testing.assert_allclose(pieces[0], [[0, 0], [40, 0]])
+    np.testing.assert_allclose(pieces[1], [[60, 0], [100, 0]])
+
+
+@pytest.mark.parametrize('center, kept', [((0.0, 0.0), [[10, 0], [50, 0], [100, 0]]),
+                                          ((100.0, 0.0), [[0, 0], [50, 0], [90, 0]])])
+def test_erase_polyline_end_leaves_one_piece(center, kept):
+    pieces = erase_polyline(LINE, center, 10.0)
+    assert len(pieces) == 1
+    np.testing.assert_allclose(pieces[0], kept)
+
+
+def test_erase_polyline_full_cover_leaves_nothing():
+    assert erase_polyline(LINE, (50.0, 0.0), 60.0) == []
+    assert erase_polyline(LINE[:1], (0.0, 1.0), 2.0) == []
+
+
+def test_erase_polyline_miss_returns_none():
+    assert erase_polyline(LINE, (50.0, 20.0), 10.0) is None
+    assert erase_polyline(LINE[:1], (0.0, 5.0), 2.0) is None
+
+
+def test_erase_polyline_cuts_long_segment_only_under_disc():
+    pieces = erase_polyline(LINE[::2], (30.0, 5.0), 13.0)
+    np.testing.assert_allclose(pieces[0], [[0, 0], [18, 0]])
+    np.testing.assert_allclose(pieces[1], [[42, 0], [100, 0]])
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+from PyQt6.QtCore import QRectF
+from PyQt6.QtGui import QPen
+from PyQt6.QtWidgets import QGraphicsRectItem, QGraphicsScene
+
+from annotator import journal
+from annotator.annotations import AnnotationRegistry
+from annotator.codec import ItemFactory
+from annotator.export import snapshot_records
+from annotator.history import AddCommand, MoveCommand, RemoveCommand, UndoHistory, capture_geometry
+
+
+class Session:
+    """A registry and history whose steps are logged to a journal in directory."""
+    def __init__(self, directory, compact_every=journal.COMPACT_EVERY):
+        self.registry = AnnotationRegistry(QGraphicsScene())
+        self.history = UndoHistory(self.registry, factory=ItemFactory())
+        self.journal = journal.Journal(self.registry, str(directory), compact_every=compact_every)
+        self.journal.start()
+        self.history.listeners.append(self.journal)
+
+    def add(self, x):
+        item = QGraphicsRectItem(QRectF(x, 0, 10, 10))
+        item.setPen(QPen())
+        self.registry.attach(item)
+        self.history.push(AddCommand([item]))
+        return item
+
+    def move(self, item, x, y):
+        before = capture_geometry(item)
+        item.setPos(x, y)
+        self.history.push(MoveCommand([(item, before, capture_geometry(item))]))
+
+    def remove(self, item):
+        self.registry.detach(item)
+        self.history.push(RemoveCommand([item]))
+
+    def crash(self):
+        """Stop the writer the way a crash would leave the files, with everything written."""
+        self.journal.close(discard_files=False)
+        assert self.journal.error is None
+
+
+def recovered(directory):
+    registry = AnnotationRegistry(QGraphicsScene())
+    journal.recover(registry, ItemFactory(), str(directory))
+    return snapshot_records(registry)
+
+
+def log_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith(journal.LOG_PREFIX))
+
+
+def test_recover_replays_log(qapp, tmp_path):
+    session = Session(tmp_path)
+    a = session.add(0)
+    session.add(20)
+    session.move(a, 5, 5)
+    session.crash()
+    assert journal.has_session(str(tmp_path))
+    assert recovered(tmp_path) == snapshot_records(session.registry)
+
+
+def test_recover_stops_at_torn_final_frame(qapp, tmp_path):
+    session = Session(tmp_path)
+    a = session.add(0)
+    session.add(20)
+    expected = snapshot_records(session.registry)
+    session.move(a, 5, 5)
+    session.crash()
+    log, = log_files(tmp_path)
+    path = tmp_path / log
+    data = path.read_bytes()
+    # the process died part way through writing the last record
+    path.write_bytes(data[:-3])
+    assert recovered(tmp_path) == expected
+
+
+def test_recover_ignores_corrupt_final_frame(qapp, tmp_path):
+    session = Session(tmp_path)
+    session.add(0)
+    expected = snapshot_records(session.registry)
+    session.add(20)
+    session.crash()
+    log, = log_files(tmp_path)
+    path = tmp_path / log
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xff
+    path.write_bytes(bytes(data))
+    assert recovered(tmp_path) == expected
+
+
+@pytest.mark.parametrize('steps', [2, 3, 4, 7])
+def test_recover_across_compaction(qapp, tmp_path, steps):
+    session = Session(tmp_path, compact_every=3)
+    items = [session.add(10 * i) for i in range(steps)]
+    session.move(items[0], 1, 2)
+    session.remove(items[-1])
+    session.crash()
+    # older logs are dropped once a snapshot covers them
+    assert len(log_files(tmp_path)) <= 1
+    assert recovered(tmp_path) == snapshot_records(session.registry)
+
+
+def test_undo_and_redo_entries_replay_to_same_records(qapp, tmp_path):
+    session = Session(tmp_path, compact_every=4)
+    a = session.add(0)
+    b = session.add(20)
+    session.move(a, 5, 5)
+    session.remove(b)
+    session.history.undo()
+    session.history.undo()
+    session.history.redo()
+    session.add(40)
+    session.history.undo()
+    session.crash()
+    assert recovered(tmp_path) == snapshot_records(session.registry)
+
+
+def test_writer_mirror_matches_registry_after_undo_and_redo(qapp, tmp_path):
+    session = Session(tmp_path)
+    a = session.add(0)
+    session.move(a, 3, 4)
+    session.add(20)
+    session.history.undo()
+    session.history.undo()
+    session.history.redo()
+    # the snapshot is built from the records the writer keeps, not from the registry
+    session.journal.compact()
+    session.crash()
+    assert log_files(tmp_path) == []
+    _, records = journal._read_snapshot(str(tmp_path))
+    assert sorted(records) == sorted(snapshot_records(session.registry))
+
+
+def test_clean_close_leaves_no_session(qapp, tmp_path):
+    session = Session(tmp_path)
+    session.add(0)
+    session.journal.close()
+    assert not journal.has_session(str(tmp_path))
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from annotator.profiling import ProfileCapture
+
+
+@pytest.mark.parametrize('profiler', ['sample', 'cprofile'])
+def test_captures_never_share_a_file(tmp_path, profiler):
+    capture = ProfileCapture(str(tmp_path), profiler)
+    paths = []
+    for _ in range(3):
+        capture.start()
+        # every capture starts in the same millisecond
+        capture._started = 1700000000.25
+        paths.append(capture.stop())
+    assert len(set(paths)) == 3
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths)
+
+
+def test_stop_without_start(tmp_path):
+    assert ProfileCapture(str(tmp_path)).stop() is None
+    assert os.listdir(tmp_path) == []
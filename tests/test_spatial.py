@@ -0,0 +1,54 @@
+import numpy as np
+from PyQt6.QtCore import QPointF, QRectF
+from PyQt6.QtGui import QPen
+from PyQt6.QtWidgets import QGraphicsRectItem
+
+from annotator.spatial import SpatialIndex
+from annotator.strokes import StrokeItem
+
+
+def bulging_stroke():
+    """A stroke whose points lie on y = 0 but whose fitted curve reaches y = 150."""
+    item = StrokeItem(QPen())
+    item.set_points(np.array([[0.0, 0.0], [256.0, 0.0]]))
+    item.set_curves(np.array([[[0.0, 0.0], [64.0, 200.0], [192.0, 200.0], [256.0, 0.0]]]))
+    return item
+
+
+def test_curve_outside_polyline_cells_is_found(qapp):
+    index = SpatialIndex(cell_size=64)
+    index.insert(1, bulging_stroke())
+    # the curve's apex, two rows below every cell the polyline crosses
+    assert index.query(QRectF(127, 149, 2, 2))
+    assert not index.query(QRectF(0, 300, 10, 10))
+
+
+def test_polyline_stroke_is_entered_along_its_segments(qapp):
+    index = SpatialIndex(cell_size=64)
+    item = StrokeItem(QPen())
+    item.set_points(np.linspace(0, 640, 41)[:, None].repeat(2, axis=1))
+    index.insert(1, item)
+    assert index.query(QRectF(320, 320, 1, 1))
+    # far from the diagonal, though inside its bounding rect
+    assert not index.query(QRectF(600, 10, 1, 1))
+
+
+def test_moved_item_is_reindexed(qapp):
+    index = SpatialIndex(cell_size=64)
+    item = bulging_stroke()
+    index.insert(1, item)
+    item.setPos(QPointF(1000, 0))
+    index.update(1, item)
+    assert not index.query(QRectF(127, 149, 2, 2))
+    assert index.query(QRectF(1127, 149, 2, 2))
+
+
+def test_remove_and_other_items(qapp):
+    index = SpatialIndex(cell_size=64)
+    index.insert(1, bulging_stroke())
+    index.insert(2, QGraphicsRectItem(QRectF(500, 500, 10, 10)))
+    assert len(index) == 2 and 2 in index
+    assert [type(item) for item in index.query(QRectF(505, 505, 1, 1))] == [QGraphicsRectItem]
+    index.remove(1)
+    assert 1 not in index
+    assert not index.query(QRectF(127, 149, 2, 2))
@@ -0,0 +1,181 @@
+import time
+
+import pytest
+from PyQt6.QtCore import QCoreApplication, QEventLoop, QPointF, QRectF
+from PyQt6.QtGui import QGuiApplication, QPen
+from PyQt6.QtWidgets import QGraphicsRectItem, QGraphicsView
+
+from annotator.codec import ItemFactory
+from annotator.export import snapshot_records
+from annotator.history import AddCommand, UndoHistory
+from annotator.relay import Relay
+from annotator.screens import ScreenDocument, ScreenOverlay
+from annotator.strokes import StrokeItem
+from annotator.sync import SyncClient
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        QCoreApplication.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 20)
+
+
+class Peer:
+    """An overlay's document, history and sync client, without the windows being shown."""
+    def __init__(self, name):
+        self.document = ScreenDocument(lambda screen: ScreenOverlay(screen, QGraphicsView()))
+        self.overlay = self.document.add_screen(QGuiApplication.primaryScreen())
+        self.history = UndoHistory(self.document, factory=ItemFactory())
+        self.client = SyncClient(self.document, ItemFactory(), name)
+        self.history.listeners.append(self.client)
+        self.joined = False
+        self.client.joined.connect(lambda: setattr(self, 'joined', True))
+
+    def join(self, address):
+        self.client.connect_to(*address)
+        wait_for(lambda: self.joined)
+
+    def add_rect(self, x):
+        item = QGraphicsRectItem(QRectF(x, 10, 20, 30))
+        item.setPen(QPen())
+        self.document.attach(item)
+        self.history.push(AddCommand([item]))
+        return item
+
+    def records(self):
+        return snapshot_records(self.document)
+
+
+@pytest.fixture
+def relay(qapp):
+    relay = Relay('127.0.0.1', 0)
+    address = relay.start()
+    yield relay, address
+    relay.stop()
+
+
+def test_late_joiner_gets_logged_ops(relay):
+    relay, address = relay
+    a = Peer('a')
+    a.join(address)
+    a.add_rect(0)
+    a.add_rect(50)
+    a.history.undo()
+    a.history.redo()
+    a.add_rect(100)
+    wait_for(lambda: relay.log)
+    b = Peer('b')
+    b.join(address)
+    assert b.records() == a.records()
+    assert len(b.document) == 3
+    assert b.client.peers.keys() == {a.client.peer}
+    wait_for(lambda: b.client.peer in a.client.peers)
+
+    # and changes after joining go both ways
+    item = b.add_rect(200)
+    wait_for(lambda: len(a.document) == 4)
+    assert a.document.get(item.data(0)) is not None
+    assert a.records() == b.records()
+
+
+def test_steps_taken_while_joining_are_sent(relay):
+    relay, address = relay
+    a = Peer('a')
+    a.join(address)
+    b = Peer('b')
+    b.client.connect_to(*address)
+    b.add_rect(0)
+    wait_for(lambda: b.joined)
+    wait_for(lambda: len(a.document) == 1)
+    assert a.records() == b.records()
+
+
+def test_live_stroke_preview(relay):
+    relay, address = relay
+    a, b = Peer('a'), Peer('b')
+    a.join(address)
+    b.join(address)
+    wait_for(lambda: b.client.peer in a.client.peers)
+
+    stroke = StrokeItem(QPen(), QPointF(10, 10))
+    stroke.add_point(QPointF(20, 15))
+    a.document.assign_id(stroke)
+    a.overlay.scene.addItem(stroke)
+    a.client.begin_stroke(stroke)
+    wait_for(lambda: b.client._previews)
+    (sender, key), preview = next(iter(b.client._previews.items()))
+    assert (sender, key) == (a.client.peer, stroke.data(0))
+    assert preview.scene() is b.overlay.scene
+    assert preview.point_count() == 2
+
+    stroke.add_point(QPointF(30, 25))
+    stroke.add_point(QPointF(40, 20))
+    wait_for(lambda: preview.point_count() == 4)
+    assert preview.points().tolist() == stroke.points().tolist()
+
+    # committing the stroke swaps the preview for the real item
+    stroke.commit()
+    a.overlay.scene.removeItem(stroke)
+    a.document.attach(stroke)
+    a.history.push(AddCommand([stroke]))
+    wait_for(lambda: b.document.get(stroke.data(0)) is not None)
+    wait_for(lambda: not b.client._previews)
+    assert preview.scene() is None
+    assert b.records() == a.records()
+
+
+def test_leaving_peer_is_cleaned_up(relay):
+    relay, address = relay
+    a, b = Peer('a'), Peer('b')
+    a.join(address)
+    b.join(address)
+    wait_for(lambda: b.client.peer in a.client.peers)
+
+    stroke = StrokeItem(QPen(), QPointF(0, 0))
+    stroke.add_point(QPointF(5, 5))
+    a.document.assign_id(stroke)
+    a.overlay.scene.addItem(stroke)
+    a.client.begin_stroke(stroke)
+    wait_for(lambda: b.client._previews)
+    preview = next(iter(b.client._previews.values()))
+
+    peer = a.client.peer
+    a.client.close()
+    wait_for(lambda: peer not in b.client.peers)
+    assert not b.client._previews
+    assert preview.scene() is None
+    wait_for(lambda: len(relay.peers) == 1)
+
+
+def test_unreachable_relay_fails(relay):
+    relay, (host, port) = relay
+    relay.stop()
+    peer = Peer('a')
+    failures = []
+    peer.client.failed.connect(failures.append)
+    peer.client.connect_to(host, port)
+    wait_for(lambda: failures)
+    assert not peer.client.connected
+    peer.add_rect(0)
+    assert peer.client._ops == []
+
+
+def test_relay_log_is_capped(qapp):
+    relay = Relay('127.0.0.1', 0, max_log_bytes=1)
+    address = relay.start()
+    try:
+        a = Peer('a')
+        a.join(address)
+        a.add_rect(0)
+        wait_for(lambda: relay.log)
+        a.add_rect(50)
+        wait_for(lambda: relay.dropped)
+        assert len(relay.log) == 1
+        b = Peer('b')
+        b.join(address)
+        # only the newest change is still logged
+        assert len(b.document) == 1
+    finally:
+        relay.stop()